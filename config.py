@@ -14,6 +14,7 @@ OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 
 FREE_TIER_MAX_FILE_SIZE_MB = int(os.getenv("FREE_TIER_MAX_FILE_SIZE_MB", 1024))
 FREE_TIER_DEFAULT_EXPIRY_HOURS = int(os.getenv("FREE_TIER_DEFAULT_EXPIRY_HOURS", 87600))
+FREE_DEFAULT_EXPIRY_MIN = FREE_TIER_DEFAULT_EXPIRY_HOURS * 60
 FREE_SELF_DESTRUCT_OPTIONS = [1, 5, 10, 30, 60, 120, 360, 720, 1440] # Mins: 1m, 5m, 10m, 30m, 1h, 2h, 6h, 12h, 1d
 FREE_TIER_MAX_EXPIRY_DAYS = int(os.getenv("FREE_TIER_MAX_EXPIRY_DAYS", 784759689777))
 PREMIUM_TIER_MAX_FILE_SIZE_MB = int(os.getenv("PREMIUM_TIER_MAX_FILE_SIZE_MB", 2048))
@@ -26,6 +27,8 @@ TEMP_DOWNLOAD_DIR = os.path.join(os.getcwd(), "temp_downloads")
 os.makedirs(TEMP_DOWNLOAD_DIR, exist_ok=True)
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Route dnspython lookups (mongodb+srv) through 8.8.8.8 instead of the system resolver
+FORCE_PUBLIC_DNS = os.getenv("FORCE_PUBLIC_DNS", "").lower() in ("1", "true", "yes")
 
 DEFAULT_USER_SETTINGS = {
     "notify_on_view": True,
@@ -37,6 +40,15 @@ MY_SECRETS_PAGE_LIMIT = 5
 MAX_CONCURRENT_SHARES_FREE = int(os.getenv("MAX_CONCURRENT_SHARES_FREE", 500))
 MAX_CONCURRENT_SHARES_PREMIUM = int(os.getenv("MAX_CONCURRENT_SHARES_PREMIUM", 4000))
 
+# Keep-alive ping (e.g. Render free tier), run by the bot's scheduler when PING_URL is set
+PING_URL = os.getenv("PING_URL", "")
+PING_INTERVAL = int(os.getenv("PING_INTERVAL", 20))
+
+# Concurrency knobs. Updates are bound by the Telegram/Mongo round trip, not CPU, so values beyond ~2x cores
+# rarely help; the Mongo pool only needs to cover the workers plus background jobs.
+WORKERS = int(os.getenv("WORKERS", min(32, (os.cpu_count() or 1) * 2 + 4)))
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", 20))
+
 INLINE_QUERY_CACHE_TIME = int(os.getenv("INLINE_QUERY_CACHE_TIME", 300)) # Cache time for inline query results
 
 SUDO_USERS = [int(user_id.strip()) for user_id in os.getenv("SUDO_USERS", "").split(',') if user_id.strip().isdigit()]
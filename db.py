@@ -3,13 +3,9 @@ from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timezone, timedelta
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
-from pymongo import MongoClient, TEXT, DESCENDING, ASCENDING
+from pymongo import MongoClient, TEXT, DESCENDING, ASCENDING, WriteConcern, UpdateOne
 from pymongo.errors import OperationFailure
 
-import dns.resolver
-dns.resolver.default_resolver=dns.resolver.Resolver(configure=False)
-dns.resolver.default_resolver.nameservers=['8.8.8.8']
-
 import config
 
 LOGGER = logging.getLogger(__name__)
@@ -30,26 +26,34 @@ async def init_db():
     global motor_client, database, pymongo_client
     global users_collection, shares_collection, admin_settings_collection
 
-    LOGGER.info(f"Connecting to MongoDB: {config.MONGO_URI}")
+    LOGGER.info("Connecting to MongoDB: %s", config.MONGO_URI)
     try:
-        motor_client = AsyncIOMotorClient(config.MONGO_URI)
+        motor_client = AsyncIOMotorClient(
+            config.MONGO_URI, maxPoolSize=config.MONGO_POOL_SIZE, minPoolSize=2, maxIdleTimeMS=30000
+        )
         await motor_client.admin.command("ping")
         db_name_from_uri = config.MONGO_URI.split("/")[-1].split("?")[0]
         if not db_name_from_uri or db_name_from_uri == "admin": # Default if no db name in URI
              db_name_from_uri = "SecretShareBotDB" # Fallback DB name
-             LOGGER.warning(f"No specific database name in MONGO_URI, using default: {db_name_from_uri}")
+             LOGGER.warning("No specific database name in MONGO_URI, using default: %s", db_name_from_uri)
         database = motor_client[db_name_from_uri]
-        LOGGER.info(f"Async MongoDB connection successful to database: '{db_name_from_uri}'")
+        LOGGER.info("Async MongoDB connection successful to database: '%s'", db_name_from_uri)
     except Exception as e:
-        LOGGER.error(f"Async MongoDB connection failed: {e}")
+        LOGGER.error("Async MongoDB connection failed: %s", e)
         raise
 
     try:
-        pymongo_client = MongoClient(config.MONGO_URI)
+        # The process's only sync client; it serves APScheduler's MongoDBJobStore (see get_sync_mongo_client).
+        # Job store calls come from the loop thread and the small default executor, so a small pool that stays
+        # warm is enough; the timeouts make a stalled server fail a scheduling call quickly instead of blocking.
+        pymongo_client = MongoClient(
+            config.MONGO_URI, maxPoolSize=10, minPoolSize=1, maxIdleTimeMS=300_000,
+            waitQueueTimeoutMS=2000, socketTimeoutMS=5000, serverSelectionTimeoutMS=5000, retryWrites=True
+        )
         pymongo_client.admin.command("ping")
         LOGGER.info("Sync PyMongo connection successful for APScheduler JobStore.")
     except Exception as e:
-        LOGGER.warning(f"Sync PyMongo connection failed: {e}. APScheduler may use MemoryJobStore.")
+        LOGGER.warning("Sync PyMongo connection failed: %s. APScheduler may use MemoryJobStore.", e)
         pymongo_client = None # Ensure it's None if connection failed
 
     users_collection = database[USERS_COLLECTION_NAME]
@@ -68,30 +72,37 @@ async def _ensure_indexes():
         await users_collection.create_index("is_premium")
         # Add index for settings if specific settings are queried frequently across users
         # await users_collection.create_index("settings.notify_on_view")
-        LOGGER.info(f"Indexes ensured for '{USERS_COLLECTION_NAME}'.")
+        LOGGER.info("Indexes ensured for '%s'.", USERS_COLLECTION_NAME)
     except OperationFailure as e:
-        LOGGER.error(f"Error creating indexes for '{USERS_COLLECTION_NAME}': {e}")
+        LOGGER.error("Error creating indexes for '%s': %s", USERS_COLLECTION_NAME, e)
 
     # Shares Collection Indexes
     try:
         await shares_collection.create_index("share_uuid", unique=True)
         await shares_collection.create_index("access_token", unique=True, sparse=True)
+        await shares_collection.create_index([("access_token", ASCENDING), ("status", ASCENDING)]) # View path: token + status='active'
+        await shares_collection.create_index([("sender_id", ASCENDING), ("status", ASCENDING)]) # count_user_active_shares
         await shares_collection.create_index([("sender_id", DESCENDING), ("created_at", DESCENDING)])
         await shares_collection.create_index("recipient_id", sparse=True)
         await shares_collection.create_index("status")
         await shares_collection.create_index("expires_at", sparse=True) # Sparse if not all shares have expiry
+        await shares_collection.create_index([("status", ASCENDING), ("expires_at", ASCENDING)]) # Expiry sweep range scan
         # For inline query content matching if storing text directly for search (example)
         # await shares_collection.create_index([("inline_search_text", TEXT)], default_language='english', sparse=True)
-        LOGGER.info(f"Indexes ensured for '{SHARES_COLLECTION_NAME}'.")
+        LOGGER.info("Indexes ensured for '%s'.", SHARES_COLLECTION_NAME)
     except OperationFailure as e:
-        LOGGER.error(f"Error creating indexes for '{SHARES_COLLECTION_NAME}': {e}")
+        LOGGER.error("Error creating indexes for '%s': %s", SHARES_COLLECTION_NAME, e)
 
     # Admin Settings Collection Indexes
     try:
         await admin_settings_collection.create_index("setting_key", unique=True)
-        LOGGER.info(f"Indexes ensured for '{ADMIN_SETTINGS_COLLECTION_NAME}'.")
+        LOGGER.info("Indexes ensured for '%s'.", ADMIN_SETTINGS_COLLECTION_NAME)
     except OperationFailure as e:
-        LOGGER.error(f"Error creating indexes for '{ADMIN_SETTINGS_COLLECTION_NAME}': {e}")
+        LOGGER.error("Error creating indexes for '%s': %s", ADMIN_SETTINGS_COLLECTION_NAME, e)
+
+def get_sync_mongo_client() -> Optional[MongoClient]:
+    """The shared sync PyMongo client (set by init_db); None before init or if it couldn't connect."""
+    return pymongo_client
 
 async def close_db():
     global motor_client, pymongo_client
@@ -102,8 +113,7 @@ async def close_db():
         pymongo_client.close()
         LOGGER.info("Sync PyMongo connection closed.")
 
-async def add_user(user_id: int, first_name: Optional[str] = "User", username: Optional[str] = None) -> Dict[str, Any]:
-    now = datetime.now(timezone.utc)
+def build_new_user_doc(user_id: int, now: datetime) -> Dict[str, Any]:
     user_doc = {
         "user_id": user_id,
         #"first_name": first_name,
@@ -122,6 +132,11 @@ async def add_user(user_id: int, first_name: Optional[str] = "User", username: O
     if user_doc["is_sudo"]: # Sudos get premium by default (can be configurable)
         user_doc["role"] = "sudo" # Sudo is a higher role than premium
         user_doc["is_premium"] = True
+    return user_doc
+
+async def add_user(user_id: int, first_name: Optional[str] = "User", username: Optional[str] = None) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    user_doc = build_new_user_doc(user_id, now)
 
     update_result = await users_collection.update_one(
         {"user_id": user_id},
@@ -132,10 +147,10 @@ async def add_user(user_id: int, first_name: Optional[str] = "User", username: O
         upsert=True
     )
     if update_result.upserted_id:
-        LOGGER.info(f"New user added: {user_id} ('{first_name}'), Role: {user_doc['role']}.")
+        LOGGER.info("New user added: %s ('%s'), Role: %s.", user_id, first_name, user_doc['role'])
         return user_doc
     else: # User existed
-        LOGGER.debug(f"User {user_id} ('{first_name}') last_active updated.")
+        LOGGER.debug("User %s ('%s') last_active updated.", user_id, first_name)
         # Ensure settings field exists and merge defaults
         existing_user = await users_collection.find_one({"user_id": user_id})
         if existing_user and "settings" not in existing_user:
@@ -158,6 +173,17 @@ async def add_user(user_id: int, first_name: Optional[str] = "User", username: O
         return await get_user(user_id) # Re-fetch to get current complete doc
 
 
+async def add_users_bulk(users: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> int:
+    """Upserts many (new user doc, fields to $set) pairs in one unordered bulk write; returns how many were new."""
+    if not users:
+        return 0
+    result = await users_collection.bulk_write([
+        UpdateOne({"user_id": user_doc["user_id"]}, {"$set": set_fields, "$setOnInsert": user_doc}, upsert=True)
+        for user_doc, set_fields in users
+    ], ordered=False)
+    return result.upserted_count
+
+
 async def get_user(user_id: int) -> Optional[Dict[str, Any]]:
     if users_collection is None:
         LOGGER.error("users_collection is not initialized.")
@@ -183,7 +209,7 @@ async def get_user(user_id: int) -> Optional[Dict[str, Any]]:
             if premium_expiry.tzinfo is None:
                 premium_expiry = premium_expiry.replace(tzinfo=timezone.utc)
             if datetime.now(timezone.utc) > premium_expiry:
-                LOGGER.info(f"Premium expired for user {user_id}. Reverting to free.")
+                LOGGER.info("Premium expired for user %s. Reverting to free.", user_id)
                 updates = {"is_premium": False, "premium_expiry": None}
                 if user_data["role"] == "premium": updates["role"] = "free" # Only if role was 'premium'
                 await users_collection.update_one({"user_id": user_id}, {"$set": updates})
@@ -223,7 +249,7 @@ async def get_user_setting(user_id: int, setting_key: str) -> Optional[Any]:
 
 async def update_user_setting(user_id: int, setting_key: str, setting_value: Any) -> bool:
     if setting_key not in config.DEFAULT_USER_SETTINGS:
-        LOGGER.warning(f"Attempt to update non-default setting '{setting_key}' for user {user_id}.")
+        LOGGER.warning("Attempt to update non-default setting '%s' for user %s.", setting_key, user_id)
         return False
 
     result = await users_collection.update_one(
@@ -242,13 +268,15 @@ async def increment_user_shares_count(user_id: int, amount: int = 1):
     await users_collection.update_one({"user_id": user_id}, {"$inc": {"shares_count": amount}})
 
 # --- Share related DB functions ---
-async def create_share(share_doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+async def create_share(share_doc: Dict[str, Any], write_concern: Optional[WriteConcern] = None) -> Optional[Dict[str, Any]]:
+    # write_concern lets callers with an already-durable side effect (e.g. a sent Telegram message) skip journal waits
+    collection = shares_collection.with_options(write_concern=write_concern) if write_concern else shares_collection
     try:
-        result = await shares_collection.insert_one(share_doc)
+        result = await collection.insert_one(share_doc)
         await increment_user_shares_count(share_doc["sender_id"])
         return await get_share_by_uuid(share_doc["share_uuid"]) # Return the inserted doc with _id
     except Exception as e:
-        LOGGER.error(f"Failed to create share in DB for UUID {share_doc.get('share_uuid')}: {e}")
+        LOGGER.error("Failed to create share in DB for UUID %s: %s", share_doc.get('share_uuid'), e)
         return None
 
 async def get_share_by_uuid(share_uuid: str, sender_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
@@ -263,6 +291,23 @@ async def update_share(share_uuid: str, updates: Dict[str, Any]) -> bool:
     result = await shares_collection.update_one({"share_uuid": share_uuid}, {"$set": updates})
     return result.modified_count > 0
 
+async def update_shares_bulk(updates: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """Applies many (share_uuid, fields to $set) pairs in one unordered bulk write; returns how many changed."""
+    if not updates:
+        return 0
+    result = await shares_collection.bulk_write([
+        UpdateOne({"share_uuid": share_uuid}, {"$set": fields}) for share_uuid, fields in updates
+    ], ordered=False)
+    return result.modified_count
+
+async def expire_due_link_shares(now: datetime) -> int:
+    """Expires every still-active link share whose expires_at has passed; one indexed update per sweep."""
+    result = await shares_collection.update_many(
+        {"status": "active", "expires_at": {"$lte": now}, "recipient_type": "link"},
+        {"$set": {"status": "expired", "expired_at": now}}
+    )
+    return result.modified_count
+
 async def get_user_shares(user_id: int, page: int = 0, limit: int = config.MY_SECRETS_PAGE_LIMIT,
                            status_filter: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], int]:
     query = {"sender_id": user_id}
@@ -286,8 +331,8 @@ async def delete_share_by_uuid(share_uuid: str) -> bool:
 
 # For inline query feature (simplified for now)
 async def save_inline_share_content(sender_id: int, text_content: str, share_uuid: str,
-                                     access_token: str, original_chat_id: int, original_message_id: int,
-                                     is_protected:bool, show_forward_tag:bool) -> bool:
+                                     access_token: str, original_chat_id: Optional[int], original_message_id: Optional[int],
+                                     is_protected:bool, show_forward_tag:bool, notify_on_view: bool = True) -> bool:
     now = datetime.now(timezone.utc)
     share_doc = {
         "share_uuid": share_uuid,
@@ -299,21 +344,32 @@ async def save_inline_share_content(sender_id: int, text_content: str, share_uui
         "original_message_id": original_message_id, # ID of the message in bot's chat with itself
         "is_protected_content": is_protected,
         "show_forward_tag": show_forward_tag, # For inline, this often means use copy_message on retrieval.
+        "sender_notify_on_view": notify_on_view, # Denormalized so views don't read the sender's settings
         "status": "active", # Inline shares are active immediately
         "recipient_type": "link", # Inline shares are always link based initially
         "created_at": now,
-        "expires_at": now + timedelta(hours=config.FREE_TIER_DEFAULT_EXPIRY_HOURS), # Default expiry for inline
+        "expires_at": now + timedelta(minutes=config.FREE_DEFAULT_EXPIRY_MIN), # Default expiry for inline
         "self_destruct_after_view": True,
-        "self_destruct_minutes_set": config.FREE_TIER_DEFAULT_EXPIRY_HOURS * 60,
+        "self_destruct_minutes_set": config.FREE_DEFAULT_EXPIRY_MIN,
         "view_count": 0,
         "max_views": 1, # Inline typically 1 view
     }
+    if original_message_id is None: # Text-only inline share: delivered from content_text, no carrier message
+        del share_doc["original_chat_id"], share_doc["original_message_id"]
     result = await shares_collection.insert_one(share_doc)
     if result.inserted_id:
         await increment_user_shares_count(sender_id)
         return True
     return False
 
+async def set_sender_notify_on_active_shares(sender_id: int, notify_on_view: bool) -> int:
+    # Keeps the denormalized copy on live shares in step with the sender's setting
+    result = await shares_collection.update_many(
+        {"sender_id": sender_id, "status": "active"},
+        {"$set": {"sender_notify_on_view": notify_on_view}}
+    )
+    return result.modified_count
+
 async def get_inline_share_content(access_token: str) -> Optional[Dict[str, Any]]:
     share = await shares_collection.find_one({"access_token": access_token, "share_type": "message_inline", "status":"active"})
     return share
@@ -337,20 +393,20 @@ if __name__ == '__main__':
                 assert u is not None
                 assert u['user_id'] == test_user_id
                 assert u['settings']['notify_on_view'] == config.DEFAULT_USER_SETTINGS['notify_on_view']
-            LOGGER.info(f"User Data: {u}")
+            LOGGER.info("User Data: %s", u)
 
             # Test settings
             await update_user_setting(test_user_id, "notify_on_view", False)
             setting_val = await get_user_setting(test_user_id, "notify_on_view")
             assert setting_val is False
-            LOGGER.info(f"User setting 'notify_on_view' updated and retrieved: {setting_val}")
+            LOGGER.info("User setting 'notify_on_view' updated and retrieved: %s", setting_val)
             await update_user_setting(test_user_id, "notify_on_view", True) # Reset
 
             # Test update_user_details
             await update_user_details(test_user_id, {"role": "premium", "is_premium": True, "premium_expiry": datetime.now(timezone.utc) + timedelta(days=30)})
             u = await get_user(test_user_id)
             assert u['role'] == "premium" and u['is_premium'] is True
-            LOGGER.info(f"User updated to premium: {u}")
+            LOGGER.info("User updated to premium: %s", u)
 
             # Test share creation
             share_uuid_test = "test-share-" + str(datetime.now().timestamp())
@@ -362,23 +418,23 @@ if __name__ == '__main__':
             }
             created_share = await create_share(share_doc_test)
             assert created_share and created_share['share_uuid'] == share_uuid_test
-            LOGGER.info(f"Share created: {created_share}")
+            LOGGER.info("Share created: %s", created_share)
 
             fetched_share = await get_share_by_uuid(share_uuid_test, sender_id=test_user_id)
             assert fetched_share and fetched_share['share_uuid'] == share_uuid_test
-            LOGGER.info(f"Share fetched by UUID: {fetched_share}")
+            LOGGER.info("Share fetched by UUID: %s", fetched_share)
 
             await update_share(share_uuid_test, {"status": "viewed", "viewed_at": datetime.now(timezone.utc)})
             updated_share = await get_share_by_uuid(share_uuid_test)
             assert updated_share and updated_share['status'] == "viewed"
-            LOGGER.info(f"Share status updated to viewed: {updated_share}")
+            LOGGER.info("Share status updated to viewed: %s", updated_share)
 
             user_shares, total = await get_user_shares(test_user_id, status_filter=["active", "viewed"])
-            LOGGER.info(f"User shares (total {total}): {user_shares}")
+            LOGGER.info("User shares (total %s): %s", total, user_shares)
             assert any(s['share_uuid'] == share_uuid_test for s in user_shares)
 
             u_after_share = await get_user(test_user_id)
-            LOGGER.info(f"User shares count: {u_after_share.get('shares_count')}")
+            LOGGER.info("User shares count: %s", u_after_share.get('shares_count'))
             assert u_after_share.get('shares_count', 0) > 0
 
 
@@ -387,14 +443,14 @@ if __name__ == '__main__':
                  test_sudo_id = config.SUDO_USERS[0] # Test with first sudo user from config if any
                  sudo_user = await add_user(test_sudo_id, "Sudo Test", "sudotest")
                  retrieved_sudo_user = await get_user(test_sudo_id)
-                 LOGGER.info(f"Sudo user from config: {retrieved_sudo_user}")
+                 LOGGER.info("Sudo user from config: %s", retrieved_sudo_user)
                  assert retrieved_sudo_user['is_sudo'] is True
                  assert retrieved_sudo_user['role'] == 'sudo'
                  assert retrieved_sudo_user['is_premium'] is True # Sudos are premium
 
 
         except Exception as e:
-            LOGGER.exception(f"An error occurred during DB testing: {e}")
+            LOGGER.exception("An error occurred during DB testing: %s", e)
         finally:
             await close_db()
             LOGGER.info("DB connection closed after testing.")
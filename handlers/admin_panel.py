@@ -19,9 +19,9 @@ from utils.keyboards import (
     ADMIN_GRANT_PREMIUM_PREFIX, ADMIN_REVOKE_PREMIUM_PREFIX,
     ADMIN_BAN_USER_PREFIX, ADMIN_UNBAN_USER_PREFIX, MAIN_MENU_CALLBACK
 )
-from utils.decorators import check_user_status, sudo_users_only, owner_only
+from utils.decorators import owner_only, fast_auth, cached_get_user
 from utils.user_states import UserState, set_user_state, get_user_state, clear_user_state
-from handlers.start_help import send_main_menu # For navigation
+from handlers.start_help import send_main_menu, get_user_menu_flags # For navigation
 
 LOGGER = logging.getLogger(__name__)
 BROADCAST_ASK_TIMEOUT = 600 # 10 minutes for broadcast message
@@ -33,7 +33,7 @@ async def display_user_management_panel(client: Client, admin_message: Message,
     except PeerIdInvalid:
         await admin_message.reply_text(f"Cannot fetch live Telegram profile for User ID {target_user_id_int}. User may not exist or bot can't see them. Showing DB data only.")
     except Exception as e:
-        LOGGER.warning(f"Error fetching pyrogram user {target_user_id_int} for admin panel: {e}")
+        LOGGER.warning("Error fetching pyrogram user %s for admin panel: %s", target_user_id_int, e)
 
     target_user_db = await get_user(target_user_id_int)
     if not target_user_db: # If user is not in DB at all yet
@@ -87,22 +87,20 @@ async def display_user_management_panel(client: Client, admin_message: Message,
 
 
 @Client.on_callback_query(filters.regex(f"^{ADMIN_PANEL_CALLBACK}$"))
-@check_user_status
-@sudo_users_only # Decorator from utils.decorators checks if user is in config.SUDO_USERS
+@fast_auth("sudo") # check_user_status + sudo_users_only, without a DB read for config.SUDO_USERS
 async def admin_panel_entry_handler(client: Client, cb: CallbackQuery):
     user_id = cb.from_user.id
-    LOGGER.info(f"Admin panel accessed by Sudo User {user_id}")
+    LOGGER.info("Admin panel accessed by Sudo User %s", user_id)
     keyboard = create_admin_panel_keyboard()
     try:
         await cb.edit_message_text("👑 **Admin Panel**\n\nSelect an action:", reply_markup=keyboard)
         await cb.answer()
     except Exception as e:
-        LOGGER.error(f"Error displaying admin panel for {user_id}: {e}")
+        LOGGER.error("Error displaying admin panel for %s: %s", user_id, e)
         await cb.answer("Error loading admin panel.", show_alert=True)
 
 @Client.on_callback_query(filters.regex(f"^{ADMIN_USERS_CALLBACK}$"))
-@check_user_status
-@sudo_users_only
+@fast_auth("sudo")
 async def admin_manage_users_prompt_handler(client: Client, cb: CallbackQuery):
     admin_user_id = cb.from_user.id
     # clear_user_state(admin_user_id) # Not strictly needed before an ask, but can ensure clean slate if there were other states
@@ -188,7 +186,7 @@ async def admin_manage_users_prompt_handler(client: Client, cb: CallbackQuery):
         keyboard = create_admin_panel_keyboard()
         await client.send_message(admin_user_id, "👑 **Admin Panel**", reply_markup=keyboard)
     except Exception as e:
-        LOGGER.error(f"Error in admin 'Manage Users' (ask flow) for admin {admin_user_id}: {e}")
+        LOGGER.error("Error in admin 'Manage Users' (ask flow) for admin %s: %s", admin_user_id, e)
         await client.send_message(admin_user_id, "An unexpected error occurred during user management setup. Please try again.")
         keyboard = create_admin_panel_keyboard()
         await client.send_message(admin_user_id, "👑 **Admin Panel**", reply_markup=keyboard)
@@ -276,8 +274,7 @@ async def admin_receive_user_to_manage_handler(client: Client, message: Message)
 @Client.on_callback_query(
     filters.regex(f"^({ADMIN_PROMOTE_SUDO_PREFIX}|{ADMIN_DEMOTE_SUDO_PREFIX}|{ADMIN_GRANT_PREMIUM_PREFIX}|{ADMIN_REVOKE_PREMIUM_PREFIX}|{ADMIN_BAN_USER_PREFIX}|{ADMIN_UNBAN_USER_PREFIX})")
 )
-@check_user_status # Admin performing action must be valid
-@sudo_users_only # Admin must be sudo to perform these actions
+@fast_auth("sudo") # Admin must be valid and sudo; config-listed sudos skip the DB read
 async def admin_user_action_handler(client: Client, cb: CallbackQuery):
     admin_user_id = cb.from_user.id
     action_prefix = cb.data.split(":")[0] + ":" # e.g., "admin_p_sudo:"
@@ -337,7 +334,9 @@ async def admin_user_action_handler(client: Client, cb: CallbackQuery):
             action_taken_message = "DB update failed."
             success = False # Revert success flag
         else:
-            LOGGER.info(f"Admin {admin_user_id} changed {target_user_id}: {action_prefix} -> {updates}")
+            get_user_menu_flags.invalidate(target_user_id) # Their main menu keyboard may change
+            cached_get_user.invalidate(target_user_id) # Role/ban state is read by the access decorators
+            LOGGER.info("Admin %s changed %s: %s -> %s", admin_user_id, target_user_id, action_prefix, updates)
 
     await cb.answer(action_taken_message, show_alert=True)
 
@@ -358,8 +357,7 @@ async def admin_user_action_handler(client: Client, cb: CallbackQuery):
 
 # NEW Combined Handler using client.ask:
 @Client.on_callback_query(filters.regex(f"^{ADMIN_BROADCAST_CALLBACK}$"))
-@check_user_status
-@sudo_users_only
+@fast_auth("sudo")
 async def admin_broadcast_handler(client: Client, cb: CallbackQuery): # Renamed for clarity
     admin_user_id = cb.from_user.id
     # clear_user_state(admin_user_id) # Not strictly necessary before ask for this simple case
@@ -434,7 +432,7 @@ async def admin_broadcast_handler(client: Client, cb: CallbackQuery): # Renamed
         keyboard = create_admin_panel_keyboard()
         await client.send_message(admin_user_id, "👑 **Admin Panel**", reply_markup=keyboard)
     except Exception as e:
-        LOGGER.error(f"Error in admin broadcast (ask content flow) for {admin_user_id}: {e}")
+        LOGGER.error("Error in admin broadcast (ask content flow) for %s: %s", admin_user_id, e)
         await client.send_message(admin_user_id, "An unexpected error occurred. Broadcast cancelled.")
         keyboard = create_admin_panel_keyboard()
         await client.send_message(admin_user_id, "👑 **Admin Panel**", reply_markup=keyboard)
@@ -444,8 +442,7 @@ async def admin_broadcast_handler(client: Client, cb: CallbackQuery): # Renamed
 
 # New handler for the confirmation callback from above
 @Client.on_callback_query(filters.regex("^admin_bcast_exec:"))
-@check_user_status
-@sudo_users_only
+@fast_auth("sudo")
 async def admin_broadcast_execute_handler(client: Client, cb: CallbackQuery):
     admin_user_id = cb.from_user.id
     action = cb.data.split(":")[1] # yes or no
@@ -497,10 +494,10 @@ async def admin_broadcast_execute_handler(client: Client, cb: CallbackQuery):
                 message_id=broadcast_msg_id      # The message admin sent as content
             )
             sent_count += 1
-        except UserIsBlocked: failed_count += 1; LOGGER.warning(f"Broadcast: User {target_uid} blocked bot.")
-        except PeerIdInvalid: failed_count += 1; LOGGER.warning(f"Broadcast: User {target_uid} ID invalid.")
+        except UserIsBlocked: failed_count += 1; LOGGER.warning("Broadcast: User %s blocked bot.", target_uid)
+        except PeerIdInvalid: failed_count += 1; LOGGER.warning("Broadcast: User %s ID invalid.", target_uid)
         except FloodWait as e_flood:
-            LOGGER.warning(f"Broadcast FloodWait: sleeping for {e_flood.value}s.")
+            LOGGER.warning("Broadcast FloodWait: sleeping for %ss.", e_flood.value)
             try:
                 await progress_update_msg.edit_text(
                     f"Hit FloodWait. Pausing for {e_flood.value}s...\n"
@@ -512,9 +509,9 @@ async def admin_broadcast_execute_handler(client: Client, cb: CallbackQuery):
                 await client.copy_message(target_uid, broadcast_chat_id, broadcast_msg_id)
                 sent_count += 1
             except Exception as e_retry:
-                failed_count += 1; LOGGER.error(f"Broadcast retry failed for {target_uid} after FloodWait: {e_retry}")
+                failed_count += 1; LOGGER.error("Broadcast retry failed for %s after FloodWait: %s", target_uid, e_retry)
         except Exception as e_send_err:
-            failed_count += 1; LOGGER.error(f"Broadcast error for user {target_uid}: {e_send_err}")
+            failed_count += 1; LOGGER.error("Broadcast error for user %s: %s", target_uid, e_send_err)
         
         # Update progress message periodically
         current_time = datetime.now(timezone.utc)
@@ -525,7 +522,7 @@ async def admin_broadcast_execute_handler(client: Client, cb: CallbackQuery):
                 )
                 last_update_time = current_time
             except FloodWait as e_edit_flood: await asyncio.sleep(e_edit_flood.value + 1) # Sleep if edit is flooded
-            except Exception as e_edit_prog: LOGGER.warning(f"Failed to edit broadcast progress: {e_edit_prog}")
+            except Exception as e_edit_prog: LOGGER.warning("Failed to edit broadcast progress: %s", e_edit_prog)
         
         await asyncio.sleep(0.05) # 50ms delay between sends to be gentle (Telegram allows 30msg/sec to different users)
 
@@ -538,7 +535,7 @@ async def admin_broadcast_execute_handler(client: Client, cb: CallbackQuery):
     try: await progress_update_msg.edit_text(final_summary_text)
     except: await client.send_message(admin_user_id, final_summary_text) # Send as new if edit fails
 
-    LOGGER.info(f"Broadcast by admin {admin_user_id} finished. Sent: {sent_count}, Failed: {failed_count}.")
+    LOGGER.info("Broadcast by admin %s finished. Sent: %s, Failed: %s.", admin_user_id, sent_count, failed_count)
     await client.send_message(admin_user_id, "Return to Admin Panel:", reply_markup=create_admin_panel_keyboard())
 
 
@@ -660,8 +657,7 @@ async def admin_broadcast_execute_handler(client: Client, cb: CallbackQuery):
 
 
 @Client.on_callback_query(filters.regex(f"^{ADMIN_STATS_CALLBACK}$"))
-@check_user_status
-@sudo_users_only
+@fast_auth("sudo")
 async def admin_stats_handler(client: Client, cb: CallbackQuery):
     total_users = await users_collection.count_documents({})
     banned = await users_collection.count_documents({"banned": True})
@@ -1,6 +1,8 @@
 # handlers/inline_query_handler.py
+import asyncio
 import logging
-import uuid
+import secrets
+from typing import Optional
 
 from pyrogram import Client, filters
 from pyrogram.types import (
@@ -10,8 +12,10 @@ from pyrogram.types import (
 from pyrogram.errors import QueryIdInvalid, MessageNotModified # MessageNotModified might not be common here
 
 import config
-from db import save_inline_share_content, get_user_setting # get_user_setting for default protections
+from db import save_inline_share_content, delete_share_by_uuid
 from utils.decorators import check_user_status # Ensure user is in DB, not banned
+from utils.background import run_in_background
+from utils.user_writer import get_user_or_pending
 
 LOGGER = logging.getLogger(__name__)
 
@@ -29,69 +33,19 @@ async def secret_text_inline_handler(client: Client, inline_query: InlineQuery):
         except QueryIdInvalid: pass # User cleared query too fast
         return
 
-    LOGGER.info(f"User {user_id} inline query for secret text: '{query_text[:50]}...'")
-
-    # --- Store the secret temporarily ---
-    # The bot sends the message to itself ("me") to get a persistent message_id.
-    # This message can then be copied/forwarded when the recipient views the secret.
-    try:
-        temp_bot_message = await client.send_message(user_id, text=query_text)
-    except Exception as e:
-        LOGGER.error(f"Failed to send temporary message to self for inline query from {user_id}: {e}")
-        try:
-            await inline_query.answer(
-                results=[
-                    InlineQueryResultArticle(
-                        id=str(uuid.uuid4()), # Needs a unique ID
-                        title="⚠️ Bot not Started by You. Please Start Bot First.",
-                        description=f"Please try again or Start our Bot First. https://t.me/{config.BOT_USERNAME}?start",
-                        input_message_content=InputTextMessageContent(f"Please start our Bot First then Try. Start Here: https://t.me/{config.BOT_USERNAME}?start")
-                    )
-                ],
-                cache_time=5 # Short cache for errors
-            )
-        except QueryIdInvalid: pass # User might have changed query
-        except Exception as e_ans: LOGGER.error(f"Error answering inline query with error message: {e_ans}")
-        return
+    LOGGER.info("User %s inline query for secret text: '%.50s...'", user_id, query_text)
 
     # --- Prepare share document for DB ---
-    share_uuid = str(uuid.uuid4())
-    access_token = str(uuid.uuid4()) # Unique token for this inline share view link
-
-    # Fetch user's default sharing preferences
-    default_show_tag = await get_user_setting(user_id, "default_show_forward_tag")
-    default_protect_content = await get_user_setting(user_id, "default_protected_content")
-
-    save_success = await save_inline_share_content(
-        sender_id=user_id,
-        text_content=query_text, # Storing the raw text
-        share_uuid=share_uuid,
-        access_token=access_token,
-        original_chat_id=temp_bot_message.chat.id, # Chat ID of "me"
-        original_message_id=temp_bot_message.id,   # Message ID in "me"
-        is_protected=default_protect_content, # Apply user's default
-        show_forward_tag=default_show_tag     # Apply user's default
+    share_uuid = secrets.token_hex(16) # Only an identifier (and the result id): no need for UUID formatting
+    access_token = secrets.token_urlsafe(16) # Unique 128-bit token for this inline share view link
+
+    # Persist in the background: Telegram invalidates the query if it isn't answered within a few seconds,
+    # so the answer goes out right away. If the save fails the link simply reports "invalid" when opened.
+    save_task = run_in_background(
+        _persist_inline_share(user_id, query_text, share_uuid, access_token, getattr(inline_query, "user_db", None)),
+        name=f"inline_save:{share_uuid}"
     )
 
-    if not save_success:
-        LOGGER.error(f"Failed to save inline share content to DB for user {user_id}, share_uuid {share_uuid}.")
-        await temp_bot_message.delete() # Clean up the message sent to "me"
-        try:
-            await inline_query.answer(
-                results=[
-                    InlineQueryResultArticle(
-                        id=str(uuid.uuid4()),
-                        title="⚠️ Database Error",
-                        description="Could not save your secret. Please try later.",
-                        input_message_content=InputTextMessageContent("Failed to save inline secret due to a database issue.")
-                    )
-                ],
-                cache_time=5
-            )
-        except QueryIdInvalid: pass
-        except Exception as e_ans: LOGGER.error(f"Error answering inline query with DB error message: {e_ans}")
-        return
-
     # --- Construct Inline Query Result ---
     #bot_username = client.me.username
     view_secret_url = f"https://t.me/{config.BOT_USERNAME}?start=viewsecret_{access_token}"
@@ -125,22 +79,47 @@ async def secret_text_inline_handler(client: Client, inline_query: InlineQuery):
             # switch_pm_text="Configure Defaults?", # Optional: To guide user to bot PM
             # switch_pm_parameter="settings_inline" # Parameter for /start in PM
         )
-        LOGGER.info(f"Responded to inline query from {user_id} with share_uuid {share_uuid}.")
-        # The temp_bot_message sent to "me" will be deleted when the secret is viewed and "destructed",
-        # or if the share expires. For inline shares, this content reference is crucial.
-        # No immediate deletion here.
+        LOGGER.info("Responded to inline query from %s with share_uuid %s.", user_id, share_uuid)
     except QueryIdInvalid:
-        LOGGER.warning(f"Query ID became invalid for user {user_id} while answering inline query. Share {share_uuid} created but result not sent.")
-        # The share is in DB. If QueryIdInvalid, the user might have cleared text.
-        # We should ideally also delete the temp_bot_message and the DB entry if result sending fails.
-        # This part needs more robust cleanup if `answer` fails.
-        await temp_bot_message.delete()
-        from db import delete_share_by_uuid # Import for cleanup
-        await delete_share_by_uuid(share_uuid) # Attempt to clean up DB entry
-        LOGGER.info(f"Cleaned up share {share_uuid} and temp message due to QueryIdInvalid.")
+        LOGGER.warning("Query ID became invalid for user %s while answering inline query. Share %s created but result not sent.", user_id, share_uuid)
+        # If QueryIdInvalid, the user might have cleared text. Drop the share once its save has landed.
+        await _discard_inline_share(save_task, share_uuid)
+        LOGGER.info("Cleaned up share %s due to QueryIdInvalid.", share_uuid)
     except Exception as e:
-        LOGGER.error(f"Unexpected error answering inline query for user {user_id}: {e}")
-        await temp_bot_message.delete()
-        from db import delete_share_by_uuid
-        await delete_share_by_uuid(share_uuid)
-        LOGGER.info(f"Cleaned up share {share_uuid} and temp message due to unexpected error answering query.")
+        LOGGER.error("Unexpected error answering inline query for user %s: %s", user_id, e)
+        await _discard_inline_share(save_task, share_uuid)
+        LOGGER.info("Cleaned up share %s due to unexpected error answering query.", share_uuid)
+
+
+async def _persist_inline_share(user_id: int, query_text: str, share_uuid: str, access_token: str,
+                                user_data: Optional[dict] = None) -> bool:
+    # check_user_status already loaded the user; only read it again if it couldn't attach it to the update
+    if user_data is None:
+        user_data = await get_user_or_pending(user_id)
+    user_settings = user_data.get("settings", {}) if user_data else {}
+    default_show_tag = user_settings.get("default_show_forward_tag", config.DEFAULT_USER_SETTINGS["default_show_forward_tag"])
+    default_protect_content = user_settings.get("default_protected_content", config.DEFAULT_USER_SETTINGS["default_protected_content"])
+
+    save_success = await save_inline_share_content(
+        sender_id=user_id,
+        text_content=query_text, # The raw text is the secret; it is sent as a fresh message on view
+        share_uuid=share_uuid,
+        access_token=access_token,
+        original_chat_id=None, # No carrier message: nothing is sent to the user's chat per keystroke
+        original_message_id=None,
+        is_protected=default_protect_content, # Apply user's default
+        show_forward_tag=default_show_tag,    # Apply user's default
+        notify_on_view=user_settings.get("notify_on_view", config.DEFAULT_USER_SETTINGS["notify_on_view"])
+    )
+    if not save_success:
+        LOGGER.error("Failed to save inline share content to DB for user %s, share_uuid %s.", user_id, share_uuid)
+    return save_success
+
+
+async def _discard_inline_share(save_task: asyncio.Task, share_uuid: str):
+    try:
+        saved = await save_task
+    except Exception: # Already logged by the background task callback
+        return
+    if saved:
+        await delete_share_by_uuid(share_uuid) # Attempt to clean up DB entry
@@ -13,7 +13,7 @@ from utils.keyboards import (
     MY_SECRETS_ACTION_PREFIX, MAIN_MENU_CALLBACK
 )
 from utils.decorators import check_user_status
-from utils.scheduler import cancel_scheduled_job # General job cancellation
+from utils.scheduler import cancel_scheduled_job, JOB_ID_PREFIX_DELETE_MESSAGE # General job cancellation
 
 LOGGER = logging.getLogger(__name__)
 
@@ -27,7 +27,7 @@ NO_SECRETS_TEXT = "🗂️ **My Shared Secrets**\n\nYou haven't shared any secre
 
 
 async def display_my_secrets_list(client: Client, cb: CallbackQuery, user_id: int, page: int = 0):
-    LOGGER.info(f"User {user_id} viewing 'My Shared Secrets', page {page}.")
+    LOGGER.info("User %s viewing 'My Shared Secrets', page %s.", user_id, page)
     # Fetch shares that are "active" or "viewed" for management purposes
     # Expired/destructed/revoked are final states and might not need listing here unless desired.
     shares, total_shares_count = await get_user_shares(
@@ -51,7 +51,7 @@ async def display_my_secrets_list(client: Client, cb: CallbackQuery, user_id: in
     except MessageNotModified:
         await cb.answer("You are already on this page.")
     except Exception as e:
-        LOGGER.error(f"Error displaying 'My Shared Secrets' list for {user_id} (page {page}): {e}")
+        LOGGER.error("Error displaying 'My Shared Secrets' list for %s (page %s): %s", user_id, page, e)
         await cb.answer("Error loading your shared secrets.", show_alert=True)
 
 @Client.on_callback_query(filters.regex(f"^{MY_SECRETS_CALLBACK}$")) # Matches "main:my_secrets"
@@ -66,7 +66,7 @@ async def my_secrets_nav_handler(client: Client, cb: CallbackQuery):
     try:
         page = int(cb.data.split(":")[-1]) # e.g., mysec_nav:page:1 -> 1
     except (IndexError, ValueError):
-        LOGGER.error(f"Invalid page number in callback: {cb.data} for user {user_id}")
+        LOGGER.error("Invalid page number in callback: %s for user %s", cb.data, user_id)
         await cb.answer("Error: Invalid page.", show_alert=True)
         return
     await display_my_secrets_list(client, cb, user_id, page=page)
@@ -78,7 +78,7 @@ async def my_secret_detail_handler(client: Client, cb: CallbackQuery):
     try:
         share_uuid = cb.data.split(MY_SECRETS_DETAIL_PREFIX, 1)[1]
     except IndexError:
-        LOGGER.error(f"Invalid share_uuid in detail callback: {cb.data} for user {user_id}")
+        LOGGER.error("Invalid share_uuid in detail callback: %s for user %s", cb.data, user_id)
         await cb.answer("Error: Invalid secret identifier.", show_alert=True)
         return
 
@@ -89,7 +89,7 @@ async def my_secret_detail_handler(client: Client, cb: CallbackQuery):
         await display_my_secrets_list(client, cb, user_id, page=0) # Go back to list
         return
 
-    LOGGER.info(f"User {user_id} viewing detail for share_uuid: {share_uuid}")
+    LOGGER.info("User %s viewing detail for share_uuid: %s", user_id, share_uuid)
 
     text = "📜 **Secret Details**\n\n"
     text += f"**UUID:** `{share['share_uuid']}`\n"
@@ -146,7 +146,7 @@ async def my_secret_detail_handler(client: Client, cb: CallbackQuery):
     except MessageNotModified:
         await cb.answer() # No alert if not modified is fine
     except Exception as e:
-        LOGGER.error(f"Error displaying secret detail {share_uuid} for {user_id}: {e}")
+        LOGGER.error("Error displaying secret detail %s for %s: %s", share_uuid, user_id, e)
         await cb.answer("Error loading details.", show_alert=True)
 
 @Client.on_callback_query(filters.regex(f"^{MY_SECRETS_ACTION_PREFIX}revoke:"))
@@ -159,7 +159,7 @@ async def my_secret_action_handler(client: Client, cb: CallbackQuery):
         action_type = parts[1]
         share_uuid = parts[2]
     except IndexError:
-        LOGGER.error(f"Invalid 'My Secrets' action callback: {cb.data} for user {user_id}")
+        LOGGER.error("Invalid 'My Secrets' action callback: %s for user %s", cb.data, user_id)
         await cb.answer("Error: Invalid action.", show_alert=True)
         return
 
@@ -168,7 +168,7 @@ async def my_secret_action_handler(client: Client, cb: CallbackQuery):
         await cb.answer("Secret not found or action not permitted.", show_alert=True)
         return
 
-    LOGGER.info(f"User {user_id} performing '{action_type}' on share {share_uuid}")
+    LOGGER.info("User %s performing '%s' on share %s", user_id, action_type, share_uuid)
 
     if action_type == "revoke":
         if share.get("status") not in ["active", "viewed"]:
@@ -187,14 +187,10 @@ async def my_secret_action_handler(client: Client, cb: CallbackQuery):
             job_id_to_cancel = None
             if share.get("bot_message_id_to_recipient") and share.get("recipient_id"):
                 # Job for deleting the "View Secret" button message
-                job_id_to_cancel = f"del_msg_{share['recipient_id']}_{share['bot_message_id_to_recipient']}_{share['share_uuid']}"
+                job_id_to_cancel = f"{JOB_ID_PREFIX_DELETE_MESSAGE}{share['recipient_id']}_{share['bot_message_id_to_recipient']}_{share['share_uuid']}"
                 if cancel_scheduled_job(job_id_to_cancel):
-                    LOGGER.info(f"Cancelled job {job_id_to_cancel} for revoked share's control message.")
-            elif share.get("recipient_type") == "link" and share.get("access_token"):
-                # Job for link expiry
-                job_id_to_cancel = f"expire_share_{share['share_uuid']}_{share['access_token']}"
-                if cancel_scheduled_job(job_id_to_cancel):
-                     LOGGER.info(f"Cancelled job {job_id_to_cancel} for revoked share's link expiry.")
+                    LOGGER.info("Cancelled job %s for revoked share's control message.", job_id_to_cancel)
+            # Link expiry has no job of its own: the expiry sweep skips shares that are no longer 'active'
 
             # Attempt to delete the "View Secret" button message if it was sent to a specific user and still active
             if share.get("status") == "active" and \
@@ -205,9 +201,9 @@ async def my_secret_action_handler(client: Client, cb: CallbackQuery):
                         chat_id=share["recipient_id"],
                         message_ids=share["bot_message_id_to_recipient"]
                     )
-                    LOGGER.info(f"Deleted 'View Secret' button msg for share {share_uuid} from recipient {share['recipient_id']}.")
+                    LOGGER.info("Deleted 'View Secret' button msg for share %s from recipient %s.", share_uuid, share['recipient_id'])
                 except Exception as e_del:
-                    LOGGER.warning(f"Could not delete 'View Secret' button for {share_uuid}: {e_del}. May already be gone.")
+                    LOGGER.warning("Could not delete 'View Secret' button for %s: %s. May already be gone.", share_uuid, e_del)
 
             await cb.answer("Secret revoked successfully!", show_alert=False)
             # Refresh the detail view to show 'revoked' status
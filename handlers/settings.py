@@ -4,14 +4,15 @@ from pyrogram.types import CallbackQuery, Message
 from pyrogram.errors import MessageNotModified
 
 import config
-from db import get_user_setting, update_user_setting, get_user
+from db import get_user_setting, update_user_setting, set_sender_notify_on_active_shares
 from utils.keyboards import (
     create_settings_keyboard,
     SETTINGS_CALLBACK, # Entry point: "main:settings"
     SETTINGS_TOGGLE_PREFIX,
     MAIN_MENU_CALLBACK
 )
-from utils.decorators import check_user_status
+from utils.decorators import check_user_status, cached_get_user
+from utils.user_writer import get_user_or_pending
 
 LOGGER = logging.getLogger(__name__)
 
@@ -30,11 +31,11 @@ Click the buttons below to toggle settings.
 """
 
 async def display_settings_menu(client: Client, cb_or_msg: CallbackQuery | Message, user_id: int):
-    LOGGER.info(f"User {user_id} viewing settings.")
-    user_db_data = await get_user(user_id) # get_user ensures settings obj exists and defaults merged
+    LOGGER.info("User %s viewing settings.", user_id)
+    user_db_data = await get_user_or_pending(user_id) # Defaults merged by get_user (or already in a queued doc)
 
     if not user_db_data or "settings" not in user_db_data:
-        LOGGER.error(f"Could not load settings for user {user_id} from DB.")
+        LOGGER.error("Could not load settings for user %s from DB.", user_id)
         err_msg = "Error: Could not load your settings."
         if isinstance(cb_or_msg, CallbackQuery): await cb_or_msg.answer(err_msg, show_alert=True)
         elif isinstance(cb_or_msg, Message): await cb_or_msg.reply_text(err_msg)
@@ -59,7 +60,7 @@ async def display_settings_menu(client: Client, cb_or_msg: CallbackQuery | Messa
     except MessageNotModified:
         if isinstance(cb_or_msg, CallbackQuery): await cb_or_msg.answer("Settings are already up to date.")
     except Exception as e:
-        LOGGER.error(f"Error displaying settings menu for {user_id}: {e}")
+        LOGGER.error("Error displaying settings menu for %s: %s", user_id, e)
         if isinstance(cb_or_msg, CallbackQuery): await cb_or_msg.answer("Error loading settings.", show_alert=True)
 
 @Client.on_callback_query(filters.regex(f"^{SETTINGS_CALLBACK}$")) # Catches "main:settings"
@@ -75,11 +76,11 @@ async def settings_toggle_handler(client: Client, cb: CallbackQuery):
         # Regex will capture the setting_key, e.g. settings_toggle:notify_on_view -> notify_on_view
         setting_key = cb.data.split(SETTINGS_TOGGLE_PREFIX, 1)[1]
     except IndexError:
-        LOGGER.error(f"Invalid setting toggle callback: {cb.data} for user {user_id}")
+        LOGGER.error("Invalid setting toggle callback: %s for user %s", cb.data, user_id)
         await cb.answer("Error: Invalid setting action.", show_alert=True)
         return
 
-    LOGGER.info(f"User {user_id} attempting to toggle setting: '{setting_key}'.")
+    LOGGER.info("User %s attempting to toggle setting: '%s'.", user_id, setting_key)
 
     current_value = await get_user_setting(user_id, setting_key)
 
@@ -89,7 +90,7 @@ async def settings_toggle_handler(client: Client, cb: CallbackQuery):
         if setting_key not in config.DEFAULT_USER_SETTINGS or \
            not isinstance(config.DEFAULT_USER_SETTINGS.get(setting_key), bool):
             await cb.answer(f"Error: '{setting_key}' is not a valid toggleable setting.", show_alert=True)
-            LOGGER.warning(f"User {user_id} tried to toggle unknown or non-boolean setting: {setting_key}")
+            LOGGER.warning("User %s tried to toggle unknown or non-boolean setting: %s", user_id, setting_key)
             return
         # If it's a known default boolean but somehow user's current_value is None (should not happen with get_user logic)
         current_value = config.DEFAULT_USER_SETTINGS[setting_key] # Fallback to default to allow toggle
@@ -98,9 +99,12 @@ async def settings_toggle_handler(client: Client, cb: CallbackQuery):
     success = await update_user_setting(user_id, setting_key, new_value)
 
     if success:
+        cached_get_user.invalidate(user_id) # Handlers read default preferences from the decorator's user doc
+        if setting_key == "notify_on_view": # Shares carry a copy of this flag; refresh the live ones
+            await set_sender_notify_on_active_shares(user_id, new_value)
         setting_display_name = setting_key.replace('_', ' ').title()
         await cb.answer(f"{setting_display_name}: {'Enabled' if new_value else 'Disabled'}")
         await display_settings_menu(client, cb, user_id) # Refresh menu
     else:
         await cb.answer(f"Error: Could not update '{setting_key}'.", show_alert=True)
-        LOGGER.error(f"Failed to update_user_setting for {user_id}, key {setting_key} to {new_value}")
\ No newline at end of file
+        LOGGER.error("Failed to update_user_setting for %s, key %s to %s", user_id, setting_key, new_value)
\ No newline at end of file
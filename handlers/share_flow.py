@@ -1,18 +1,23 @@
+import asyncio
+import functools
 import logging
-import uuid
 from datetime import datetime, timedelta, timezone
 import re
-from typing import Optional
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 from pyrogram import Client, filters, enums
-from pyrogram.types import Message, CallbackQuery, User as PyrogramUser, InlineKeyboardMarkup, InlineKeyboardButton, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
-from pyrogram.errors import FloodWait, UserIsBlocked, PeerIdInvalid, MessageIdInvalid, ListenerTimeout, QueryIdInvalid, MessageNotModified
+from pyrogram.types import Message, CallbackQuery, User as PyrogramUser, InlineKeyboardMarkup, InlineKeyboardButton
+from pyrogram.errors import FloodWait, UserIsBlocked, PeerIdInvalid, MessageIdInvalid, ListenerTimeout, MessageNotModified
+
+from pymongo import ReadPreference, WriteConcern
 
 import config
 from db import (
-    get_user, shares_collection, create_share, update_share,
-    get_user_setting, save_inline_share_content, get_inline_share_content,
-    count_user_active_shares
+    shares_collection, create_share, update_share,
+    count_user_active_shares, delete_share_by_uuid, increment_user_shares_count
 )
 from utils.keyboards import (
     create_share_type_keyboard, create_recipient_type_keyboard,
@@ -24,23 +29,131 @@ from utils.keyboards import (
     SHARE_CANCEL_PREFIX, VIEW_SECRET_PREFIX, SET_MAX_VIEWS_PREFIX
 )
 from utils.decorators import check_user_status
+from utils.background import run_in_background
+from utils.user_writer import get_user_or_pending
 from utils.user_states import (
     UserState, get_user_state, set_user_state, clear_user_state,
     start_share_flow, get_share_flow_data, update_share_flow_data,
     advance_share_flow_state
 )
-from utils.scheduler import schedule_message_deletion, schedule_share_expiry, cancel_scheduled_job, JOB_ID_PREFIX_EXPIRE_SHARE, JOB_ID_PREFIX_DELETE_MESSAGE
-from handlers.start_help import send_main_menu # For cancellation navigation
+from utils.scheduler import schedule_message_deletion, cancel_scheduled_job, JOB_ID_PREFIX_DELETE_MESSAGE
 
 LOGGER = logging.getLogger(__name__)
 ASK_TIMEOUT_SECONDS = 300 # 5 minutes
+VIEW_SECRET_DEEPLINK_PREFIX = "viewsecret_"
+_DEEPLINK_PREFIX_LEN = len(VIEW_SECRET_DEEPLINK_PREFIX)
+
+# Fields read after a successful view update; keeps the returned document small
+_VIEW_RESULT_PROJECTION = {
+    "_id": 0, "share_uuid": 1, "status": 1, "max_views": 1, "view_count": 1,
+    "recipient_type": 1, "recipient_id": 1, "expires_at": 1,
+    "original_chat_id": 1, "original_message_id": 1, "share_type": 1,
+    "is_protected_content": 1, "show_forward_tag": 1, "sender_id": 1,
+    "content_text": 1, "sender_notify_on_view": 1,
+}
+# Fields the deep-link pre-checks actually read before the atomic view update
+_PRECHECK_PROJECTION = {
+    "_id": 0, "share_uuid": 1, "status": 1, "max_views": 1, "view_count": 1,
+    "recipient_type": 1, "recipient_id": 1,
+}
+
+def _view_destructed(share: dict) -> bool:
+    # The view update only matches active shares, so a returned 'destructed' status was set by this very view:
+    # only the writer whose increment met max_views sees it, and concurrent views can't both finalize
+    return share.get("status") == "destructed"
+
+def _format_destruct_minutes(minutes: int) -> str:
+    if minutes < 60: return f"{minutes} min"
+    if minutes % 1440 == 0: return f"{minutes // 1440} day(s)"
+    if minutes % 60 == 0: return f"{minutes // 60} hour(s)"
+    return f"{minutes // 60}h {minutes % 60}m"
+
+# Per-tier timer options and max lifespans, computed once at import for the self-destruct callback
+_FREE_OPTS = frozenset(config.FREE_SELF_DESTRUCT_OPTIONS)
+_PREM_OPTS = frozenset(config.PREMIUM_SELF_DESTRUCT_OPTIONS)
+_FREE_MAX_MIN = config.FREE_TIER_MAX_EXPIRY_DAYS * 24 * 60
+_PREM_MAX_MIN = config.PREMIUM_TIER_MAX_EXPIRY_DAYS * 24 * 60
+_PREM_VIEW_OPTS = frozenset(config.PREMIUM_MAX_VIEWS_OPTIONS)
+
+# Labels for every selectable timer, built once at import
+_DESTRUCT_LABELS = {m: _format_destruct_minutes(m) for m in _FREE_OPTS | _PREM_OPTS}
+
+_CONFIRM_TEMPLATE = (
+    "🔒 **Confirm Your Secret Share**\n\n"
+    "▫️ **Content:** {content_desc}\n"
+    "▫️ **Recipient:** {recipient}\n"
+    "▫️ **Forward Tag:** {forward_tag}\n"
+    "▫️ **Content Protection:** {protection}\n"
+    "▫️ **Self-Destruct Timer:** {timer_label}\n"
+    "▫️ **Max Views:** {views_label}\n\n"
+    "Please confirm to send."
+)
+
+_RECIPIENT_SHARE_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Tokens recently resolved as no longer viewable: repeat button clicks are answered without a DB round trip
+_RECENT_VIEW_TTL_SECONDS = 5
+_RECENT_VIEWS_MAX = 10_000
+_recent_views: "OrderedDict[str, Tuple[float, str]]" = OrderedDict() # access_token -> (monotonic time, answer text)
+
+# View notifications to the same sender are coalesced into one message per window: Telegram rate-limits
+# sends per chat, so a burst of views on a popular link would otherwise pile up in FloodWait.
+_NOTIFY_COALESCE_SECONDS = 5
+_pending_view_notifications: Dict[int, List[Tuple[str, str]]] = {} # sender_id -> [(full text, digest line)]
+
+def _queue_view_notification(client: Client, sender_id: int, full_text: str, digest_line: str):
+    pending = _pending_view_notifications.get(sender_id)
+    if pending is not None: # A flush is already scheduled for this sender
+        pending.append((full_text, digest_line))
+        return
+    _pending_view_notifications[sender_id] = [(full_text, digest_line)]
+    run_in_background(_flush_view_notifications(client, sender_id), name=f"view_notify:{sender_id}")
+
+async def _flush_view_notifications(client: Client, sender_id: int):
+    await asyncio.sleep(_NOTIFY_COALESCE_SECONDS)
+    pending = _pending_view_notifications.pop(sender_id, [])
+    if not pending:
+        return
+    if len(pending) == 1:
+        text = pending[0][0]
+    else:
+        text = f"ℹ️ {len(pending)} views of your secrets just happened:\n" + "\n".join(f"• {line}" for _, line in pending)
+    try:
+        # Silent push: Telegram throttles loud messages harder, and a hot link shouldn't FloodWait the sender's chat
+        await client.send_message(sender_id, text, disable_notification=True, protect_content=False)
+    except Exception as e_notify:
+        LOGGER.warning("Failed to send %s view notification(s) to %s: %s", len(pending), sender_id, e_notify)
+
+def _remember_resolved_token(access_token: str, answer_text: str):
+    _recent_views[access_token] = (time.monotonic(), answer_text)
+    _recent_views.move_to_end(access_token)
+    if len(_recent_views) > _RECENT_VIEWS_MAX:
+        _recent_views.popitem(last=False) # Evict the oldest
+
+_MAIN_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")]])
+
+_SHARE_CANCEL_NOW_PREFIX = f"{SHARE_CANCEL_PREFIX}now:"
+_FWD_TAG_PREFIX_LEN = len(FORWARD_TAG_TOGGLE_PREFIX)
+_PROT_CNT_PREFIX_LEN = len(PROTECTED_CONTENT_TOGGLE_PREFIX)
+# Compiled once; digits (minutes) may be "0" or negative for special timer choices
+_SET_DESTRUCT_RE = re.compile(rf"^{SET_DESTRUCT_PREFIX}([-\d]+):(.+)$")
+_SET_MAX_VIEWS_RE = re.compile(rf"^{SET_MAX_VIEWS_PREFIX}(\d+):(.+)$")
+
+@functools.lru_cache(maxsize=256)
+def _share_cancel_markup(share_uuid: str) -> InlineKeyboardMarkup:
+    # Same markup is shown for the content and recipient prompts of a flow; built once per share_uuid.
+    # (Pyrogram serializes markup objects to MTProto itself, so a raw JSON template would not be accepted.)
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("❌ Cancel", callback_data=_SHARE_CANCEL_NOW_PREFIX + share_uuid)
+    ]])
 
-async def cancel_current_share_flow(client: Client, user_id: int, trigger_update: CallbackQuery | Message, flow_data: Optional[dict]):
+async def cancel_current_share_flow(client: Client, user_id: int, trigger_update: CallbackQuery | Message, flow_data: Optional[dict]) -> bool:
+    """Clears the share flow and sends the main menu. Returns True (menu already sent) so callers never send it twice."""
     share_uuid = flow_data.get("share_uuid") if flow_data else "unknown"
     current_state_name, _ = get_user_state(user_id)
     clear_user_state(user_id)
     text = "✅ Share process cancelled."
-    LOGGER.info(f"Share flow (UUID: {share_uuid}, User: {user_id}, State: {current_state_name}) cancelled. State cleared.")
+    LOGGER.info("Share flow (UUID: %s, User: %s, State: %s) cancelled. State cleared.", share_uuid, user_id, current_state_name)
 
     target_message_for_edit = trigger_update.message if isinstance(trigger_update, CallbackQuery) else trigger_update
     try:
@@ -50,212 +163,158 @@ async def cancel_current_share_flow(client: Client, user_id: int, trigger_update
         else: # Message
             await trigger_update.reply_text(text)
     except Exception as e:
-        LOGGER.warning(f"Error updating message on share cancel for {user_id}: {e}")
+        LOGGER.warning("Error updating message on share cancel for %s: %s", user_id, e)
         await client.send_message(user_id, text) # Send as new message if edit fails
 
     # Send main menu after cancellation
+    from handlers.start_help import send_main_menu # Imported lazily: start_help is only needed on these navigation paths
     await send_main_menu(client, user_id, target_message_for_edit, edit=False) # Always send new menu after cancel text
+    return True
 
-# In handlers/share_flow.py
-
-# Ensure these imports are at the top of your handlers/share_flow.py file
-# from datetime import datetime, timezone (already there)
-# from db import shares_collection, update_share, get_user_setting (already there, shares_collection might not be needed directly here if update_share used)
-# from utils.scheduler import cancel_scheduled_job (new if not there)
-# from pyrogram.errors import UserIsBlocked, PeerIdInvalid (already there)
 
-@Client.on_message(filters.command("start") & filters.private & filters.create(lambda _, __, m: len(m.command) > 1 and m.command[1].startswith("viewsecret_")))
+@Client.on_message(filters.command("start") & filters.private & filters.create(lambda _, __, m: len(m.command) > 1 and m.command[1].startswith(VIEW_SECRET_DEEPLINK_PREFIX)))
 @check_user_status # Ensures user is in DB, not banned, and cb.user_db is available (though message.user_db used here)
 async def process_view_secret_deep_link(client: Client, message: Message):
     viewer_id = message.from_user.id
     viewer_pyro_user = message.from_user # Pyrogram User object for name/mention
 
-    try:
-        access_token = message.command[1].split("viewsecret_", 1)[1]
-    except IndexError:
-        LOGGER.error(f"Invalid viewsecret deeplink payload: {message.text} for user {viewer_id}")
+    # The filter already guarantees the prefix, so a slice is enough
+    access_token = message.command[1][_DEEPLINK_PREFIX_LEN:]
+    if not access_token:
+        LOGGER.error("Invalid viewsecret deeplink payload: %s for user %s", message.text, viewer_id)
         await message.reply_text("⚠️ Invalid secret link format.")
-        await send_main_menu(client, viewer_id, message) # Assuming send_main_menu is available
-        return
-
-    LOGGER.info(f"User {viewer_id} attempting to view secret via deeplink with token: {access_token}")
-
-    # Fetch the share. Critical to check status and view count here.
-    # Using find_one_and_update for atomicity if possible, but complex for pre-delivery checks with deep links.
-    # Let's do a find, then an update if view is allowed.
-    
-    share = await shares_collection.find_one({"access_token": access_token})
-
-    if not share:
-        await message.reply_text("⚠️ This secret link is invalid or the secret no longer exists.")
-        await send_main_menu(client, viewer_id, message)
-        return
-
-    # --- Initial validation of the share state ---
-    if share["status"] != "active":
-        status_msg = f"⚠️ This secret link has already been {share['status']} and is no longer available."
-        await message.reply_text(status_msg)
-        await send_main_menu(client, viewer_id, message)
-        return
-
-    # Specific recipient check for links that were *intended* for a specific user but shared via general link mechanism
-    if share.get("recipient_id") and share.get("recipient_type") == "link" and share["recipient_id"] != viewer_id:
-        # This scenario is less common for true deep links, more for links initially claimed then re-accessed
-        await message.reply_text("🚫 This secret link seems to have been claimed by or intended for someone else.")
-        await send_main_menu(client, viewer_id, message)
         return
-    
-    # Check max views limit
-    current_view_count = share.get("view_count", 0)
-    share_max_views = share.get("max_views", 1) # Default to 1 if not set
 
-    if share_max_views > 0 and current_view_count >= share_max_views:
-        LOGGER.info(f"Share {share['share_uuid']} (token {access_token}) via deeplink reached max_views ({current_view_count}/{share_max_views}). Not showing.")
-        # Update status to reflect max views reached, then inform user
-        await update_share(share["share_uuid"], {
-            "status": "expired", # Or "max_views_reached" if you have such a status
-            "expired_at": datetime.now(timezone.utc),
-            "failure_reason": f"max_views_reached ({share_max_views})"
-        })
-        await message.reply_text("⚠️ This secret link has reached its maximum view limit and has been destroyed.")
-        # Cancel link expiry job if it exists, as it's now definitively handled
-        if share.get("expires_at"):
-            job_id_link_expire = f"{JOB_ID_PREFIX_EXPIRE_SHARE}{share['share_uuid']}" # Using JOB_ID_PREFIX_EXPIRE_SHARE from scheduler
-            cancel_scheduled_job(job_id_link_expire)
-        await send_main_menu(client, viewer_id, message)
-        return
+    LOGGER.info("User %s attempting to view secret via deeplink with token: %s", viewer_id, access_token)
 
-    # --- Valid viewer, attempt to deliver secret ---
-    # This is a critical section. We should update DB *before* delivering content ideally.
+    # One round trip: the filter carries every pre-check (active, not claimed by someone else, views left)
+    # and the pipeline applies the view. The share is only read separately when the view is refused.
     viewer_name = viewer_pyro_user.first_name or f"User {viewer_id}"
-    
-    # Only update these fields if max_views > 0 and (current_view_count + 1) >= max_views
-    update_fields = {}
-    if share_max_views > 0 and (current_view_count + 1) >= share_max_views:
-        update_fields = {
-            "status": "viewed",  # Tentatively 'viewed', will become 'destructed' if this is the last view
-            "viewed_at": datetime.now(timezone.utc),
-            "viewed_by_user_id": viewer_id,
-            "viewed_by_display_name": viewer_name,
-            # view_count will be incremented with $inc
-        }
-    # If max_views == 0 (unlimited), do not update these fields
-    
-    # If it's a link being claimed by this view
-    # Only update recipient_id/display_name for link shares if:
-    # - max_views > 0 (not unlimited)
-    # - and (current_view_count > share_max_views or (current_view_count + 1) == share_max_views)
-    # This means: only on the last allowed view or if view count already exceeded (shouldn't normally happen)
-    if (
-        share.get("recipient_type") == "link"
-        and not share.get("recipient_id")
-        and share_max_views > 0
-        and (
-            current_view_count > share_max_views
-            or (current_view_count + 1) == share_max_views
-        )
-    ):
-        update_fields["recipient_id"] = viewer_id
-        update_fields["recipient_display_name"] = viewer_name
-        LOGGER.info(f"Link share {share['share_uuid']} (Token: {access_token}) being claimed by viewer {viewer_id} via deeplink.")
 
-    # Atomically update view count and other fields
-    # This ensures that even if multiple requests hit for the same link, view_count is accurate
     # Allow unlimited views if max_views is 0 or negative (premium unlimited), otherwise check view_count < max_views
+    # Pipeline update: the final view flips status to 'destructed' in the same write as the increment.
+    is_final_view = {"$and": [
+        {"$gt": ["$max_views", 0]},
+        {"$gte": [{"$add": ["$view_count", 1]}, "$max_views"]}
+    ]}
+    # A link share without a recipient is claimed by whoever takes its last view
+    is_link_claim = {"$and": [
+        is_final_view,
+        {"$eq": ["$recipient_type", "link"]},
+        {"$not": [{"$ifNull": ["$recipient_id", False]}]}
+    ]}
+    # $literal so user-provided values (e.g. a display name starting with '$') are never parsed as expressions
+    view_set_stage = {
+        "view_count": {"$add": ["$view_count", 1]},
+        "status": {"$cond": [is_final_view, "destructed", "$status"]},
+        "destructed_at": {"$cond": [is_final_view, "$$NOW", "$destructed_at"]},
+        # Viewer details are only recorded on the final view (not for unlimited shares)
+        "viewed_by_user_id": {"$cond": [is_final_view, {"$literal": viewer_id}, "$viewed_by_user_id"]},
+        "viewed_by_display_name": {"$cond": [is_final_view, {"$literal": viewer_name}, "$viewed_by_display_name"]},
+        "viewed_at": {"$cond": [is_final_view, "$$NOW", "$viewed_at"]}, # Same DB clock tick as destructed_at
+        "recipient_id": {"$cond": [is_link_claim, {"$literal": viewer_id}, "$recipient_id"]},
+        "recipient_display_name": {"$cond": [is_link_claim, {"$literal": viewer_name}, "$recipient_display_name"]},
+    }
+
     updated_share_doc = await shares_collection.find_one_and_update(
         {
             "access_token": access_token,
             "status": "active",
-            "$or": [
-                {"max_views": {"$lte": 0}},
-                {"$expr": {"$lt": ["$view_count", "$max_views"]}}
+            "$and": [
+                # Links claimed by (or intended for) someone else are refused
+                {"$or": [{"recipient_type": {"$ne": "link"}}, {"recipient_id": {"$in": [None, viewer_id]}}]},
+                {"$or": [
+                    {"max_views": {"$lte": 0}},
+                    {"$expr": {"$lt": ["$view_count", "$max_views"]}}
+                ]},
             ]
         },
-        {"$set": update_fields, "$inc": {"view_count": 1}},
+        [{"$set": view_set_stage}],
+        projection=_VIEW_RESULT_PROJECTION,
         return_document=True  # Get the document *after* update
     )
 
     if not updated_share_doc:
-        # This means the share was likely viewed by another request between the initial find and this update,
-        # or its status changed, or view limit was hit by a concurrent request.
-        LOGGER.warning(f"Share {share.get('share_uuid','N/A')} (token {access_token}) status changed or max_views hit before atomic update for deeplink user {viewer_id}.")
-        await message.reply_text("⚠️ This secret was just accessed or expired. Please try again if you believe this is an error, or contact the sender.")
-        await send_main_menu(client, viewer_id, message)
+        await _explain_deeplink_refusal(message, access_token, viewer_id)
         return
         
     # Now updated_share_doc contains the share with incremented view_count
     share = updated_share_doc # Use the latest document
-    
+
+    sender_id = share.get("sender_id")
+
     await message.reply_text("🤫 Secret found! Revealing it momentarily...")
     
     try:
-        source_chat_id = share["original_chat_id"]
-        source_message_id = share["original_message_id"]
-        
-        send_kwargs = {"chat_id": viewer_id, "from_chat_id": source_chat_id, "message_id": source_message_id}
-        
-        # Use original_chat_id and original_message_id from the INLINE share doc (points to bot's "me" chat)
-        # or from a normal share (points to sender's PM with bot)
-        
-        if not share.get("show_forward_tag", True): # Sender chose to hide forward tag
-            if share.get("is_protected_content", False):
-                 send_kwargs["protect_content"] = True
-            await client.copy_message(**send_kwargs)
-        else: # Show forward tag (default)
-            # If is_protected_content=True here, behavior depends on Telegram. Bot cannot force protect on forward of unprotected message.
-            await client.forward_messages(
-                chat_id=send_kwargs["chat_id"],
-                from_chat_id=send_kwargs["from_chat_id"],
-                message_ids=[send_kwargs["message_id"]]
-            )
+        await _send_share_content(client, share, viewer_id)
 
-        LOGGER.info(f"Secret {share['share_uuid']} content delivered to deeplink viewer {viewer_id}.")
-        action_taken_message = "This secret has now been viewed."
-
-        # Final status check: if this view met max_views, mark as destructed
-        new_view_count = share.get("view_count", 0) # This count is now updated (from find_one_and_update)
-        if share_max_views > 0 and new_view_count >= share_max_views:
-            LOGGER.info(f"Share {share['share_uuid']} reached max_views ({new_view_count}/{share_max_views}) with this deeplink view.")
-            await update_share(share["share_uuid"], {
-                "status": "destructed", # Final status
-                "destructed_at": datetime.now(timezone.utc),
-                # Keep 'viewed_at', 'viewed_by_user_id' from the last view
-            })
+        LOGGER.info("Secret %s content delivered to deeplink viewer %s.", share['share_uuid'], viewer_id)
+
+        # Final status check: the pipeline update already marked the share destructed if this view met max_views
+        if _view_destructed(share):
+            LOGGER.info("Share %s reached max_views (%s/%s) with this deeplink view.", share['share_uuid'], share.get('view_count', 0), share.get('max_views', 1))
             action_taken_message = "This secret has reached its view limit and is now destroyed."
-             # Cleanup the temp message from "me" chat if it's an inline share
-            me = await client.get_me()
-            if share.get("share_type") == "message_inline" and share.get("original_chat_id") == me.id:
+             # Cleanup the temp message from "me" chat if it's an inline share (client.me is cached by Pyrogram)
+            if share.get("share_type") == "message_inline" and share.get("original_chat_id") == client.me.id:
                 try: await client.delete_messages(share["original_chat_id"], share["original_message_id"])
-                except Exception as e_del_tmp: LOGGER.warning(f"Could not delete inline temp msg {share['original_message_id']} after final view: {e_del_tmp}")
+                except Exception as e_del_tmp: LOGGER.warning("Could not delete inline temp msg %s after final view: %s", share['original_message_id'], e_del_tmp)
+        else:
+            action_taken_message = "This secret has now been viewed."
 
 
         # Notify sender if their setting allows
-        sender_id = share.get("sender_id")
-        if sender_id and await get_user_setting(sender_id, "notify_on_view"):
-            try:
-                await client.send_message(
-                    sender_id,
-                    f"ℹ️ Your secret (Link shared, ID: ...{share['share_uuid'][-6:]}) "
-                    f"was just viewed by {viewer_name} (`{viewer_id}`)."
-                )
-            except Exception as e_notify:
-                LOGGER.warning(f"Failed to send view notification for {share['share_uuid']}: {e_notify}")
+        if sender_id and share.get("sender_notify_on_view", True): # Copied from the sender's settings at creation
+            short_id = share['share_uuid'][-6:]
+            _queue_view_notification(
+                client, sender_id,
+                f"ℹ️ Your secret (Link shared, ID: ...{short_id}) was just viewed by {viewer_name} (`{viewer_id}`).",
+                f"...{short_id} (link) by {viewer_name} (`{viewer_id}`)"
+            )
 
-        # Cancel the main link expiry job if it exists, as it's now viewed/destructed.
-        if share.get("expires_at"): # Checks if share had a master expiry timer
-            job_id_link_expire = f"{JOB_ID_PREFIX_EXPIRE_SHARE}{share['share_uuid']}"
-            if cancel_scheduled_job(job_id_link_expire):
-                LOGGER.info(f"Cancelled master expiry job for link share {share['share_uuid']} after view.")
+        # No expiry job to cancel: the expiry sweep only touches shares that are still 'active'
 
         await message.reply_text(action_taken_message)
 
     except Exception as e:
-        LOGGER.exception(f"Error revealing secret {access_token} (deeplink) to {viewer_id} after DB update: {e}")
+        LOGGER.exception("Error revealing secret %s (deeplink) to %s after DB update: %s", access_token, viewer_id, e)
         # DB already reflects the view attempt.
         await message.reply_text("📛 An error occurred while trying to show you the secret content after access was granted.")
-    finally:
-        # No main menu here as user interaction finished for this deep link
-        pass
+
+
+async def _explain_deeplink_refusal(message: Message, access_token: str, viewer_id: int):
+    # Only reached when the atomic view update matched nothing: read the share to tell the viewer why
+    share = await shares_collection.find_one({"access_token": access_token}, projection=_PRECHECK_PROJECTION)
+
+    if not share:
+        await message.reply_text("⚠️ This secret link is invalid or the secret no longer exists.")
+        return
+
+    if share["status"] != "active":
+        await message.reply_text(f"⚠️ This secret link has already been {share['status']} and is no longer available.")
+        return
+
+    # Specific recipient check for links that were *intended* for a specific user but shared via general link mechanism
+    if share.get("recipient_id") and share.get("recipient_type") == "link" and share["recipient_id"] != viewer_id:
+        await message.reply_text("🚫 This secret link seems to have been claimed by or intended for someone else.")
+        return
+
+    current_view_count = share.get("view_count", 0)
+    share_max_views = share.get("max_views", 1) # Default to 1 if not set
+    if share_max_views > 0 and current_view_count >= share_max_views:
+        LOGGER.info("Share %s (token %s) via deeplink reached max_views (%s/%s). Not showing.", share['share_uuid'], access_token, current_view_count, share_max_views)
+        # Update status to reflect max views reached, then inform user
+        await shares_collection.update_one({"share_uuid": share["share_uuid"], "status": "active"}, [{"$set": {
+            "status": "expired", # Or "max_views_reached" if you have such a status
+            "expired_at": "$$NOW", # Stamped by the DB clock
+            "failure_reason": f"max_views_reached ({share_max_views})"
+        }}])
+        await message.reply_text("⚠️ This secret link has reached its maximum view limit and has been destroyed.")
+        # No job cancel here: the expiry job is a no-op once the share is no longer active
+        return
+
+    # Active with views left: a concurrent request changed it between the update and this read
+    LOGGER.warning("Share %s (token %s) changed during the view update for deeplink user %s.", share['share_uuid'], access_token, viewer_id)
+    await message.reply_text("⚠️ This secret was just accessed or expired. Please try again if you believe this is an error, or contact the sender.")
 
 
 @Client.on_callback_query(filters.regex(f"^{SHARE_SECRET_CALLBACK}"))
@@ -273,13 +332,17 @@ async def initiate_share_handler(client: Client, cb: CallbackQuery):
     #     return
     # Uncomment above if limits are to be strictly enforced from config
 
-    LOGGER.info(f"User {user_id} initiated share secret flow.")
+    LOGGER.info("User %s initiated share secret flow.", user_id)
     share_uuid = start_share_flow(user_id) # State: AWAITING_SHARE_CONTENT
+    # Hydrate the user's default preferences once; later steps read them from flow_data without DB hits
+    user_settings = user_db.get("settings") or config.DEFAULT_USER_SETTINGS # get_user already merged defaults
     update_share_flow_data(user_id,
                            sender_id=user_id,
                            # Initialize with user's default preferences
-                           show_forward_tag=await get_user_setting(user_id, "default_show_forward_tag"),
-                           is_protected_content=await get_user_setting(user_id, "default_protected_content")
+                           show_forward_tag=user_settings.get("default_show_forward_tag", config.DEFAULT_USER_SETTINGS["default_show_forward_tag"]),
+                           is_protected_content=user_settings.get("default_protected_content", config.DEFAULT_USER_SETTINGS["default_protected_content"]),
+                           # Copied onto the share so views don't have to read the sender's settings
+                           sender_notify_on_view=user_settings.get("notify_on_view", config.DEFAULT_USER_SETTINGS["notify_on_view"])
                            )
     keyboard = create_share_type_keyboard(share_uuid)
     await cb.edit_message_text(
@@ -292,7 +355,7 @@ async def _handle_content_message_for_sharing(client: Client, user_id: int, cont
     share_uuid = flow_data["share_uuid"]
     share_type = flow_data["share_type"] # Already set when share_type_selected was called
 
-    user_db = await get_user(user_id) # Refresh user_db for premium check
+    user_db = await get_user_or_pending(user_id) # Refresh user_db for premium check
     is_premium = user_db.get("is_premium", False)
     max_size_mb = config.PREMIUM_TIER_MAX_FILE_SIZE_MB if is_premium else config.FREE_TIER_MAX_FILE_SIZE_MB
     max_size_bytes = max_size_mb * 1024 * 1024
@@ -329,7 +392,7 @@ async def _handle_content_message_for_sharing(client: Client, user_id: int, cont
                            original_chat_id=content_message.chat.id, # User's PM with bot
                            original_file_name=original_file_name)
     advance_share_flow_state(user_id, UserState.AWAITING_RECIPIENT)
-    LOGGER.info(f"User {user_id} (Share UUID: {share_uuid}) provided content (Type: {share_type}). Asking for recipient.")
+    LOGGER.info("User %s (Share UUID: %s) provided content (Type: %s). Asking for recipient.", user_id, share_uuid, share_type)
 
     keyboard = create_recipient_type_keyboard(share_uuid)
     await content_message.reply_text("👍 Content received! Who is this secret for?", reply_markup=keyboard)
@@ -350,6 +413,7 @@ async def share_type_selected_handler(client: Client, cb: CallbackQuery):
 
     if not flow_data or flow_data.get("share_uuid") != cb_share_uuid or state != UserState.AWAITING_SHARE_CONTENT:
         await cb.answer("Session mismatch or expired. Please /start again.", show_alert=True)
+        from handlers.start_help import send_main_menu
         await send_main_menu(client, user_id, cb, edit=True) # Send new menu
         return
 
@@ -367,9 +431,7 @@ async def share_type_selected_handler(client: Client, cb: CallbackQuery):
     else:
         await cb.answer("Invalid share type selected.", show_alert=True); return
 
-    cancel_btn_markup = InlineKeyboardMarkup([[
-        InlineKeyboardButton("❌ Cancel", callback_data=f"{SHARE_CANCEL_PREFIX}now:{cb_share_uuid}")
-    ]])
+    cancel_btn_markup = _share_cancel_markup(cb_share_uuid)
     await cb.edit_message_text(prompt_text + "\n\nOr you can cancel:", reply_markup=cancel_btn_markup)
     await cb.answer("Waiting for your content...")
 
@@ -390,7 +452,7 @@ async def share_type_selected_handler(client: Client, cb: CallbackQuery):
         # After getting content_msg, re-check state as it might have been cancelled during 'ask'
         current_state, current_flow_data = get_user_state(user_id)
         if current_state != UserState.AWAITING_SHARE_CONTENT or current_flow_data.get("share_uuid") != cb_share_uuid:
-            LOGGER.info(f"Share {cb_share_uuid} cancelled or state changed during content ask for {user_id}.")
+            LOGGER.info("Share %s cancelled or state changed during content ask for %s.", cb_share_uuid, user_id)
             # Cancellation already handled by cancel handler if button clicked
             return
         
@@ -402,7 +464,7 @@ async def share_type_selected_handler(client: Client, cb: CallbackQuery):
             await client.send_message(user_id, f"⏰ Timeout. Share cancelled.")
             await cancel_current_share_flow(client, user_id, cb, data_after_timeout)
     except Exception as e:
-        LOGGER.error(f"Error in content ask for {user_id}, share {cb_share_uuid}: {e}")
+        LOGGER.error("Error in content ask for %s, share %s: %s", user_id, cb_share_uuid, e)
         state_after_error, data_after_error = get_user_state(user_id) # Fetch current state
         if data_after_error.get("share_uuid") == cb_share_uuid : # If error happened within this flow
              await client.send_message(user_id, "An error occurred. Share cancelled.")
@@ -435,7 +497,7 @@ async def _handle_recipient_info(client: Client, user_id: int, recipient_info_me
              await recipient_info_message.reply_text(f"⚠️ Invalid User ID format for '{txt}'. Share cancelled.")
              await cancel_current_share_flow(client, user_id, recipient_info_message, flow_data); return False
         except Exception as e:
-            LOGGER.error(f"Error resolving recipient '{txt}' for {user_id}: {e}")
+            LOGGER.error("Error resolving recipient '%s' for %s: %s", txt, user_id, e)
             await recipient_info_message.reply_text(f"⚠️ Could not process recipient. Share cancelled.")
             await cancel_current_share_flow(client, user_id, recipient_info_message, flow_data); return False
     else:
@@ -457,22 +519,19 @@ async def _handle_recipient_info(client: Client, user_id: int, recipient_info_me
 
     recipient_display_name = recipient_pyrogram_user.first_name or \
                              (f"@{recipient_pyrogram_user.username}" if recipient_pyrogram_user.username else f"User ID {recipient_pyrogram_user.id}")
-    update_share_flow_data(user_id, recipient_id=recipient_pyrogram_user.id, recipient_display_name=recipient_display_name)
-    
-    # Move to Protection Preferences state
-    advance_share_flow_state(user_id, UserState.AWAITING_PROTECTION_PREFERENCES)
-    LOGGER.info(f"User {user_id} (Share: {share_uuid}) chose recipient {recipient_display_name}. Asking for protection prefs.")
-    
-    # Fetch current/default protection preferences
-    current_show_tag = flow_data.get("show_forward_tag", await get_user_setting(user_id, "default_show_forward_tag"))
-    current_protect_content = flow_data.get("is_protected_content", await get_user_setting(user_id, "default_protected_content"))
-
-    keyboard = create_protection_preferences_keyboard(share_uuid, current_show_tag, current_protect_content)
-    await recipient_info_message.reply_text(
-        f"✅ Recipient: **{recipient_display_name}**.\n\n"
-        "Next, delivery preferences (how the secret appears to them):",
-        reply_markup=keyboard
+    prefs_header = (f"✅ Recipient: **{recipient_display_name}**.\n\n"
+                    "Next, delivery preferences (how the secret appears to them):")
+    # Move to Protection Preferences state; the header is kept so the toggle handler can re-render the prompt
+    update_share_flow_data(
+        user_id, new_state=UserState.AWAITING_PROTECTION_PREFERENCES,
+        recipient_id=recipient_pyrogram_user.id, recipient_display_name=recipient_display_name,
+        protection_prefs_header=prefs_header
     )
+    LOGGER.info("User %s (Share: %s) chose recipient %s. Asking for protection prefs.", user_id, share_uuid, recipient_display_name)
+    
+    # Current/default protection preferences (hydrated into flow_data when the flow started)
+    keyboard = create_protection_preferences_keyboard(share_uuid, flow_data["show_forward_tag"], flow_data["is_protected_content"])
+    await recipient_info_message.reply_text(prefs_header, reply_markup=keyboard)
     return True
 
 @Client.on_callback_query(filters.regex(f"^{RECIPIENT_TYPE_PREFIX}"))
@@ -489,6 +548,7 @@ async def recipient_type_selected_handler(client: Client, cb: CallbackQuery):
 
     if not flow_data or flow_data.get("share_uuid") != cb_share_uuid or state != UserState.AWAITING_RECIPIENT:
         await cb.answer("Session mismatch or expired. Please /start again.", show_alert=True)
+        from handlers.start_help import send_main_menu
         await send_main_menu(client, user_id, cb, edit=True)
         return
 
@@ -497,21 +557,20 @@ async def recipient_type_selected_handler(client: Client, cb: CallbackQuery):
 
     if recipient_type_choice == "link":
         # If link, skip recipient info, go to protection preferences directly
-        advance_share_flow_state(user_id, UserState.AWAITING_PROTECTION_PREFERENCES)
-        LOGGER.info(f"User {user_id} (Share: {cb_share_uuid}) chose 'link'. Asking for protection prefs.")
-        current_show_tag = flow_data.get("show_forward_tag", await get_user_setting(user_id, "default_show_forward_tag")) # from initial flow start
-        current_protect_content = flow_data.get("is_protected_content", await get_user_setting(user_id, "default_protected_content"))
-        keyboard = create_protection_preferences_keyboard(cb_share_uuid, current_show_tag, current_protect_content)
-        await cb.edit_message_text("🔗 Sharable link chosen.\n\nNext, delivery preferences:", reply_markup=keyboard)
+        prefs_header = "🔗 Sharable link chosen.\n\nNext, delivery preferences:"
+        update_share_flow_data(
+            user_id, new_state=UserState.AWAITING_PROTECTION_PREFERENCES, protection_prefs_header=prefs_header
+        )
+        LOGGER.info("User %s (Share: %s) chose 'link'. Asking for protection prefs.", user_id, cb_share_uuid)
+        keyboard = create_protection_preferences_keyboard(cb_share_uuid, flow_data["show_forward_tag"], flow_data["is_protected_content"]) # from initial flow start
+        await cb.edit_message_text(prefs_header, reply_markup=keyboard)
         await cb.answer()
         return
     
     # If recipient_type_choice == "user":
     prompt_text = ("👤 To share with a specific user, forward one of their messages, "
                    "or send their @username or User ID.")
-    cancel_btn_markup = InlineKeyboardMarkup([[
-        InlineKeyboardButton("❌ Cancel", callback_data=f"{SHARE_CANCEL_PREFIX}now:{cb_share_uuid}")
-    ]])
+    cancel_btn_markup = _share_cancel_markup(cb_share_uuid)
     await cb.edit_message_text(prompt_text + "\n\nOr cancel:", reply_markup=cancel_btn_markup)
     await cb.answer("Waiting for recipient's details...")
 
@@ -528,7 +587,7 @@ async def recipient_type_selected_handler(client: Client, cb: CallbackQuery):
 
         current_state, current_flow_data = get_user_state(user_id)
         if current_state != UserState.AWAITING_RECIPIENT or current_flow_data.get("share_uuid") != cb_share_uuid:
-            LOGGER.info(f"Share {cb_share_uuid} cancelled or state changed during recipient ask for {user_id}.")
+            LOGGER.info("Share %s cancelled or state changed during recipient ask for %s.", cb_share_uuid, user_id)
             return
 
         await _handle_recipient_info(client, user_id, recipient_info_msg, current_flow_data)
@@ -539,7 +598,7 @@ async def recipient_type_selected_handler(client: Client, cb: CallbackQuery):
             await client.send_message(user_id, f"⏰ Timeout for recipient details. Share cancelled.")
             await cancel_current_share_flow(client, user_id, cb, data_after_timeout)
     except Exception as e:
-        LOGGER.error(f"Error in recipient ask for {user_id}, share {cb_share_uuid}: {e}")
+        LOGGER.error("Error in recipient ask for %s, share %s: %s", user_id, cb_share_uuid, e)
         state_after_error, data_after_error = get_user_state(user_id)
         if data_after_error.get("share_uuid") == cb_share_uuid :
              await client.send_message(user_id, "An error occurred getting recipient. Share cancelled.")
@@ -551,44 +610,44 @@ async def protection_toggle_handler(client: Client, cb: CallbackQuery):
     user_id = cb.from_user.id
     state, flow_data = get_user_state(user_id)
 
-    try:
-        # e.g. fwd_tag:share_uuid OR prot_cnt:share_uuid
-        cb_share_uuid = cb.data.split(":", 1)[1]
-        is_forward_tag_toggle = cb.data.startswith(FORWARD_TAG_TOGGLE_PREFIX)
-        is_protected_content_toggle = cb.data.startswith(PROTECTED_CONTENT_TOGGLE_PREFIX)
-    except IndexError:
+    # e.g. fwd_tag:share_uuid OR prot_cnt:share_uuid (the filter guarantees one of the two prefixes)
+    is_forward_tag_toggle = cb.data.startswith(FORWARD_TAG_TOGGLE_PREFIX)
+    is_protected_content_toggle = not is_forward_tag_toggle
+    cb_share_uuid = cb.data[_FWD_TAG_PREFIX_LEN:] if is_forward_tag_toggle else cb.data[_PROT_CNT_PREFIX_LEN:]
+    if not cb_share_uuid:
         await cb.answer("Invalid callback data.", show_alert=True); return
 
     if not flow_data or flow_data.get("share_uuid") != cb_share_uuid or state != UserState.AWAITING_PROTECTION_PREFERENCES:
         await cb.answer("Session mismatch or expired. Please /start again.", show_alert=True)
         # Do not clear state here, could be another active flow. Cancel button specific to flow.
+        from handlers.start_help import send_main_menu
         await send_main_menu(client, user_id, cb, edit=True)
         return
 
     if is_forward_tag_toggle:
-        new_val = not flow_data.get("show_forward_tag", await get_user_setting(user_id, "default_show_forward_tag"))
-        update_share_flow_data(user_id, show_forward_tag=new_val)
+        new_val = not flow_data["show_forward_tag"] # Pure dict flip, defaults hydrated at flow start
+        flow_data = update_share_flow_data(user_id, show_forward_tag=new_val)
         await cb.answer(f"Forward Tag: {'Show' if new_val else 'Hide'}")
     elif is_protected_content_toggle:
-        new_val = not flow_data.get("is_protected_content", await get_user_setting(user_id, "default_protected_content"))
-        update_share_flow_data(user_id, is_protected_content=new_val)
+        new_val = not flow_data["is_protected_content"]
+        flow_data = update_share_flow_data(user_id, is_protected_content=new_val)
         await cb.answer(f"Protect Content: {'Yes' if new_val else 'No'}")
 
     # Refresh keyboard
-    # Re-fetch flow_data as it was updated
-    _, refreshed_flow_data = get_user_state(user_id) 
+    # flow_data is the updated dict returned by update_share_flow_data (no re-fetch)
     keyboard = create_protection_preferences_keyboard(
         cb_share_uuid,
-        refreshed_flow_data.get("show_forward_tag"),
-        refreshed_flow_data.get("is_protected_content")
+        flow_data.get("show_forward_tag"),
+        flow_data.get("is_protected_content")
     )
     try:
         await cb.edit_message_reply_markup(reply_markup=keyboard)
     except MessageNotModified: pass
     except Exception as e:
-        LOGGER.error(f"Error refreshing protection prefs keyboard for {user_id}: {e}")
+        LOGGER.error("Error refreshing protection prefs keyboard for %s: %s", user_id, e)
         # May need to resend the whole message if only reply_markup edit fails significantly
-        await cb.edit_message_text(cb.message.text.splitlines()[0], reply_markup=keyboard) # Try with existing text header
+        header = flow_data.get("protection_prefs_header") or cb.message.text.split("\n", 1)[0] # Header stashed when the prompt was sent
+        await cb.edit_message_text(header, reply_markup=keyboard)
 
 
 @Client.on_callback_query(filters.regex(f"^{PROTECTION_PREF_PREFIX}done:"))
@@ -604,7 +663,7 @@ async def protection_prefs_done_handler(client: Client, cb: CallbackQuery):
 
     # Current preferences are already in flow_data from toggles or defaults
     advance_share_flow_state(user_id, UserState.AWAITING_SELF_DESTRUCT_CHOICE)
-    LOGGER.info(f"User {user_id} (Share: {cb_share_uuid}) confirmed protection prefs. Asking for self-destruct.")
+    LOGGER.info("User %s (Share: %s) confirmed protection prefs. Asking for self-destruct.", user_id, cb_share_uuid)
 
     user_db = cb.user_db # from @check_user_status
     is_premium = user_db.get("is_premium", False)
@@ -622,20 +681,21 @@ async def self_destruct_selected_handler(client: Client, cb: CallbackQuery):
     state, flow_data = get_user_state(user_id)
 
     # Regex allows for digits (minutes) or "0" (special meaning like view-based/max life for premium)
-    match = re.match(rf"^{SET_DESTRUCT_PREFIX}([-\d]+):(.+)$", cb.data) 
+    match = _SET_DESTRUCT_RE.match(cb.data)
     if not match:
-        LOGGER.warning(f"Invalid callback data format for SET_DESTRUCT_PREFIX: {cb.data} by user {user_id}")
+        LOGGER.warning("Invalid callback data format for SET_DESTRUCT_PREFIX: %s by user %s", cb.data, user_id)
         await cb.answer("Invalid self-destruct selection format.", show_alert=True)
         return
     
     timer_choice_str, cb_share_uuid = match.groups()
 
     if not flow_data or flow_data.get("share_uuid") != cb_share_uuid or state != UserState.AWAITING_SELF_DESTRUCT_CHOICE:
-        LOGGER.warning(f"Session/state mismatch for SET_DESTRUCT_PREFIX. User: {user_id}, CB_UUID: {cb_share_uuid}, State: {state.name}, FlowData UUID: {flow_data.get('share_uuid')}")
+        LOGGER.warning("Session/state mismatch for SET_DESTRUCT_PREFIX. User: %s, CB_UUID: %s, State: %s, FlowData UUID: %s", user_id, cb_share_uuid, state.name, flow_data.get('share_uuid'))
         await cb.answer("⚠️ Session error or invalid state. Please /start the share process over.", show_alert=True)
         # Optionally clear state if it seems stuck for this specific flow
         if flow_data.get("share_uuid") == cb_share_uuid:
             clear_user_state(user_id) # Clear this specific stuck flow
+            from handlers.start_help import send_main_menu
             await send_main_menu(client, user_id, cb, edit=True)
         return
 
@@ -647,71 +707,36 @@ async def self_destruct_selected_handler(client: Client, cb: CallbackQuery):
         await cb.answer("Invalid timer value in selection.", show_alert=True)
         return
 
-    user_db = cb.user_db # Attached by @check_user_status decorator
-    is_premium = user_db.get("is_premium", False)
+    is_premium = cb.user_db.get("is_premium", False) # user_db attached by @check_user_status decorator
     
     # Determine the user-facing label and the actual minutes for internal use
-    destruct_info_label = ""
-    actual_destruct_minutes_for_scheduling = self_destruct_minutes # Start with user's choice
+    tier_options, tier_max_minutes, tier_max_days, tier_name = (
+        (_PREM_OPTS, _PREM_MAX_MIN, config.PREMIUM_TIER_MAX_EXPIRY_DAYS, "Premium") if is_premium
+        else (_FREE_OPTS, _FREE_MAX_MIN, config.FREE_TIER_MAX_EXPIRY_DAYS, "Free")
+    )
 
-    if not is_premium:
-        # # Free users get a default fixed expiry. Their choice is essentially just confirming this default.
-        # # Or, if you offer limited choices, validate against those.
-        # # Here, we assume free tier choice in keyboard maps to FREE_TIER_DEFAULT_EXPIRY_HOURS.
-        # actual_destruct_minutes_for_scheduling = config.FREE_TIER_DEFAULT_EXPIRY_HOURS * 60
-        # destruct_info_label = f"Default ({config.FREE_TIER_DEFAULT_EXPIRY_HOURS}h)"
-        # # Ensure the `self_destruct_minutes` chosen by free user via button is aligned with config
-        # if self_destruct_minutes != actual_destruct_minutes_for_scheduling :
-        #      LOGGER.warning(f"Free user {user_id} selected {self_destruct_minutes} min, but forced to default {actual_destruct_minutes_for_scheduling} min.")
-        #      self_destruct_minutes = actual_destruct_minutes_for_scheduling # Standardize what's stored in flow_data too
-        if self_destruct_minutes == 0: 
-            # For premium, "0 minutes" means view-based or max configured lifespan.
-            # Store 0 or a sentinel value that indicates this.
-            # The actual expiry for scheduling could be PREMIUM_TIER_MAX_EXPIRY_DAYS if no view occurs.
-            actual_destruct_minutes_for_scheduling = config.FREE_TIER_MAX_EXPIRY_DAYS * 24 * 60 # Max possible time backup
-            destruct_info_label = f"View-based (or max {config.FREE_TIER_MAX_EXPIRY_DAYS} days)"
-        elif self_destruct_minutes in config.FREE_SELF_DESTRUCT_OPTIONS:
-            # Valid premium choice from options
-            if self_destruct_minutes < 60: destruct_info_label = f"{self_destruct_minutes} min"
-            elif self_destruct_minutes % 1440 == 0: destruct_info_label = f"{self_destruct_minutes // 1440} day(s)"
-            elif self_destruct_minutes % 60 == 0: destruct_info_label = f"{self_destruct_minutes // 60} hour(s)"
-            else: destruct_info_label = f"{self_destruct_minutes // 60}h {self_destruct_minutes % 60}m"
-            actual_destruct_minutes_for_scheduling = self_destruct_minutes
-        else:
-            # Invalid choice for premium (e.g., manipulated callback) - fallback to a default
-            actual_destruct_minutes_for_scheduling = config.FREE_TIER_MAX_EXPIRY_DAYS * 24 * 60 # Max possible
-            destruct_info_label = f"Default view-based (max {config.FREE_TIER_MAX_EXPIRY_DAYS} days)"
-            LOGGER.warning(f"Free user {user_id} made invalid timer choice {self_destruct_minutes}. Defaulting.")
-            self_destruct_minutes = 0 # Store 0 in flow_data to signify the 'view-based/max' choice for premium
-    else: # Premium user
-        if self_destruct_minutes == 0: 
-            # For premium, "0 minutes" means view-based or max configured lifespan.
-            # Store 0 or a sentinel value that indicates this.
-            # The actual expiry for scheduling could be PREMIUM_TIER_MAX_EXPIRY_DAYS if no view occurs.
-            actual_destruct_minutes_for_scheduling = config.PREMIUM_TIER_MAX_EXPIRY_DAYS * 24 * 60 # Max possible time backup
-            destruct_info_label = f"View-based (or max {config.PREMIUM_TIER_MAX_EXPIRY_DAYS} days)"
-        elif self_destruct_minutes in config.PREMIUM_SELF_DESTRUCT_OPTIONS:
-            # Valid premium choice from options
-            if self_destruct_minutes < 60: destruct_info_label = f"{self_destruct_minutes} min"
-            elif self_destruct_minutes % 1440 == 0: destruct_info_label = f"{self_destruct_minutes // 1440} day(s)"
-            elif self_destruct_minutes % 60 == 0: destruct_info_label = f"{self_destruct_minutes // 60} hour(s)"
-            else: destruct_info_label = f"{self_destruct_minutes // 60}h {self_destruct_minutes % 60}m"
-            actual_destruct_minutes_for_scheduling = self_destruct_minutes
+    if self_destruct_minutes in tier_options:
+        # Valid choice from this tier's options
+        destruct_info_label = _DESTRUCT_LABELS[self_destruct_minutes]
+        actual_destruct_minutes_for_scheduling = self_destruct_minutes
+    else:
+        # "0 minutes" means view-based or max configured lifespan; anything else is invalid (e.g. manipulated callback).
+        # The actual expiry for scheduling is the tier's max lifespan if no view occurs.
+        actual_destruct_minutes_for_scheduling = tier_max_minutes # Max possible time backup
+        if self_destruct_minutes == 0:
+            destruct_info_label = f"View-based (or max {tier_max_days} days)"
         else:
-            # Invalid choice for premium (e.g., manipulated callback) - fallback to a default
-            actual_destruct_minutes_for_scheduling = config.PREMIUM_TIER_MAX_EXPIRY_DAYS * 24 * 60 # Max possible
-            destruct_info_label = f"Default view-based (max {config.PREMIUM_TIER_MAX_EXPIRY_DAYS} days)"
-            LOGGER.warning(f"Premium user {user_id} made invalid timer choice {self_destruct_minutes}. Defaulting.")
-            self_destruct_minutes = 0 # Store 0 in flow_data to signify the 'view-based/max' choice for premium
+            destruct_info_label = f"Default view-based (max {tier_max_days} days)"
+            LOGGER.warning("%s user %s made invalid timer choice %s. Defaulting.", tier_name, user_id, self_destruct_minutes)
+            self_destruct_minutes = 0 # Store 0 in flow_data to signify the 'view-based/max' choice
 
+    # Store the choice and advance to AWAITING_MAX_VIEWS_CHOICE in one write
     update_share_flow_data(user_id,
+                           new_state=UserState.AWAITING_MAX_VIEWS_CHOICE,
                            self_destruct_minutes_set=self_destruct_minutes, # The user's choice or derived standard value (e.g. 0 for premium special)
                            self_destruct_minutes_for_scheduling=actual_destruct_minutes_for_scheduling, # Actual minutes for scheduler if timer based
                            self_destruct_label=destruct_info_label)
-    
-    # Advance to AWAITING_MAX_VIEWS_CHOICE
-    advance_share_flow_state(user_id, UserState.AWAITING_MAX_VIEWS_CHOICE)
-    LOGGER.info(f"User {user_id} (Share: {cb_share_uuid}) set self-destruct: {destruct_info_label}. Actual minutes if timed: {actual_destruct_minutes_for_scheduling}. Asking for max views.")
+    LOGGER.info("User %s (Share: %s) set self-destruct: %s. Actual minutes if timed: %s. Asking for max views.", user_id, cb_share_uuid, destruct_info_label, actual_destruct_minutes_for_scheduling)
     
     keyboard_max_views = create_max_views_keyboard(cb_share_uuid, is_premium)
     prompt_text_max_views = (
@@ -719,13 +744,14 @@ async def self_destruct_selected_handler(client: Client, cb: CallbackQuery):
         "👁️ Now, how many times can this secret be viewed before it's destroyed?\n"
         "(This is independent of the time limit.)"
     )
+    await cb.answer() # Stop the client spinner before the (slower) edit
     try:
         await cb.edit_message_text(prompt_text_max_views, reply_markup=keyboard_max_views)
-        await cb.answer()
     except Exception as e:
-        LOGGER.error(f"Error editing message for max views choice (user {user_id}, share {cb_share_uuid}): {e}")
-        await cb.answer("Error proceeding to max views. Please try share again.", show_alert=True)
+        LOGGER.error("Error editing message for max views choice (user %s, share %s): %s", user_id, cb_share_uuid, e)
+        await client.send_message(user_id, "⚠️ Error proceeding to max views. Please try share again.")
         clear_user_state(user_id) # Clear state on error here to avoid being stuck
+        from handlers.start_help import send_main_menu
         await send_main_menu(client, user_id, cb, edit=True) # Go back to main menu
 
 # Add this new handler function
@@ -735,7 +761,7 @@ async def max_views_selected_handler(client: Client, cb: CallbackQuery):
     user_id = cb.from_user.id
     state, flow_data = get_user_state(user_id)
 
-    match = re.match(rf"^{SET_MAX_VIEWS_PREFIX}(\d+):(.+)$", cb.data) # \d+ for positive integers (0 for unlimited)
+    match = _SET_MAX_VIEWS_RE.match(cb.data) # \d+ for positive integers (0 for unlimited)
     if not match:
         await cb.answer("Invalid max views selection.", show_alert=True); return
     
@@ -754,18 +780,22 @@ async def max_views_selected_handler(client: Client, cb: CallbackQuery):
     is_premium = user_db.get("is_premium", False)
 
     # Validate choice against tier limits
+    tier_notice = None # Shown as an alert when the choice had to be adjusted
     if not is_premium:
         if max_views == 0 or max_views > config.FREE_TIER_MAX_ALLOWED_MAX_VIEWS:
             max_views = config.FREE_TIER_DEFAULT_MAX_VIEWS # Default for free if invalid choice
-            await cb.answer(f"Set to default {max_views} views for your tier.", show_alert=True)
+            tier_notice = f"Set to default {max_views} views for your tier."
     else: # Premium user
-        if max_views not in config.PREMIUM_MAX_VIEWS_OPTIONS and max_views != 0: # If specific options defined
+        if max_views not in _PREM_VIEW_OPTS and max_views != 0: # If specific options defined
              # Fallback if they somehow sent a value not in options.
              max_views = config.PREMIUM_TIER_DEFAULT_MAX_VIEWS
-             await cb.answer(f"Invalid option. Set to default {max_views} views.", show_alert=True)
+             tier_notice = f"Invalid option. Set to default {max_views} views."
         elif max_views == 0: # 0 for unlimited (premium only)
             pass # Will be handled in DB as e.g. -1 or a very large number, or no max_views field
 
+    # Answer once, before any state/edit work (a second answer would be rejected by Telegram)
+    await cb.answer(tier_notice, show_alert=bool(tier_notice))
+
     views_label = f"{max_views} View{'s' if max_views != 1 else ''}"
     if is_premium and max_views == 0:
         views_label = "Unlimited Views"
@@ -773,34 +803,27 @@ async def max_views_selected_handler(client: Client, cb: CallbackQuery):
         # to signify unlimited. For DB schema, maybe max_views = 0 or -1 means unlimited.
         # Let's say `max_views = 0` stored in DB means unlimited for this example.
 
-    update_share_flow_data(user_id, max_views=max_views, max_views_label=views_label)
-    advance_share_flow_state(user_id, UserState.AWAITING_CONFIRMATION)
-    LOGGER.info(f"User {user_id} (Share: {cb_share_uuid}) chose max views: {views_label} ({max_views}).")
+    current_flow_data = update_share_flow_data(user_id, new_state=UserState.AWAITING_CONFIRMATION,
+                                               max_views=max_views, max_views_label=views_label)
+    LOGGER.info("User %s (Share: %s) chose max views: %s (%s).", user_id, cb_share_uuid, views_label, max_views)
 
     # Now, build and show the confirmation text (this is from self_destruct_selected_handler, now moved here)
-    # Fetch fresh flow_data because it was just updated
-    _, current_flow_data = get_user_state(user_id) 
-
-    confirm_text = "🔒 **Confirm Your Secret Share**\n\n"
-    content_desc = "Text Message"
+    # current_flow_data is the dict returned by the update above, so no re-fetch is needed
     if current_flow_data['share_type'] == 'file':
         content_desc = f"File/Media ({current_flow_data.get('original_file_name', 'N/A')})"
-    confirm_text += f"▫️ **Content:** {content_desc}\n"
-
-    if current_flow_data['recipient_type'] == "user":
-        confirm_text += f"▫️ **Recipient:** {current_flow_data.get('recipient_display_name', 'N/A')}\n"
-    else: # link
-        confirm_text += "▫️ **Recipient:** Sharable Link\n"
-    
-    confirm_text += f"▫️ **Forward Tag:** {'Shown' if current_flow_data.get('show_forward_tag') else 'Hidden'}\n"
-    confirm_text += f"▫️ **Content Protection:** {'Enabled' if current_flow_data.get('is_protected_content') else 'Disabled'}\n"
-    confirm_text += f"▫️ **Self-Destruct Timer:** {current_flow_data.get('self_destruct_label', 'Default/View-Based')}\n"
-    confirm_text += f"▫️ **Max Views:** {views_label}\n\n" # Added Max Views
-    confirm_text += "Please confirm to send."
+    else:
+        content_desc = "Text Message"
+    confirm_text = _CONFIRM_TEMPLATE.format_map({
+        "content_desc": content_desc,
+        "recipient": current_flow_data.get('recipient_display_name', 'N/A') if current_flow_data['recipient_type'] == "user" else "Sharable Link",
+        "forward_tag": 'Shown' if current_flow_data.get('show_forward_tag') else 'Hidden',
+        "protection": 'Enabled' if current_flow_data.get('is_protected_content') else 'Disabled',
+        "timer_label": current_flow_data.get('self_destruct_label', 'Default/View-Based'),
+        "views_label": views_label,
+    })
 
     keyboard = create_confirmation_keyboard(cb_share_uuid)
     await cb.edit_message_text(confirm_text, reply_markup=keyboard)
-    await cb.answer()
 
 @Client.on_callback_query(filters.regex(f"^{SHARE_CONFIRM_PREFIX}send:") | filters.regex(f"^{SHARE_CANCEL_PREFIX}now:"))
 @check_user_status
@@ -824,20 +847,24 @@ async def confirmation_final_handler(client: Client, cb: CallbackQuery):
     # --- Process CONFIRM ---
     if state != UserState.AWAITING_CONFIRMATION:
         await cb.answer("Invalid confirmation state. Please /start over.", show_alert=True); return
-        
-    LOGGER.info(f"User {user_id} CONFIRMED share {cb_share_uuid}. Finalizing.")
+    # Claim the flow before the first await: a double-tapped Confirm (or a Cancel racing it) now finds no flow
+    # and gets "Session error" instead of finalizing the same share twice. Check and claim run without yielding,
+    # so no lock is needed; flow_data stays with this handler.
+    clear_user_state(user_id)
+
+    LOGGER.info("User %s CONFIRMED share %s. Finalizing.", user_id, cb_share_uuid)
     await cb.edit_message_text("Processing your secret... Please wait.", reply_markup=None) # Temp message
     
     # Ensure all necessary data is present
     required_keys = ['share_uuid', 'sender_id', 'share_type', 'original_message_id', 'original_chat_id',
                      'recipient_type', 'show_forward_tag', 'is_protected_content', 'self_destruct_minutes_set']
     if not all(key in flow_data for key in required_keys):
-        LOGGER.error(f"Missing critical data in flow_data for {cb_share_uuid}: {flow_data}")
+        LOGGER.error("Missing critical data in flow_data for %s: %s", cb_share_uuid, flow_data)
         await cb.message.reply_text("Critical error: Share data incomplete. Please try again.")
-        clear_user_state(user_id); return
+        return
 
 
-    access_token = str(uuid.uuid4())
+    access_token = secrets.token_urlsafe(16) # 128-bit, URL-safe: shorter view links and callback data than a UUID
     now = datetime.now(timezone.utc)
     expires_at_datetime = None
     if flow_data["self_destruct_minutes_set"] > 0 :
@@ -855,13 +882,16 @@ async def confirmation_final_handler(client: Client, cb: CallbackQuery):
         "original_file_name": flow_data.get("original_file_name"),
         "show_forward_tag": flow_data["show_forward_tag"],
         "is_protected_content": flow_data["is_protected_content"],
-        "bot_message_id_to_recipient": None, # Will be filled if applicable
+        "sender_notify_on_view": flow_data.get("sender_notify_on_view", True),
+        "bot_message_id_to_recipient": None, # Will be filled if applicable (dropped below until then)
         "status": "active", "created_at": now, "expires_at": expires_at_datetime,
         "self_destruct_after_view": True, # Standard policy for this bot
         "self_destruct_minutes_set": flow_data["self_destruct_minutes_set"],
         "view_count": 0,
         "max_views": flow_data.get("max_views", 1), # Default to 1 if not set
     }
+    # Unset optional fields are left out of the document entirely (smaller BSON, and the sparse indexes skip them)
+    db_share_doc = {k: v for k, v in db_share_doc.items() if v is not None}
 
     sent_to_recipient_msg_id = None
     final_share_message_text = ""
@@ -874,64 +904,79 @@ async def confirmation_final_handler(client: Client, cb: CallbackQuery):
                 f"✅ Secret link ready!\n\nThis one-time link will reveal your secret:\n"
                 f"{sharable_link_url}\n\nIt self-destructs based on timer or after view."
             )
-            LOGGER.info(f"Share {cb_share_uuid} created as link: {sharable_link_url}")
-        
-        elif db_share_doc["recipient_id"]: # Specific user
+            created_share_doc = await create_share(db_share_doc)
+            if not created_share_doc:
+                raise Exception("Failed to save share to DB.")
+            LOGGER.info("Share %s created as link: %s", cb_share_uuid, sharable_link_url)
+            # Its timer (if set) is the stored expires_at, enforced by the scheduler's expiry sweep
+
+        elif db_share_doc.get("recipient_id"): # Specific user
             recipient_chat_id_int = db_share_doc["recipient_id"]
             view_button_text = f"🤫 {db_share_doc['sender_mention']} shared a secret!"
             view_secret_kb = create_view_secret_button(access_token, custom_text=view_button_text)
-            
-            # This control message will itself be scheduled for deletion if share has timer
-            sent_control_msg = await client.send_message(
-                chat_id=recipient_chat_id_int,
-                text=(f"🔒 You have a new secret from {db_share_doc['sender_mention']}.\n"
-                      "Click below. It may self-destruct after view or time."),
-                reply_markup=view_secret_kb,
-                protect_content=True # The "View Secret" button message itself is protected
+
+            # The DB insert and the Telegram send are independent: run them concurrently and
+            # patch bot_message_id_to_recipient afterwards. Either side is rolled back if the other fails.
+            created_share_doc, sent_control_msg = await asyncio.gather(
+                # The Telegram send is the durable side effect here, so the insert doesn't wait on the journal
+                create_share(db_share_doc, write_concern=_RECIPIENT_SHARE_WRITE_CONCERN),
+                # This control message will itself be scheduled for deletion if share has timer
+                client.send_message(
+                    chat_id=recipient_chat_id_int,
+                    text=(f"🔒 You have a new secret from {db_share_doc['sender_mention']}.\n"
+                          "Click below. It may self-destruct after view or time."),
+                    reply_markup=view_secret_kb,
+                    protect_content=True # The "View Secret" button message itself is protected
+                ),
+                return_exceptions=True
             )
+            if isinstance(created_share_doc, BaseException):
+                created_share_doc = None
+            if isinstance(sent_control_msg, BaseException):
+                if created_share_doc: # Recipient never got the button, so drop the half-created share
+                    await delete_share_by_uuid(db_share_doc["share_uuid"])
+                    await increment_user_shares_count(user_id, -1)
+                raise sent_control_msg
+            if not created_share_doc:
+                try: await sent_control_msg.delete()
+                except Exception: pass
+                raise Exception("Failed to save share to DB.")
+
             sent_to_recipient_msg_id = sent_control_msg.id
-            db_share_doc["bot_message_id_to_recipient"] = sent_to_recipient_msg_id
             final_share_message_text = (
                 f"✅ Secret sent to {db_share_doc['recipient_display_name']}!\n"
                 f"They'll receive a button to view it."
             )
-            LOGGER.info(f"Control message for share {cb_share_uuid} sent to {recipient_chat_id_int}, msg_id: {sent_to_recipient_msg_id}")
-            
+            LOGGER.info("Control message for share %s sent to %s, msg_id: %s", cb_share_uuid, recipient_chat_id_int, sent_to_recipient_msg_id)
+
+            followups = [update_share(db_share_doc["share_uuid"], {"bot_message_id_to_recipient": sent_to_recipient_msg_id})]
             # Schedule deletion of this control message if there's an expiry timer on the share
             if expires_at_datetime:
-                 await schedule_message_deletion(
-                     client, recipient_chat_id_int, sent_to_recipient_msg_id,
-                     expires_at_datetime, db_share_doc["share_uuid"]
-                 )
+                followups.append(schedule_message_deletion(
+                    client, recipient_chat_id_int, sent_to_recipient_msg_id,
+                    expires_at_datetime, db_share_doc["share_uuid"]
+                ))
+            # The recipient already has the button; patch the message id and arm the timer off the sender's critical path
+            run_in_background(asyncio.gather(*followups), name=f"share_followups:{cb_share_uuid}")
         else:
             raise ValueError("Invalid recipient configuration for share.")
 
-        created_share_doc = await create_share(db_share_doc)
-        if not created_share_doc:
-            raise Exception("Failed to save share to DB.")
-        
-        # Schedule master expiry for link-based shares (if timer set)
-        if db_share_doc["recipient_type"] == "link" and expires_at_datetime:
-             await schedule_share_expiry(client, db_share_doc["share_uuid"], expires_at_datetime)
-            
         await cb.message.edit_text(
             final_share_message_text,
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")]])
+            reply_markup=_MAIN_MENU_MARKUP
         )
         await cb.answer("Secret processed!")
 
     except (UserIsBlocked, PeerIdInvalid) as e_user:
         err_user_msg = f"Could not send to {flow_data.get('recipient_display_name', 'user')}: "
         err_user_msg += "they blocked the bot or an invalid ID was provided."
-        LOGGER.warning(f"Share {cb_share_uuid} failed: {e_user}")
+        LOGGER.warning("Share %s failed: %s", cb_share_uuid, e_user)
         await cb.message.edit_text(f"⚠️ {err_user_msg} Share cancelled.", reply_markup=None)
-        # Note: DB record for share is NOT created in this case
+        # Note: any DB record created concurrently has already been rolled back above
     except Exception as e:
-        LOGGER.exception(f"Critical error finalizing share {cb_share_uuid} for {user_id}: {e}")
+        LOGGER.exception("Critical error finalizing share %s for %s: %s", cb_share_uuid, user_id, e)
         await cb.message.edit_text("⚠️ Critical error processing secret. Please try later.", reply_markup=None)
         # Consider deleting partial DB entry if one was made before error
-    finally:
-        clear_user_state(user_id)
 
 
 @Client.on_callback_query(filters.regex(f"^{VIEW_SECRET_PREFIX}"))
@@ -941,61 +986,48 @@ async def view_secret_button_handler(client: Client, cb: CallbackQuery):
     viewer_pyro_user = cb.from_user
     access_token = cb.data[len(VIEW_SECRET_PREFIX):] # Extract token from callback_data
 
-    LOGGER.info(f"User {viewer_id} clicked 'View Secret' button, token: {access_token}")
+    recent = _recent_views.get(access_token)
+    if recent:
+        if time.monotonic() - recent[0] < _RECENT_VIEW_TTL_SECONDS:
+            await cb.answer(recent[1], show_alert=True) # Double-click on a token we just resolved
+            return
+        del _recent_views[access_token]
+
+    LOGGER.info("User %s clicked 'View Secret' button, token: %s", viewer_id, access_token)
 
     # Use find_one_and_update to atomically check status, view limits, and update.
     # This is the most crucial part for preventing race conditions on button clicks.
     
-    # Fields to set on successful view registration (some might be conditional)
     viewer_name = viewer_pyro_user.first_name or f"User {viewer_id}"
-    set_on_view_fields = {}
-
-    # Fetch the share to check its recipient_type for potential recipient_id update
-    # This initial fetch is okay before the atomic update.
-    initial_share_check = await shares_collection.find_one({"access_token": access_token})
 
-    if not initial_share_check:
-        await cb.answer("⚠️ This secret does not exist or was already destroyed.", show_alert=True)
-        try: await cb.message.delete() # Delete the button message as it's invalid
-        except: pass
-        return
-
-    share_max_views = initial_share_check.get("max_views", 1)
-    current_view_count = initial_share_check.get("view_count", 0)
-    if share_max_views > 0 and (current_view_count + 1) >= share_max_views:
-        set_on_view_fields = {
-            "status": "viewed",  # Tentatively 'viewed', will become 'destructed' if this is the last view
-            "viewed_at": datetime.now(timezone.utc),
-            "viewed_by_user_id": viewer_id,
-            "viewed_by_display_name": viewer_name,
-            # view_count will be incremented with $inc
-        }
-    
-    # Fetch the share to check its recipient_type for potential recipient_id update
-    # This initial fetch is okay before the atomic update.
-    initial_share_check = await shares_collection.find_one({"access_token": access_token})
-
-    if not initial_share_check:
-        await cb.answer("⚠️ This secret does not exist or was already destroyed.", show_alert=True)
-        try: await cb.message.delete() # Delete the button message as it's invalid
-        except: pass
-        return
-        
-    # If it's a link being claimed by first view via button
-    if not initial_share_check.get("recipient_id") and initial_share_check.get("recipient_type") == "link":
-        set_on_view_fields["recipient_id"] = viewer_id
-        set_on_view_fields["recipient_display_name"] = viewer_name
-        LOGGER.info(f"Link share {initial_share_check['share_uuid']} (Token: {access_token}) being claimed by viewer {viewer_id} via button.")
-    # Check for specific user assignment for button click
-    elif initial_share_check.get("recipient_id") and initial_share_check.get("recipient_id") != viewer_id:
-        await cb.answer("🚫 This secret is not intended for you.", show_alert=True)
-        return
+    # Everything is decided server-side in one pipeline update (no pre-fetch, no TOCTOU window):
+    # - the final allowed view records viewed_* fields and flips status to 'destructed' in the same write
+    # - an unclaimed link share is claimed by this viewer
+    is_final_view = {"$and": [
+        {"$gt": ["$max_views", 0]},
+        {"$gte": [{"$add": ["$view_count", 1]}, "$max_views"]}
+    ]}
+    is_unclaimed_link = {"$and": [
+        {"$eq": ["$recipient_type", "link"]},
+        {"$eq": [{"$ifNull": ["$recipient_id", None]}, None]}
+    ]}
+    set_on_view_stage = {
+        "view_count": {"$add": ["$view_count", 1]},
+        "status": {"$cond": [is_final_view, "destructed", "$status"]},
+        "destructed_at": {"$cond": [is_final_view, "$$NOW", "$destructed_at"]},
+        "viewed_at": {"$cond": [is_final_view, "$$NOW", "$viewed_at"]}, # Server clock, no per-click datetime on our side
+        "viewed_by_user_id": {"$cond": [is_final_view, viewer_id, "$viewed_by_user_id"]},
+        "viewed_by_display_name": {"$cond": [is_final_view, {"$literal": viewer_name}, "$viewed_by_display_name"]},
+        "recipient_id": {"$ifNull": ["$recipient_id", viewer_id]},
+        "recipient_display_name": {"$cond": [is_unclaimed_link, {"$literal": viewer_name}, "$recipient_display_name"]},
+    }
 
-    # Atomically find active share, ensure view_count < max_views, then update status and increment view_count
+    # Atomically find active share meant for this viewer, ensure view_count < max_views, then update
     share = await shares_collection.find_one_and_update(
         filter={
             "access_token": access_token, 
             "status": "active",
+            "recipient_id": {"$in": [None, viewer_id]}, # Unclaimed link (null/missing) or this viewer
             # Check max_views: expression ensures view_count is less than max_views
             # Only apply this check if max_views is a positive number (0 means unlimited)
             "$or": [
@@ -1003,25 +1035,33 @@ async def view_secret_button_handler(client: Client, cb: CallbackQuery):
                 {"$expr": {"$lt": ["$view_count", "$max_views"]}} # view_count < max_views
             ]
         },
-        update={"$set": set_on_view_fields, "$inc": {"view_count": 1}},
+        update=[{"$set": set_on_view_stage}],
         return_document=True # PyMongo: ReturnDocument.AFTER / Motor: True
     )
 
     if not share:
         # This means the share was not 'active', or max_views was reached by a concurrent request, or token invalid
-        LOGGER.warning(f"Share (token {access_token}) not found for view by {viewer_id} or conditions not met during atomic update (e.g. already viewed/maxed).")
+        LOGGER.warning("Share (token %s) not found for view by %s or conditions not met during atomic update (e.g. already viewed/maxed).", access_token, viewer_id)
         # Re-fetch to give a more precise message if possible
-        stale_share = await shares_collection.find_one({"access_token": access_token})
+        # Diagnostic-only read: a slightly stale secondary is fine here and keeps duplicate presses off the primary
+        stale_share = await shares_collection.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED).find_one(
+            {"access_token": access_token},
+            projection={"_id": 0, "status": 1, "view_count": 1, "max_views": 1, "recipient_id": 1}
+        )
         if stale_share:
+            if stale_share.get("recipient_id") not in (None, viewer_id):
+                 await cb.answer("🚫 This secret is not intended for you.", show_alert=True)
+                 return # Keep the button: it belongs to someone else's chat context
             if stale_share.get("status") != "active":
                  msg = f"⚠️ Secret already {stale_share['status']}."
             elif stale_share.get("max_views",1) > 0 and stale_share.get("view_count",0) >= stale_share.get("max_views",1):
                  msg = "⚠️ Secret has reached its maximum view limit."
             else:
                  msg = "⚠️ Secret unavailable or view conditions not met."
-            await cb.answer(msg, show_alert=True)
         else: # Truly not found
-            await cb.answer("⚠️ Secret no longer available.", show_alert=True)
+            msg = "⚠️ Secret no longer available."
+        await cb.answer(msg, show_alert=True)
+        _remember_resolved_token(access_token, msg)
         
         if cb.message: # Attempt to delete the (now invalid) button message
             try: await cb.message.delete()
@@ -1030,222 +1070,99 @@ async def view_secret_button_handler(client: Client, cb: CallbackQuery):
 
     # If we reached here, 'share' is the *updated* document
     await cb.answer("Secret unlocked! Revealing content now...", show_alert=False) # Quick feedback
-    
-    try:
-        # Delete the "View Secret" button message itself FIRST.
-        # This control message might have its own expiry timer associated with its job_id.
-        button_message_id = cb.message.id
-        button_chat_id = cb.message.chat.id # Should be viewer_id
-        if cb.message:
-            try:
-                # Only delete the message if view_count < max_views and max_views > 0
-                view_count = share.get("view_count", 0)
-                max_views = share.get("max_views", 1)
-                print(f"View count: {view_count}, Max views: {max_views}")
-                # Only delete if: max_views > 0 AND view_count < max_views
-                # Do NOT delete if: max_views == 0 (unlimited), or view_count >= max_views
-                # Delete the button message if (max_views > 0 and view_count >= max_views)
-                # Never delete if max_views == 0 (unlimited)
-                if max_views > 0 and view_count >= max_views:
-                    await cb.message.delete()
-                    LOGGER.info(f"Deleted 'View Secret' button message {button_message_id} for share {share['share_uuid']}.")
-                # If this button message had a timer, its job should ideally be cancelled too.
-                # The job ID was `del_msg_{chat_id}_{message_id}_{share_uuid}`
-                # If share['bot_message_id_to_recipient'] was indeed this cb.message.id
-                if share.get('bot_message_id_to_recipient') == button_message_id and \
-                   share.get('recipient_id') == button_chat_id:
-                    job_id_btn_del = f"{JOB_ID_PREFIX_DELETE_MESSAGE}{button_chat_id}_{button_message_id}_{share['share_uuid']}"
-                    if cancel_scheduled_job(job_id_btn_del):
-                        LOGGER.info(f"Cancelled self-destruct job for 'View Secret' button {button_message_id}.")
-            except Exception as e_del_btn:
-                LOGGER.warning(f"Could not delete 'View Secret' button message {button_message_id}: {e_del_btn}")
-
-        # Deliver the actual content
-        source_chat_id = share["original_chat_id"]
-        source_message_id = share["original_message_id"]
-        send_kwargs = {"chat_id": viewer_id, "from_chat_id": source_chat_id, "message_id": source_message_id}
-
-        if not share.get("show_forward_tag", True): # Sender chose hide tag
-            if share.get("is_protected_content", False):
-                 send_kwargs["protect_content"] = True
-            await client.copy_message(**send_kwargs)
-        else: # Show tag
-            await client.forward_messages(
-                chat_id=send_kwargs["chat_id"],
-                from_chat_id=send_kwargs["from_chat_id"],
-                message_ids=[send_kwargs["message_id"]]
-            )
-        
-        LOGGER.info(f"Secret content {share['share_uuid']} delivered to button-click viewer {viewer_id}.")
-        
-        action_taken_message = "This secret has been viewed."
-
-        # Check if this view was the last allowed view, and finalize status
-        # 'share' document here IS the one after $inc, so its view_count is up-to-date
-        new_view_count = share.get("view_count", 0) 
-        share_max_views_limit = share.get("max_views", 1)
-
-        if share_max_views_limit > 0 and new_view_count >= share_max_views_limit:
-            LOGGER.info(f"Share {share['share_uuid']} reached max_views ({new_view_count}/{share_max_views_limit}) with this button click.")
-            final_status_updates = {"status": "destructed"} # Mark as fully destructed
-            if not share.get("destructed_at"): # Set only if not already (e.g. by timer job racing)
-                final_status_updates["destructed_at"] = datetime.now(timezone.utc)
-            await update_share(share["share_uuid"], final_status_updates)
-            action_taken_message = "This secret has reached its view limit and is now destroyed."
-            
-            # Cleanup the temp message from "me" chat if it's an inline share that just got its final view
-            if share.get("share_type") == "message_inline" and share.get("original_chat_id") == await client.get_me().id:
-                try: await client.delete_messages(share["original_chat_id"], share["original_message_id"])
-                except Exception as e_del_tmp: LOGGER.warning(f"Could not delete inline temp msg {share['original_message_id']} after final button view: {e_del_tmp}")
-
-
-        # Notify sender (using the now up-to-date 'share' document)
-        sender_id = share.get("sender_id")
-        if sender_id and await get_user_setting(sender_id, "notify_on_view"):
-            try:
-                shared_with_text = f"user {share.get('recipient_display_name', viewer_name)}" \
-                                   if share.get("recipient_type") == "user" else "link viewer (via button)"
-                await client.send_message(
-                    sender_id,
-                    f"ℹ️ Your secret (ID: ...{share['share_uuid'][-6:]}, shared with {shared_with_text}) "
-                    f"was just viewed by {viewer_name} (`{viewer_id}`). Status: {share.get('status')}."
-                )
-            except Exception as e_notify: 
-                LOGGER.warning(f"Failed to send view notification for {share['share_uuid']} (button view): {e_notify}")
-        
-        # Cancel general link expiry if it was a link share and it just got destructed due to max views
-        if share.get("recipient_type") == "link" and share.get("expires_at") and share.get("status") == "destructed":
-            job_id_link_exp = f"{JOB_ID_PREFIX_EXPIRE_SHARE}{share['share_uuid']}"
-            if cancel_scheduled_job(job_id_link_exp):
-                 LOGGER.info(f"Cancelled link expiry job for {share['share_uuid']} as it was destructed by max_views.")
-        
-        # Optional: Send a small confirmation text to the viewer in chat AFTER content revealed.
-        # await client.send_message(viewer_id, action_taken_message) 
-
-    except Exception as e:
-        LOGGER.exception(f"Error during secret delivery/finalization for {access_token} (button view) by {viewer_id}: {e}")
-        # Don't cb.answer() again if already answered "Revealing content" unless it failed before that.
-        # Bot has already ack'd the button. If delivery fails, viewer just doesn't get content.
-        # We could try to send an error message to the viewer's chat:
-        await client.send_message(viewer_id, "📛 An error occurred while trying to show you the secret content.")
-
-
-# --- Inline Query Handler ---
-@Client.on_inline_query(filters.regex(r"^(?!\s*$).+")) # Matches non-empty queries
-@check_user_status # Inline queries also have from_user
-async def inline_share_handler(client: Client, inline_query: InlineQuery):
-    user_id = inline_query.from_user.id
-    query_text = inline_query.query.strip()
-    
-    if not query_text: # Should be caught by regex but double check
-        await inline_query.answer([], cache_time=5)
-        return
+    if share.get("status") != "active": # That was the final allowed view
+        _remember_resolved_token(access_token, "⚠️ Secret already viewed.")
+    # The view is recorded; delivery and follow-ups run off the update worker so it is free for the next click
+    run_in_background(
+        _deliver_button_view(client, cb, share, viewer_id, viewer_name, access_token),
+        name=f"button_view:{share['share_uuid']}"
+    )
 
-    LOGGER.info(f"User {user_id} initiated inline query: '{query_text[:50]}...'")
 
-    # Create a temporary message in bot's PM with itself to get message_id (Pyrogram trick)
-    # This message will contain the text user wants to share.
-    # print(inline_query)  # Avoid printing Pyrogram objects directly; use logging if needed
+async def _delete_view_button(cb: CallbackQuery, share: dict):
+    # Delete the "View Secret" button message once the share has no views left.
+    # This control message might have its own expiry timer associated with its job_id.
+    button_message_id = cb.message.id
+    button_chat_id = cb.message.chat.id # Should be viewer_id
     try:
-        temp_bot_message = await client.send_message(user_id, query_text)
-    except Exception as e:
-        LOGGER.error(f"Failed to send temporary message to self for inline query from {user_id}: {e}")
-        # Optionally, inform user via a result that it failed, or just return no results.
-        await inline_query.answer(
-            results=[
-                InlineQueryResultArticle(
-                    title="Error Preparing Share",
-                    description="Could not temporarily store your secret. Please try again or use normal share.",
-                    input_message_content=InputTextMessageContent("Error creating inline secret.")
-                )
-            ],
-            cache_time=10
-        )
+        # Never delete if max_views == 0 (unlimited)
+        max_views = share.get("max_views", 1)
+        if max_views > 0 and share.get("view_count", 0) >= max_views:
+            await cb.message.delete()
+            LOGGER.info("Deleted 'View Secret' button message %s for share %s.", button_message_id, share['share_uuid'])
+        # If this button message had a timer, its job should be cancelled too.
+        # The job ID was `del_msg_{chat_id}_{message_id}_{share_uuid}`
+        if share.get('bot_message_id_to_recipient') == button_message_id and \
+           share.get('recipient_id') == button_chat_id:
+            job_id_btn_del = f"{JOB_ID_PREFIX_DELETE_MESSAGE}{button_chat_id}_{button_message_id}_{share['share_uuid']}"
+            # remove_job hits the (sync) Mongo job store, keep it off the event loop
+            if await asyncio.to_thread(cancel_scheduled_job, job_id_btn_del):
+                LOGGER.info("Cancelled self-destruct job for 'View Secret' button %s.", button_message_id)
+    except Exception as e_del_btn:
+        LOGGER.warning("Could not delete 'View Secret' button message %s: %s", button_message_id, e_del_btn)
+
+
+async def _send_share_content(client: Client, share: dict, viewer_id: int):
+    # Single delivery call site for both the deep link and the View Secret button
+    source_message_id = share.get("original_message_id")
+    protect = share.get("is_protected_content", False)
+    started = time.perf_counter()
+    if source_message_id is None: # Inline text share: no carrier message, send the stored text
+        await client.send_message(viewer_id, share["content_text"], protect_content=protect)
+    elif not share.get("show_forward_tag", True): # Sender chose hide tag
+        # original_chat_id/original_message_id point to the sender's PM with the bot
+        await client.copy_message(viewer_id, share["original_chat_id"], source_message_id, protect_content=protect)
+    else: # Show tag. Bot cannot force protect on forward of an unprotected message.
+        await client.forward_messages(viewer_id, share["original_chat_id"], [source_message_id])
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("Delivered share %s to %s in %.1f ms.", share.get('share_uuid'), viewer_id, (time.perf_counter() - started) * 1000)
+
+
+async def _finalize_button_view(client: Client, share: dict):
+    # The view update already marked the share destructed; only the click that did so runs the cleanup
+    if not _view_destructed(share):
         return
+    LOGGER.info("Share %s reached max_views (%s/%s) with this button click.", share['share_uuid'], share.get('view_count', 0), share.get('max_views', 1))
 
-    share_uuid = str(uuid.uuid4())
-    access_token = str(uuid.uuid4()) # Different token for inline view
-    
-    # Get user's default protection settings
-    user_prefs_show_tag = await get_user_setting(user_id, "default_show_forward_tag")
-    user_prefs_protect_content = await get_user_setting(user_id, "default_protected_content")
-
-    db_save_success = await save_inline_share_content(
-        sender_id=user_id,
-        text_content=query_text, # Or use temp_bot_message.text for consistency
-        share_uuid=share_uuid,
-        access_token=access_token,
-        original_chat_id=temp_bot_message.chat.id, # "me"
-        original_message_id=temp_bot_message.id,
-        is_protected=user_prefs_protect_content,
-        show_forward_tag=user_prefs_show_tag # For inline, "show_forward_tag:False" means copy content when viewed
-    )
+    # Cleanup the temp message from "me" chat if it's an inline share that just got its final view
+    if share.get("share_type") == "message_inline" and share.get("original_chat_id") == client.me.id:
+        try: await client.delete_messages(share["original_chat_id"], share["original_message_id"])
+        except Exception as e_del_tmp: LOGGER.warning("Could not delete inline temp msg %s after final button view: %s", share['original_message_id'], e_del_tmp)
 
-    if not db_save_success:
-        LOGGER.error(f"Failed to save inline share content to DB for user {user_id}, share {share_uuid}.")
-        await temp_bot_message.delete() # Clean up temp message
-        # Inform user via result that DB save failed
-        # ... (similar error result as above)
-        return
-    
-    bot_username = client.me.username
-    view_link = f"https://t.me/{bot_username}?start=viewsecret_{access_token}"
-
-    results = [
-        InlineQueryResultArticle(
-            id=share_uuid, # Must be unique string
-            title="🤫 Share this secret text",
-            description=f"'{query_text[:30]}...' (One-time view link)",
-            input_message_content=InputTextMessageContent(
-                message_text=f"🤫 A secret has been shared with you!\n\n"
-                             f"Click to view (one-time): {view_link}\n\n"
-                             f"Shared by: {inline_query.from_user.mention}",
-                disable_web_page_preview=True
-            ),
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("👁️ View Secret (One-Time)", url=view_link)
-            ]])
-            # thumb_url="URL_TO_A_SECRET_ICON.PNG" # Optional: Icon for the result
-        )
-    ]
-    
+
+async def _notify_sender_of_button_view(client: Client, share: dict, viewer_id: int, viewer_name: str):
+    sender_id = share.get("sender_id")
     try:
-        await inline_query.answer(
-            results=results,
-            cache_time=config.INLINE_QUERY_CACHE_TIME, # Use configured cache time
-            is_personal=True # Results are specific to this user's input
-        )
-        LOGGER.info(f"Sent inline result for share {share_uuid} to user {user_id}")
-    except QueryIdInvalid:
-        LOGGER.warning(f"Query ID invalid for inline query from {user_id}. User might have typed too fast or cleared.")
-        await temp_bot_message.delete() # Clean up if answer fails critically
-    except Exception as e:
-        LOGGER.error(f"Error answering inline query for {user_id}: {e}")
-        await temp_bot_message.delete()
+        if sender_id and share.get("sender_notify_on_view", True): # Copied from the sender's settings at creation
+            shared_with_text = f"user {share.get('recipient_display_name', viewer_name)}" \
+                               if share.get("recipient_type") == "user" else "link viewer (via button)"
+            short_id = share['share_uuid'][-6:]
+            _queue_view_notification(
+                client, sender_id,
+                f"ℹ️ Your secret (ID: ...{short_id}, shared with {shared_with_text}) "
+                f"was just viewed by {viewer_name} (`{viewer_id}`). Status: {share.get('status')}.",
+                f"...{short_id} by {viewer_name} (`{viewer_id}`), status {share.get('status')}"
+            )
+    except Exception as e_notify:
+        LOGGER.warning("Failed to queue view notification for %s (button view): %s", share['share_uuid'], e_notify)
 
 
-# --- Generic Cancel Button Handler (ensure it's after specific prefix handlers if using general regex) ---
-@Client.on_callback_query(filters.regex(f"^{SHARE_CANCEL_PREFIX}now:"))
-@check_user_status
-async def generic_share_cancel_handler(client: Client, cb: CallbackQuery):
-    user_id = cb.from_user.id
-    state, flow_data = get_user_state(user_id)
-    
-    # Try to get share_uuid from callback data first, then from state
-    cb_share_uuid = None
-    try: cb_share_uuid = cb.data.split(":",2)[2]
-    except IndexError: pass
-
-    active_flow_data = None
-    if cb_share_uuid and flow_data.get("share_uuid") == cb_share_uuid:
-        active_flow_data = flow_data
-    elif not cb_share_uuid and "share_uuid" in flow_data and state != UserState.DEFAULT: # Fallback if no UUID in cb data but user is in a flow
-        active_flow_data = flow_data
-    else: # Mismatch or no flow data for this user
-        LOGGER.warning(f"User {user_id} tried to cancel, but no matching share flow found. Callback UUID: {cb_share_uuid}, State data: {flow_data}")
-        await cb.answer("No active share process to cancel or session expired.", show_alert=True)
-        # If a message was edited, send a new main menu
-        if cb.message: await send_main_menu(client, user_id, cb.message, edit=False)
+async def _deliver_button_view(client: Client, cb: CallbackQuery, share: dict, viewer_id: int, viewer_name: str, access_token: str):
+    # Deleting the button is housekeeping the viewer doesn't wait on: it runs detached (and logs its own failures)
+    # so nothing below, not even the follow-ups, is held up by it.
+    if cb.message:
+        run_in_background(_delete_view_button(cb, share), name=f"view_button_delete:{share['share_uuid']}")
+    try:
+        await _send_share_content(client, share, viewer_id)
+    except Exception as e:
+        LOGGER.error("Error delivering secret %s (button view) to %s: %r", access_token, viewer_id, e)
+        # Bot has already ack'd the button. If delivery fails, tell the viewer in chat.
+        try: await client.send_message(viewer_id, "📛 An error occurred while trying to show you the secret content.")
+        except Exception: pass
         return
 
-    await cancel_current_share_flow(client, user_id, cb, active_flow_data)
\ No newline at end of file
+    LOGGER.info("Secret content %s delivered to button-click viewer %s.", share['share_uuid'], viewer_id)
+
+    # Follow-ups only make sense once the content is out. Both are quick: the notification is only queued
+    await _finalize_button_view(client, share)
+    await _notify_sender_of_button_view(client, share, viewer_id, viewer_name)
@@ -1,18 +1,24 @@
+import asyncio
 import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional, Tuple
 from pyrogram import Client, filters
 from pyrogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, User as PyrogramUser
 from pyrogram.errors import MessageNotModified
 
 from config import OWNER_ID, DEFAULT_USER_SETTINGS, PREMIUM_TIER_MAX_FILE_SIZE_MB, FREE_TIER_MAX_FILE_SIZE_MB, PREMIUM_SELF_DESTRUCT_OPTIONS
-from db import get_user, add_user # add_user for new users, get_user for fetching existing
+from db import add_user # add_user for users missing from the DB
 from utils.keyboards import (
     create_main_menu_keyboard, create_help_keyboard,
     MAIN_MENU_CALLBACK, HELP_CALLBACK, MY_SECRETS_CALLBACK,
     SETTINGS_CALLBACK, SHARE_SECRET_CALLBACK, ADMIN_PANEL_CALLBACK, PREMIUM_CALLBACK
 )
 import config
-from utils.decorators import check_user_status
+from utils.decorators import check_user_status, async_ttl_cache
 from utils.user_states import clear_user_state
+from utils.user_writer import get_user_or_pending
 
 LOGGER = logging.getLogger(__name__)
 
@@ -70,10 +76,148 @@ Upgrade to unlock these great features:
 Contact the bot owner ({owner_mention}) to inquire about Premium access.
 """
 
+def _format_timer_label(minutes: int) -> str:
+    if minutes == 0: return "View-based/Max"
+    if minutes < 60: return f"{minutes} min"
+    if minutes % 1440 == 0: return f"{minutes // 1440} day(s)"
+    if minutes % 60 == 0: return f"{minutes // 60} hour(s)"
+    return f"{minutes // 60}h{minutes % 60}m"
+
+_TIMER_OPTIONS_STR = ", ".join(_format_timer_label(m) for m in PREMIUM_SELF_DESTRUCT_OPTIONS) or "various options"
+
+# Everything but the per-process bot username and the owner mention is constant, so bind it once at import.
+# The two remaining fields are passed through as literal placeholders for the second .format().
+_PREMIUM_TEXT_PREBOUND = PREMIUM_INFO_MESSAGE_TEMPLATE.format(
+    bot_username="{bot_username}",
+    owner_mention="{owner_mention}",
+    premium_max_size=PREMIUM_TIER_MAX_FILE_SIZE_MB,
+    free_max_size=FREE_TIER_MAX_FILE_SIZE_MB,
+    timer_options_str=_TIMER_OPTIONS_STR,
+    premium_concurrent=config.MAX_CONCURRENT_SHARES_PREMIUM,
+    free_concurrent=config.MAX_CONCURRENT_SHARES_FREE
+)
+
+# The owner's mention rarely changes; avoid a get_users round trip on every premium click
+_OWNER_MENTION_TTL_SECONDS = 6 * 60 * 60
+_owner_mention_cache: Optional[Tuple[float, str]] = None # (monotonic time fetched, mention)
+
+async def _get_owner_mention(client: Client) -> str:
+    global _owner_mention_cache
+    if _owner_mention_cache and time.monotonic() - _owner_mention_cache[0] < _OWNER_MENTION_TTL_SECONDS:
+        return _owner_mention_cache[1]
+    try:
+        owner_user = await client.get_users(OWNER_ID)
+    except Exception as e:
+        LOGGER.warning("Could not fetch owner %s for premium info: %s", OWNER_ID, e)
+        return f"ID {OWNER_ID}" # Not cached, retried on the next click
+    mention = owner_user.mention if owner_user else f"ID {OWNER_ID}"
+    _owner_mention_cache = (time.monotonic(), mention)
+    return mention
+
+# Entry handlers of sibling modules. Those modules import this one, so they are bound on first dispatch
+# (once) instead of with an import statement inside every branch.
+_process_view_secret_deep_link = None
+_initiate_share_handler = None
+_settings_entry_handler = None
+_my_secrets_entry_handler = None
+
+def _resolve_entry_handlers():
+    global _process_view_secret_deep_link, _initiate_share_handler, _settings_entry_handler, _my_secrets_entry_handler
+    from handlers.share_flow import process_view_secret_deep_link, initiate_share_handler
+    from handlers.settings import settings_entry_handler
+    from handlers.my_secrets import my_secrets_entry_handler
+    _process_view_secret_deep_link = process_view_secret_deep_link
+    _initiate_share_handler = initiate_share_handler
+    _settings_entry_handler = settings_entry_handler
+    _my_secrets_entry_handler = my_secrets_entry_handler
+
+# bot_username is fixed for the process lifetime, so these are bound on first use
+_help_text: Optional[str] = None
+_start_template_prebound: Optional[str] = None # Only {user_mention} left to fill
+
+def _get_help_text(client: Client) -> str:
+    global _help_text
+    if _help_text is None:
+        _help_text = HELP_MESSAGE.format(bot_username=client.me.username)
+    return _help_text
+
+def _get_start_template(client: Client) -> str:
+    global _start_template_prebound
+    if _start_template_prebound is None:
+        _start_template_prebound = START_MESSAGE_TEMPLATE.replace("{bot_username}", client.me.username)
+    return _start_template_prebound
+
+# Last (text, markup) this module rendered into each menu message, with the edit_date Telegram reported.
+# A click on the view that is already showing is answered locally instead of paying for a MessageNotModified.
+# The edit_date must still match, so an edit by any other handler in between invalidates the entry.
+_LAST_RENDER_MAX = 10_000
+_last_render: "OrderedDict[Tuple[int, int], Tuple[int, Optional[object]]]" = OrderedDict()
+
+def _render_digest(text: str, markup: InlineKeyboardMarkup) -> int:
+    return hash((text, str(markup)))
+
+def _already_rendered(message: Message, text: str, markup: InlineKeyboardMarkup) -> bool:
+    entry = _last_render.get((message.chat.id, message.id))
+    return entry is not None and entry == (_render_digest(text, markup), message.edit_date)
+
+def _remember_render(message, text: str, markup: InlineKeyboardMarkup):
+    if not isinstance(message, Message): # Edits of inline messages return a bool
+        return
+    key = (message.chat.id, message.id)
+    _last_render[key] = (_render_digest(text, markup), message.edit_date)
+    _last_render.move_to_end(key)
+    if len(_last_render) > _LAST_RENDER_MAX:
+        _last_render.popitem(last=False)
+
+# One lock per menu message, so concurrent clicks on it can't both fall back to resend + delete.
+# Weak values: a lock disappears once no coroutine is holding or waiting on it.
+_edit_locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+_replaced_messages: "OrderedDict[Tuple[int, int], None]" = OrderedDict() # Menu messages already resent + deleted
+
+def _edit_lock_for(key: Tuple[int, int]) -> asyncio.Lock:
+    lock = _edit_locks.get(key)
+    if lock is None:
+        lock = _edit_locks[key] = asyncio.Lock()
+    return lock
+
+async def _edit_or_resend(client: Client, user_id: int, message: Message, text: str,
+                          markup: InlineKeyboardMarkup, delete_old: bool = True) -> bool:
+    """Edits message in place; if that fails, sends text as a new message and (optionally) deletes the old one.
+    Returns True if edited. MessageNotModified is left to the caller."""
+    key = (message.chat.id, message.id)
+    async with _edit_lock_for(key):
+        if key in _replaced_messages: # A concurrent click already replaced this message
+            return False
+        try:
+            edited = await message.edit_text(text, reply_markup=markup, disable_web_page_preview=True)
+            _remember_render(edited, text, markup)
+            return True
+        except MessageNotModified:
+            raise
+        except Exception as e_edit: # If edit fails, send new.
+            LOGGER.warning("Failed to edit message %s for %s, sending new: %s", message.id, user_id, e_edit)
+            await client.send_message(user_id, text, reply_markup=markup, disable_web_page_preview=True)
+            if delete_old:
+                _replaced_messages[key] = None
+                if len(_replaced_messages) > _LAST_RENDER_MAX:
+                    _replaced_messages.popitem(last=False)
+                try: await message.delete()
+                except Exception: pass
+            return False
+
+@async_ttl_cache(ttl=30, maxsize=4096)
+async def get_user_menu_flags(user_id: int) -> Optional[Tuple[bool, bool]]:
+    """(is_premium, is_sudo) for picking the main menu keyboard, cached briefly for repeated navigation.
+    Call get_user_menu_flags.invalidate(user_id) after changing either flag."""
+    user_db = await get_user_or_pending(user_id) # First contact: served from the writer queue until it lands
+    if not user_db:
+        return None
+    return user_db.get("is_premium", False), user_db.get("is_sudo", False)
+
 async def send_main_menu(client: Client, user_id: int, trigger_update: Message | CallbackQuery, edit: bool = False):
-    user_db = await get_user(user_id) # Relies on get_user to handle defaults & status
-    if not user_db: # Should ideally not happen if check_user_status is used
-        LOGGER.error(f"User {user_id} not found in DB for send_main_menu. Attempting to add.")
+    flags = await get_user_menu_flags(user_id)
+    if not flags: # Should ideally not happen if check_user_status is used
+        LOGGER.error("User %s not found in DB for send_main_menu. Attempting to add.", user_id)
         # Try to get pyrogram user object from trigger_update for first_name/username
         pyro_user_obj = trigger_update.from_user if hasattr(trigger_update, 'from_user') else None
         user_db = await add_user(
@@ -86,14 +230,13 @@ async def send_main_menu(client: Client, user_id: int, trigger_update: Message |
             if isinstance(trigger_update, Message): await trigger_update.reply_text(err_text)
             elif isinstance(trigger_update, CallbackQuery): await trigger_update.answer(err_text, show_alert=True)
             return
+        flags = user_db.get("is_premium", False), user_db.get("is_sudo", False)
 
-    is_premium = user_db.get("is_premium", False)
-    is_sudo = user_db.get("is_sudo", False) # Check DB sudo status
+    is_premium, is_sudo = flags # DB premium/sudo status
 
-    keyboard = create_main_menu_keyboard(is_premium, is_sudo)
-    start_text = START_MESSAGE_TEMPLATE.format(
-        user_mention=trigger_update.from_user.mention if hasattr(trigger_update, 'from_user') and trigger_update.from_user else "User",
-        bot_username=client.me.username
+    keyboard = create_main_menu_keyboard(bool(is_premium), bool(is_sudo))
+    start_text = _get_start_template(client).format(
+        user_mention=trigger_update.from_user.mention if hasattr(trigger_update, 'from_user') and trigger_update.from_user else "User"
     )
 
     try:
@@ -107,24 +250,24 @@ async def send_main_menu(client: Client, user_id: int, trigger_update: Message |
                  if isinstance(trigger_update, CallbackQuery): await trigger_update.answer()
                  return
 
+            if isinstance(trigger_update, CallbackQuery) and _already_rendered(target_message, start_text, keyboard):
+                await trigger_update.answer("Already on the main menu.")
+                return
+
             try:
-                await target_message.edit_text(start_text, reply_markup=keyboard, disable_web_page_preview=True)
+                # Only a callback's button message is ours to delete if the edit fails
+                await _edit_or_resend(client, user_id, target_message, start_text, keyboard,
+                                      delete_old=isinstance(trigger_update, CallbackQuery))
             except MessageNotModified:
                 if isinstance(trigger_update, CallbackQuery): await trigger_update.answer("Already on the main menu.")
-            except Exception as e_edit: # If edit fails, send new.
-                 LOGGER.warning(f"Failed to edit main menu for {user_id}, sending new: {e_edit}")
-                 await client.send_message(user_id, start_text, reply_markup=keyboard, disable_web_page_preview=True)
-                 # Optionally try to delete the old message with buttons if it was a callback
-                 if isinstance(trigger_update, CallbackQuery) and trigger_update.message:
-                      try: await trigger_update.message.delete()
-                      except: pass
+                return
             if isinstance(trigger_update, CallbackQuery): await trigger_update.answer()
         else: # Fallback if logic above missed a case
              await client.send_message(user_id, start_text, reply_markup=keyboard, disable_web_page_preview=True)
              if isinstance(trigger_update, CallbackQuery): await trigger_update.answer()
 
     except Exception as e:
-        LOGGER.error(f"Error sending/editing main menu for {user_id}: {e}")
+        LOGGER.error("Error sending/editing main menu for %s: %s", user_id, e)
         if isinstance(trigger_update, CallbackQuery):
             try: await trigger_update.answer("Error displaying menu.", show_alert=True)
             except: pass
@@ -134,21 +277,20 @@ async def send_main_menu(client: Client, user_id: int, trigger_update: Message |
 @check_user_status # Ensures user is in DB and not banned; attaches user_db
 async def start_command_handler(client: Client, message: Message):
     user_id = message.from_user.id
-    LOGGER.info(f"User {user_id} ({message.from_user.first_name}) sent /start command.")
+    LOGGER.info("User %s (%s) sent /start command.", user_id, message.from_user.first_name)
     clear_user_state(user_id) # Clear any pending multi-step operation
 
     if len(message.command) > 1:
         payload = message.command[1]
         if payload.startswith("viewsecret_"):
             # Defer to the share_flow handler for deep links
-            # This is imported locally to avoid circular dependencies at module load time.
-            from handlers.share_flow import process_view_secret_deep_link
-            LOGGER.info(f"User {user_id} started with deep link payload: {payload}. Passing to deep link handler.")
-            await process_view_secret_deep_link(client, message)
+            if _process_view_secret_deep_link is None: _resolve_entry_handlers()
+            LOGGER.info("User %s started with deep link payload: %s. Passing to deep link handler.", user_id, payload)
+            await _process_view_secret_deep_link(client, message)
             return # The deep link handler will manage the response.
         elif payload.startswith("inline_"):
             # Future: Handle other deep links, e.g., for inline content generation or confirmation
-            LOGGER.info(f"User {user_id} started with inline-related deep link: {payload}")
+            LOGGER.info("User %s started with inline-related deep link: %s", user_id, payload)
             # Placeholder: await process_inline_deep_link(client, message, payload)
             pass
 
@@ -159,117 +301,90 @@ async def start_command_handler(client: Client, message: Message):
 @Client.on_message(filters.command("help") & filters.private)
 @check_user_status
 async def help_command_handler(client: Client, message: Message):
-    LOGGER.info(f"User {message.from_user.id} requested /help.")
+    LOGGER.info("User %s requested /help.", message.from_user.id)
     clear_user_state(message.from_user.id)
     keyboard = create_help_keyboard()
-    help_text = HELP_MESSAGE.format(bot_username=client.me.username)
+    help_text = _get_help_text(client)
     await message.reply_text(help_text, reply_markup=keyboard, disable_web_page_preview=True)
 
+_BACK_TO_MAIN_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")]])
+
+async def _menu_start(client: Client, cb: CallbackQuery):
+    clear_user_state(cb.from_user.id)
+    await send_main_menu(client, cb.from_user.id, cb, edit=True)
+
+async def _menu_premium(client: Client, cb: CallbackQuery):
+    premium_text = _PREMIUM_TEXT_PREBOUND.format(
+        bot_username=client.me.username,
+        owner_mention=await _get_owner_mention(client)
+    )
+    keyboard = _BACK_TO_MAIN_MARKUP
+    if cb.message and _already_rendered(cb.message, premium_text, keyboard):
+        await cb.answer(); return
+    try:
+        edited_in_place = await _edit_or_resend(client, cb.from_user.id, cb.message, premium_text, keyboard)
+    except MessageNotModified:
+        edited_in_place = True
+    await cb.answer(None if edited_in_place else "Premium info loaded.")
+
+async def _menu_share(client: Client, cb: CallbackQuery):
+    LOGGER.info("Share callback received from %s. Deferring to share_handler.", cb.from_user.id)
+    if _initiate_share_handler is None: _resolve_entry_handlers()
+    await _initiate_share_handler(client, cb)
+    await cb.answer("Loading Share Options...") # Acknowledge and let dedicated handler take over
+
+async def _menu_settings(client: Client, cb: CallbackQuery):
+    LOGGER.info("Settings callback received from %s. Deferring to settings_handler.", cb.from_user.id)
+    if _settings_entry_handler is None: _resolve_entry_handlers()
+    await _settings_entry_handler(client, cb)
+    await cb.answer("Loading Settings...") # Acknowledge and let dedicated handler take over
+
+async def _menu_help(client: Client, cb: CallbackQuery):
+    clear_user_state(cb.from_user.id)
+    keyboard = create_help_keyboard()
+    help_text = _get_help_text(client)
+    if cb.message and _already_rendered(cb.message, help_text, keyboard):
+        await cb.answer(); return
+    try:
+        edited_in_place = await _edit_or_resend(client, cb.from_user.id, cb.message, help_text, keyboard)
+    except MessageNotModified:
+        edited_in_place = True
+    await cb.answer(None if edited_in_place else "Help section loaded.")
+
+async def _menu_my_secrets(client: Client, cb: CallbackQuery):
+    LOGGER.info("My Secrets callback received from %s. Deferring to my_secrets_handler.", cb.from_user.id)
+    if _my_secrets_entry_handler is None: _resolve_entry_handlers()
+    await _my_secrets_entry_handler(client, cb)
+    await cb.answer("Loading Secret Lists...")
+
+async def _menu_unknown(client: Client, cb: CallbackQuery):
+    await cb.answer("Action not implemented yet.", show_alert=True)
+
+# "main:<action>" -> branch
+_MAIN_MENU_ACTIONS = {
+    "start": _menu_start,
+    "premium": _menu_premium,
+    "share": _menu_share,
+    "settings": _menu_settings,
+    "help": _menu_help,
+    "my_secrets": _menu_my_secrets,
+}
+
 @Client.on_callback_query(filters.regex(f"^{MAIN_MENU_CALLBACK}|^({HELP_CALLBACK})$"))
 @check_user_status # Important for all callback handlers accessing user data
 async def main_menu_navigation_handler(client: Client, cb: CallbackQuery):
-    user_id = cb.from_user.id
     action_full = cb.data
-    action_prefix = action_full.split(":")[0] + ":" if ":" in action_full else action_full
-
-    LOGGER.debug(f"Main menu navigation: '{action_full}' by User {user_id}")
-
-    if action_prefix == MAIN_MENU_CALLBACK:
-        action = action_full.split(":")[1] if len(action_full.split(":")) > 1 else ""
-        if action == "start":
-            clear_user_state(user_id)
-            await send_main_menu(client, user_id, cb, edit=True)
-        elif action == "premium":
-            owner_user = await client.get_users(OWNER_ID)
-            owner_mention_str = owner_user.mention if owner_user else f"ID {OWNER_ID}"
-
-            timer_options_str_list = []
-            for minutes in PREMIUM_SELF_DESTRUCT_OPTIONS:
-                if minutes == 0: label = "View-based/Max"
-                elif minutes < 60: label = f"{minutes} min"
-                elif minutes % 1440 == 0 : label = f"{minutes // 1440} day(s)"
-                elif minutes % 60 == 0 : label = f"{minutes // 60} hour(s)"
-                else: hours = minutes // 60; rem_minutes = minutes % 60; label = f"{hours}h{rem_minutes}m"
-                timer_options_str_list.append(label)
-
-            premium_text = PREMIUM_INFO_MESSAGE_TEMPLATE.format(
-                bot_username=client.me.username,
-                premium_max_size=PREMIUM_TIER_MAX_FILE_SIZE_MB,
-                free_max_size=FREE_TIER_MAX_FILE_SIZE_MB,
-                timer_options_str=", ".join(timer_options_str_list) if timer_options_str_list else "various options",
-                owner_mention=owner_mention_str,
-                premium_concurrent=config.MAX_CONCURRENT_SHARES_PREMIUM,
-                free_concurrent=config.MAX_CONCURRENT_SHARES_FREE
-            )
-            keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")]])
-            try:
-                await cb.edit_message_text(premium_text, reply_markup=keyboard, disable_web_page_preview=True)
-                await cb.answer()
-            except Exception as e: # Fallback if edit fails
-                LOGGER.warning(f"Failed to edit premium info, sending new: {e}")
-                await cb.message.reply_text(premium_text, reply_markup=keyboard, disable_web_page_preview=True)
-                if cb.message:
-                    try:
-                        await cb.message.delete()
-                    except:
-                        pass
-                await cb.answer("Premium info loaded.")
-        elif action == "share":
-            LOGGER.info(f"Settings callback received from {user_id}. Deferring to share_handler.")
-            from handlers.share_flow import initiate_share_handler
-            await initiate_share_handler(client, cb)
-            await cb.answer("Loading Share Options...") # Acknowledge and let dedicated handler take over
-        elif action == "settings": # Matches "main:settings"
-            LOGGER.info(f"Settings callback received from {user_id}. Deferring to settings_handler.")
-            from handlers.settings import settings_entry_handler # Avoid direct import cycle
-            await settings_entry_handler(client, cb)
-            await cb.answer("Loading Settings...") # Acknowledge and let dedicated handler take over
-        elif action == "help": # Matches "main:help"
-            clear_user_state(user_id)
-            keyboard = create_help_keyboard()
-            help_text = HELP_MESSAGE.format(bot_username=client.me.username)
-            try:
-                await cb.edit_message_text(help_text, reply_markup=keyboard, disable_web_page_preview=True)
-                await cb.answer()
-            except Exception as e:
-                LOGGER.warning(f"Failed to edit help message, sending new: {e}")
-                await cb.message.reply_text(help_text, reply_markup=keyboard, disable_web_page_preview=True)
-                if cb.message:
-                    try:
-                        await cb.message.delete()
-                    except:
-                        pass # Try to delete old button message
-                await cb.answer("Help section loaded.")
-        elif action == "my_secrets":
-            LOGGER.info(f"My Secrets callback received from {user_id}. Deferring to my_secrets_handler.")
-            from handlers.my_secrets import my_secrets_entry_handler
-            await my_secrets_entry_handler(client, cb)
-            await cb.answer("Loading Secret Lists...")
-        else: # Unknown main menu action
-             await cb.answer("Action not implemented yet.", show_alert=True)
-
-    # elif action_prefix == HELP_CALLBACK: # Matches "main:help"
-    #     clear_user_state(user_id)
-    #     keyboard = create_help_keyboard()
-    #     help_text = HELP_MESSAGE.format(bot_username=client.me.username)
-    #     try:
-    #         await cb.edit_message_text(help_text, reply_markup=keyboard, disable_web_page_preview=True)
-    #         await cb.answer()
-    #     except Exception as e:
-    #         LOGGER.warning(f"Failed to edit help message, sending new: {e}")
-    #         await cb.message.reply_text(help_text, reply_markup=keyboard, disable_web_page_preview=True)
-    #         if cb.message:
-    #             try:
-    #                 await cb.message.delete()
-    #             except:
-    #                 pass # Try to delete old button message
-    #         await cb.answer("Help section loaded.")
+    parts = action_full.split(":", 2) # Parsed once
+    action_prefix = parts[0] + ":"
+
+    LOGGER.debug("Main menu navigation: '%s' by User %s", action_full, cb.from_user.id)
+
+    if action_prefix == MAIN_MENU_CALLBACK and len(parts) > 1:
+        await _MAIN_MENU_ACTIONS.get(parts[1], _menu_unknown)(client, cb)
     else:
-        # This branch should ideally not be reached if regexps are specific for MY_SECRETS, SETTINGS etc.
+        # This branch should ideally not be reached: the regex for this handler is `MAIN_MENU_CALLBACK` and `HELP_CALLBACK`.
         # SHARE_SECRET_CALLBACK and ADMIN_PANEL_CALLBACK will be handled by their own dedicated handlers.
-        # The regex for this handler is specifically `MAIN_MENU_CALLBACK` and `HELP_CALLBACK`.
-        # Callbacks like "main:my_secrets" are distinct and handled by their respective modules.
-        LOGGER.warning(f"Unexpected callback '{action_full}' reached main_menu_navigation_handler.")
+        LOGGER.warning("Unexpected callback '%s' reached main_menu_navigation_handler.", action_full)
         await cb.answer("Unknown action.", show_alert=True)
 
 
@@ -1,18 +1,9 @@
 import logging
 import os
-import asyncio # Added for asyncio.run() explicit management in __main__
+import asyncio # Event loop is created and managed explicitly in __main__
+import concurrent.futures
 
-from pyrogram import Client, idle
-from pyrogram.errors import ApiIdInvalid, AuthKeyUnregistered, BotMethodInvalid, RPCError
-
-import dns.resolver
-dns.resolver.default_resolver=dns.resolver.Resolver(configure=False)
-dns.resolver.default_resolver.nameservers=['8.8.8.8']
-
-import config
-from db import init_db, close_db, database as db_instance, pymongo_client as sync_mongo_client # Renamed imported db object
-from utils.scheduler import init_scheduler, stop_scheduler, get_scheduler # get_scheduler can be useful
-from utils.user_states import clear_user_state # Good to have available for cleanup if needed
+import config # Only stdlib + config at import time; the heavy stack is loaded once the config is known good
 
 logging.basicConfig(
     level=getattr(logging, config.LOG_LEVEL, logging.INFO),
@@ -32,33 +23,60 @@ logging.getLogger("apscheduler.scheduler").setLevel(logging.INFO) # APScheduler
 
 os.makedirs(config.TEMP_DOWNLOAD_DIR, exist_ok=True)
 
+def _configure_dns():
+    # dnspython (used by Motor for mongodb+srv URIs) follows the system resolver unless a public one is forced;
+    # hosts without a usable resolv.conf fall back to it as well. Either way lookups are cached in memory.
+    import dns.resolver
+    try:
+        dns.resolver.default_resolver = None if config.FORCE_PUBLIC_DNS else dns.resolver.Resolver()
+    except dns.resolver.NoResolverConfiguration:
+        dns.resolver.default_resolver = None
+    if dns.resolver.default_resolver is None:
+        dns.resolver.default_resolver = dns.resolver.Resolver(configure=False)
+        dns.resolver.default_resolver.nameservers = ['8.8.8.8']
+    dns.resolver.default_resolver.cache = dns.resolver.LRUCache(max_size=256)
+
+
 async def main_bot_logic():
-    LOGGER.info(f"SecretShareBot is firing up! Version: {getattr(config, 'BOT_VERSION', 'N/A')}") # Add BOT_VERSION to config if desired
+    LOGGER.info("SecretShareBot is firing up! Version: %s", getattr(config, 'BOT_VERSION', 'N/A')) # Add BOT_VERSION to config if desired
 
     try:
         config.validate_config()
         LOGGER.info("Configuration parameters validated successfully.")
     except ValueError as e:
-        LOGGER.critical(f"CRITICAL CONFIGURATION ERROR: {e}. Bot cannot start.")
+        LOGGER.critical("CRITICAL CONFIGURATION ERROR: %s. Bot cannot start.", e)
         return
 
+    # Heavy imports only after validation: a misconfigured deploy fails fast without loading Pyrogram & co.
+    _configure_dns() # Before db/Motor resolve anything
+    from pyrogram import Client, idle
+    from pyrogram.errors import ApiIdInvalid, AuthKeyUnregistered, BotMethodInvalid, RPCError
+    import db
+    from db import init_db, close_db
+    from utils.scheduler import (
+        init_scheduler, stop_scheduler, get_scheduler, schedule_keepalive_ping, flush_message_deletions, set_app_client
+    )
+    from utils.user_writer import flush_new_users
+
     try:
-        await init_db() # Initializes db_instance and sync_mongo_client from db.py
+        await init_db() # Initializes db.database and db.pymongo_client
         LOGGER.info("Database connection established and collections/indexes ensured.")
     except Exception as e:
-        LOGGER.critical(f"FATAL: Failed to connect to MongoDB or initialize DB: {e}")
+        LOGGER.critical("FATAL: Failed to connect to MongoDB or initialize DB: %s", e)
         LOGGER.critical("Ensure MongoDB is running and MONGO_URI is correct in config.")
         return
 
     scheduler_instance = None
     try:
-        # Pass the synchronous pymongo client (obtained from db.init_db) to the scheduler
-        scheduler_instance = init_scheduler(pymongo_sync_client=sync_mongo_client)
+        # Paused until the client is connected: due jobs (e.g. deletions missed while down) need it when they fire
+        scheduler_instance = init_scheduler(paused=True) # Uses db's shared sync client
         if not scheduler_instance or not scheduler_instance.running:
             raise RuntimeError("Scheduler did not start correctly.")
         LOGGER.info("APScheduler initialized and started successfully.")
+        if config.PING_URL:
+            schedule_keepalive_ping(config.PING_URL, config.PING_INTERVAL)
     except Exception as e:
-        LOGGER.critical(f"FATAL: Failed to initialize APScheduler: {e}")
+        LOGGER.critical("FATAL: Failed to initialize APScheduler: %s", e)
         await close_db() # Close DB if scheduler fails as it's often critical
         return
 
@@ -70,12 +88,13 @@ async def main_bot_logic():
         api_hash=config.API_HASH,
         bot_token=config.BOT_TOKEN,
         plugins={"root": "handlers"},
-        workers=20, # Default, adjust based on load
+        workers=config.WORKERS, # WORKERS env var; defaults to ~2x cores
     )
 
     # Attach custom attributes to the client instance for easy access in handlers
-    setattr(app, 'db', db_instance) # The async Motor database instance
+    setattr(app, 'db', db.database) # The async Motor database instance
     setattr(app, 'scheduler', scheduler_instance)
+    set_app_client(app) # Scheduled jobs look the client up when they fire
     setattr(app, 'owner_id', config.OWNER_ID) # Make owner_id easily accessible from client
     # No need to set app.bot_username or app.bot_id here; get_me() will do it after start.
 
@@ -86,27 +105,32 @@ async def main_bot_logic():
         setattr(app, 'bot_id', bot_info.id)
         setattr(app, 'bot_username', bot_info.username) # Store on client instance
         config.BOT_USERNAME = bot_info.username # Also update config, though client attribute is preferred access
-        LOGGER.info(f"Bot @{app.bot_username} (ID: {app.bot_id}) is online and listening!")
+        LOGGER.info("Bot @%s (ID: %s) is online and listening!", app.bot_username, app.bot_id)
+        scheduler_instance.resume() # Jobs can reach Telegram now
         LOGGER.info("Make sure handlers are correctly placed in the 'handlers' directory.")
 
         await idle() # Keep the bot running until SIGINT, SIGTERM, etc.
 
     except ApiIdInvalid: LOGGER.critical("API ID or API HASH is invalid. Check config.")
     except AuthKeyUnregistered: LOGGER.critical("Bot token invalid or session corrupted. Delete .session file & re-verify token.")
-    except BotMethodInvalid as e: LOGGER.critical(f"Bot API method error: {e}. Possible Pyrogram usage or handler logic issue.")
+    except BotMethodInvalid as e: LOGGER.critical("Bot API method error: %s. Possible Pyrogram usage or handler logic issue.", e)
     except ConnectionError: LOGGER.error("Network error: Could not connect to Telegram.")
-    except RPCError as e: LOGGER.error(f"Telegram RPC Error: {e} (Code: {e.ID} - {e.NAME})")
+    except RPCError as e: LOGGER.error("Telegram RPC Error: %s (Code: %s - %s)", e, e.ID, e.NAME)
     except KeyboardInterrupt: LOGGER.info("Shutdown signal (KeyboardInterrupt) received.")
-    except Exception as e:
-        LOGGER.exception(f"An unexpected critical error occurred in main_bot_logic: {e}")
+    except Exception:
+        LOGGER.exception("An unexpected critical error occurred in main_bot_logic") # Traceback carries the error
     finally:
         LOGGER.info("Initiating graceful shutdown sequence...")
         if app.is_connected: # Check before trying to stop
+            try:
+                await flush_message_deletions() # Self-destructs already due but still in their batching window
+            except Exception as e_flush:
+                LOGGER.error("Error flushing pending message deletions: %s", e_flush)
             try:
                 await app.stop()
                 LOGGER.info("Pyrogram client stopped.")
             except Exception as e_stop:
-                LOGGER.error(f"Error stopping Pyrogram client: {e_stop}")
+                LOGGER.error("Error stopping Pyrogram client: %s", e_stop)
         
         current_scheduler = get_scheduler() # Fetch current scheduler instance
         if current_scheduler and current_scheduler.running:
@@ -114,21 +138,57 @@ async def main_bot_logic():
             # No need to pass `scheduler_instance` explicitly if stop_scheduler handles the global one
         else:
             LOGGER.info("Scheduler was not running or not initialized for shutdown.")
-            
+
+        await flush_new_users() # Don't drop first-contact users still waiting for their batch
         await close_db() # Closes both motor and pymongo connections
         LOGGER.info("Bot has been shut down. Farewell!")
 
 
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+    # uvloop (libuv) is a drop-in loop for Pyrogram, Motor and AsyncIOScheduler; fall back to the stock loop
+    # where it isn't available (e.g. Windows)
+    try:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        LOGGER.info("uvloop not available, using the default asyncio event loop.")
+        loop = asyncio.new_event_loop()
+    loop.set_debug(False) # Debug mode adds per-callback overhead; never inherit it from PYTHONASYNCIODEBUG
+    # Named, bounded pool for asyncio.to_thread work (sync Mongo job store calls)
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="ss-io"))
+    return loop
+
+
+def _shutdown_loop(loop: asyncio.AbstractEventLoop):
+    # What asyncio.run() does on exit: cancel leftover background tasks, then drain generators and the executor
+    try:
+        pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
 if __name__ == "__main__":
-    # Python 3.7+ standard way to run asyncio programs
+    # The loop is built explicitly (instead of asyncio.run) so it can be tuned before anything runs on it
+    loop = _new_event_loop()
+    asyncio.set_event_loop(loop)
     try:
-        asyncio.run(main_bot_logic())
+        try:
+            loop.run_until_complete(main_bot_logic())
+        finally:
+            _shutdown_loop(loop)
     except RuntimeError as e:
         # Suppress "Event loop is closed" error on Windows during forceful exit (Ctrl+C twice sometimes)
         if "Event loop is closed" in str(e) and os.name == 'nt':
             pass
         else:
-            LOGGER.critical(f"Runtime error executing main_bot_logic: {e}")
+            LOGGER.critical("Runtime error executing main_bot_logic: %s", e)
             # raise # Re-raise if it's not the common event loop closed error
     except KeyboardInterrupt:
         # This ensures that if KeyboardInterrupt happens outside the try/finally in main_bot_logic
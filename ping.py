@@ -9,9 +9,12 @@ load_dotenv()
 url = os.getenv("PING_URL")
 interval = int(os.getenv("PING_INTERVAL", 20))
 
+# One session for all pings: the TCP/TLS connection is kept alive and reused instead of re-handshaking every time
+session = requests.Session()
+
 while True:
     try:
-        response = requests.get(url)
+        response = session.get(url, timeout=interval)
         print("Status Code:", response.status_code)
     except requests.exceptions.RequestException as e:
         print("An error occurred:", e)
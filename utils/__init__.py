@@ -8,6 +8,8 @@ __all__ = [
     "scheduler",
     "user_states",
     "helpers",
+    "background",
+    "user_writer",
 ]
 
 UTILS_LOGGER.debug("Utils package initialized.")
\ No newline at end of file
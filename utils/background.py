@@ -0,0 +1,24 @@
+import asyncio
+import logging
+from typing import Any, Coroutine, Optional, Set
+
+LOGGER = logging.getLogger(__name__)
+
+# The event loop only keeps weak references to tasks, so fire-and-forget tasks must be
+# referenced somewhere or they can be garbage-collected before they finish.
+_background_tasks: Set[asyncio.Task] = set()
+
+def _on_background_task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        LOGGER.error("Background task '%s' failed: %r", task.get_name(), exc, exc_info=exc)
+
+def run_in_background(coro: Coroutine[Any, Any, Any], name: Optional[str] = None) -> asyncio.Task:
+    """Schedules coro on the running loop without awaiting it. Failures are logged, never raised."""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
@@ -1,91 +1,126 @@
+import asyncio
 import functools
 import logging
-from typing import Callable, Any
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Any, Optional
 
 from pyrogram.types import Message, CallbackQuery, User as PyrogramUser
 from pyrogram import Client
 
 import config
-from db import get_user, add_user # get_user is essential here
+from db import get_user # get_user is essential here
+from utils.background import run_in_background
+from utils.user_writer import enqueue_new_user
 
 LOGGER = logging.getLogger(__name__)
 
 HandlerCallable = Callable[[Client, Any], Any]
 
+# Config is fixed at startup: bind the auth sets once (O(1) membership instead of scanning the list per update)
+_SUDO_USERS = frozenset(config.SUDO_USERS)
+_OWNER_ID = config.OWNER_ID
+
+# User doc loaded by check_user_status, visible to the decorators stacked under it for the same update.
+# Set and reset around each call: Pyrogram workers run many updates in one task, so it must not leak to the next.
+_USER_CTX: ContextVar[Optional[dict]] = ContextVar("user_db", default=None)
+
 def check_user_status(func: HandlerCallable) -> HandlerCallable:
     @functools.wraps(func)
     async def wrapper(client: Client, update: Message | CallbackQuery) -> Any:
-        if not hasattr(update, "from_user") or not update.from_user:
+        pyrogram_user: Optional[PyrogramUser] = getattr(update, "from_user", None) # One lookup covers both checks
+        if pyrogram_user is None:
             # For updates without a clear from_user (e.g. some channel posts if bot is admin, though rare for private bots)
             # Or if it's an inline query where from_user might be processed differently (see specific inline handler)
-            LOGGER.warning(f"Update type {type(update)} does not have 'from_user' or it's None. Skipping user check.")
+            LOGGER.warning("Update type %s does not have 'from_user' or it's None. Skipping user check.", type(update))
             return await func(client, update) # Proceed without user data if not applicable
 
-        pyrogram_user: PyrogramUser = update.from_user
         user_id = pyrogram_user.id
 
-        user_db_data = await get_user(user_id)
+        user_db_data = await cached_get_user(user_id)
 
         if user_db_data and user_db_data.get("banned"):
             ban_reason = user_db_data.get("ban_reason", "No reason provided.")
-            try:
-                if isinstance(update, Message):
-                    await update.reply_text(f"❌ You are banned.\nReason: {ban_reason}")
-                elif isinstance(update, CallbackQuery):
-                    await update.answer(f"❌ You are banned.\nReason: {ban_reason}", show_alert=True)
-            except Exception as e:
-                LOGGER.error(f"Error informing banned user {user_id} about ban: {e}")
+            await _reject(update, _BAN_TMPL.format(ban_reason), "banned user")
             return None
 
         if not user_db_data:
-            user_db_data = await add_user(
+            # Written by the batched user writer; the handler gets the new user's document right away
+            user_db_data = enqueue_new_user(
                 user_id,
                 first_name=pyrogram_user.first_name,
                 username=pyrogram_user.username
             )
-            if not user_db_data:
-                err_msg = "⚠️ Account setup error. Please try /start again later."
-                try:
-                    if isinstance(update, Message): await update.reply_text(err_msg)
-                    elif isinstance(update, CallbackQuery): await update.answer(err_msg, show_alert=True)
-                except Exception as e:
-                    LOGGER.error(f"Error sending account setup error to {user_id}: {e}")
-                return None
-            LOGGER.info(f"New user {user_id} ('{pyrogram_user.first_name}') added via decorator.")
-
-        # Attach user_db_data for use in the handler
-        # Note: Pyrogram's update objects are typically immutable or copied.
-        # setattr might not always work as expected on the original object passed around.
-        # A common pattern is to pass user_db_data as an additional argument to the handler,
-        # or store it in a context (like `client.user_contexts[user_id]`) if a more global
-        # approach is needed per request. For simplicity, we attempt setattr here.
-        # If it doesn't persist, handlers should call get_user() themselves or we redesign.
-        try:
-            setattr(update, 'user_db', user_db_data) # Use 'user_db' to avoid conflict with update.from_user
-        except AttributeError: # Happens if update object doesn't allow new attributes (e.g. frozen)
-             # Fallback: Pass as kwarg if handler supports it, or log warning.
-             # For now, we assume it works or handler will re-fetch. This is a common challenge.
-             LOGGER.debug(f"Could not setattr 'user_db' on update object for user {user_id}. Handler might need to fetch manually.")
+            LOGGER.info("New user %s ('%s') queued via decorator.", user_id, pyrogram_user.first_name)
 
+        # Attach user_db_data for use in the handler (handlers read update.user_db).
+        # Pyrogram's update types are plain classes with a __dict__, so this is a single dict write; for a
+        # __slots__-only update there is nothing to attach to and readers fall back to _USER_CTX below.
+        update_attrs = getattr(update, "__dict__", None)
+        if update_attrs is not None:
+            update_attrs['user_db'] = user_db_data # Use 'user_db' to avoid conflict with update.from_user
 
-        return await func(client, update)
+        ctx_token = _USER_CTX.set(user_db_data)
+        try:
+            return await func(client, update)
+        finally:
+            _USER_CTX.reset(ctx_token)
     return wrapper
 
 
+# Rejection texts, built once
+_BAN_TMPL = "❌ You are banned.\nReason: {}"
+_UNAUTH_OWNER = "❌ Unauthorized: Owner access required."
+_UNAUTH_SUDO = "❌ Unauthorized: Sudo access required."
+_PREMIUM_MSG = "🌟 This feature is for Premium users. Tap /start and check 'Go Premium' for more info!" # todo: add a button to main menu premium here
+_PREMIUM_ALERT = "🌟 Premium feature only."
+
+_REJECT_ANSWER_TIMEOUT = 2 # Seconds to wait for a callback answer before letting it finish in the background
+
+async def _reject_message(update: Message, text: str, who: str, alert_text: Optional[str]):
+    # Fire-and-forget so the worker is freed
+    run_in_background(update.reply_text(text), name=f"reject_reply:{update.from_user.id}")
+
+async def _reject_callback(update: CallbackQuery, text: str, who: str, alert_text: Optional[str]):
+    user_id = update.from_user.id
+    # The callback still gets its answer before we return (the client is waiting on it), but bounded:
+    # the shielded task keeps going if Telegram is slow.
+    answer = run_in_background(update.answer(alert_text or text, show_alert=True), name=f"reject_answer:{user_id}")
+    try:
+        await asyncio.wait_for(asyncio.shield(answer), _REJECT_ANSWER_TIMEOUT)
+    except Exception as e: # Failures are also logged by the background task
+        LOGGER.warning("Answer to %s %s not confirmed: %r", who, user_id, e)
+    if alert_text and update.message:
+        run_in_background(update.message.reply_text(text), name=f"reject_reply:{user_id}")
+
+# Exact-type dispatch: Pyrogram hands handlers these concrete classes, so one dict lookup replaces the isinstance chain
+_REJECT_BY_TYPE = {Message: _reject_message, CallbackQuery: _reject_callback}
+
+async def _reject(update: Message | CallbackQuery, text: str, who: str, alert_text: Optional[str] = None):
+    """Shared by the access decorators: reply to messages, alert on callbacks (alert_text, if given, is the
+    short alert and text follows as a chat reply). Chat replies are fire-and-forget so the worker is freed."""
+    sender = _REJECT_BY_TYPE.get(type(update))
+    if sender is not None:
+        await sender(update, text, who, alert_text)
+
+
+def _attached_user_db(update: Any, user_id: int) -> Optional[dict]:
+    # Prefer what check_user_status already loaded for this update; both sources are keyed to the same user
+    user_db = getattr(update, 'user_db', None) or _USER_CTX.get()
+    return user_db if user_db and user_db.get("user_id") == user_id else None
+
+
 def owner_only(func: HandlerCallable) -> HandlerCallable:
     @functools.wraps(func)
     async def wrapper(client: Client, update: Message | CallbackQuery) -> Any:
-        if not hasattr(update, "from_user") or not update.from_user:
+        from_user = getattr(update, "from_user", None)
+        if from_user is None:
             return await func(client, update) # Allow if no user context to check against
 
-        user_id = update.from_user.id
-        if user_id != config.OWNER_ID:
-            msg_text = "❌ Unauthorized: Owner access required."
-            try:
-                if isinstance(update, Message): await update.reply_text(msg_text)
-                elif isinstance(update, CallbackQuery): await update.answer(msg_text, show_alert=True)
-            except Exception as e:
-                LOGGER.error(f"Error informing non-owner {user_id}: {e}")
+        user_id = from_user.id
+        if user_id != _OWNER_ID:
+            await _reject(update, _UNAUTH_OWNER, "non-owner")
             return None
         return await func(client, update)
     return wrapper
@@ -94,52 +129,97 @@ def sudo_users_only(func: HandlerCallable) -> HandlerCallable:
     """Restricts handler to Sudo users (defined in config, includes Owner)."""
     @functools.wraps(func)
     async def wrapper(client: Client, update: Message | CallbackQuery) -> Any:
-        if not hasattr(update, "from_user") or not update.from_user:
+        from_user = getattr(update, "from_user", None)
+        if from_user is None:
             return await func(client, update) # Allow if no user context
 
-        user_id = update.from_user.id
+        user_id = from_user.id
 
         # Sudo users list now directly from config includes owner
-        if user_id not in config.SUDO_USERS:
+        if user_id not in _SUDO_USERS:
             # Attempt to fetch user_db in case their role was set to sudo dynamically
             # and not present in config.SUDO_USERS (though config is source of truth for this decorator)
-            user_db = getattr(update, 'user_db', await get_user(user_id)) # Fetch if not attached
-            print(f"User DB: {user_db}")
+            user_db = _attached_user_db(update, user_id) or await cached_get_user(user_id) # Fetch if not attached
             if not (user_db and user_db.get("is_sudo")): # Check DB 'is_sudo' as a fallback
-                msg_text = "❌ Unauthorized: Sudo access required."
-                try:
-                    if isinstance(update, Message): await update.reply_text(msg_text)
-                    elif isinstance(update, CallbackQuery): await update.answer(msg_text, show_alert=True)
-                except Exception as e:
-                    LOGGER.error(f"Error informing non-sudo {user_id}: {e}")
+                LOGGER.debug("Sudo check failed for %s (user_db=%s)", user_id, user_db) # Skipped entirely above DEBUG
+                await _reject(update, _UNAUTH_SUDO, "non-sudo")
                 return None
         return await func(client, update)
     return wrapper
 
+def fast_auth(kind: str) -> Callable[[HandlerCallable], HandlerCallable]:
+    """Replaces a @check_user_status + @owner_only/@sudo_users_only stack. Users listed in config pass straight
+    through without any DB read (ban status is not enforced for them, by design); everyone else takes the full
+    stack, so sudo granted in the DB still works."""
+    if kind not in ("owner", "sudo"):
+        raise ValueError(f"fast_auth kind must be 'owner' or 'sudo', not {kind!r}")
+    allowed = frozenset((_OWNER_ID,)) if kind == "owner" else _SUDO_USERS
+    gate = owner_only if kind == "owner" else sudo_users_only
+
+    def decorator(func: HandlerCallable) -> HandlerCallable:
+        full_stack = check_user_status(gate(func))
+
+        @functools.wraps(func)
+        async def wrapper(client: Client, update: Message | CallbackQuery) -> Any:
+            from_user = getattr(update, "from_user", None)
+            if from_user is None or from_user.id not in allowed:
+                return await full_stack(client, update)
+            update_attrs = getattr(update, "__dict__", None)
+            if update_attrs is not None: # Minimal stand-in for handlers that read update.user_db
+                update_attrs['user_db'] = {
+                    "user_id": from_user.id, "role": "owner" if from_user.id == _OWNER_ID else "sudo",
+                    "is_sudo": True, "is_premium": True, "banned": False,
+                }
+            return await func(client, update)
+        return wrapper
+    return decorator
+
 def premium_users_only(func: HandlerCallable) -> HandlerCallable:
     @functools.wraps(func)
     async def wrapper(client: Client, update: Message | CallbackQuery) -> Any:
-        if not hasattr(update, "from_user") or not update.from_user:
+        from_user = getattr(update, "from_user", None)
+        if from_user is None:
             return await func(client, update)
 
-        user_id = update.from_user.id
-        user_db = getattr(update, 'user_db', await get_user(user_id)) # Fetch if not attached
+        user_id = from_user.id
+        user_db = _attached_user_db(update, user_id) or await cached_get_user(user_id) # Fetch if not attached
 
         if not user_db or not user_db.get("is_premium"):
             # If user_db is None (shouldn't happen if @check_user_status is used first), deny.
             # Or if user_db exists but "is_premium" is False or not set.
-            msg_text = (
-                "🌟 This feature is for Premium users. "
-                f"Tap /start and check 'Go Premium' for more info!"
-            ) # todo: add a button to main menu premium here
-            try:
-                if isinstance(update, Message): await update.reply_text(msg_text)
-                elif isinstance(update, CallbackQuery):
-                    await update.answer("🌟 Premium feature only.", show_alert=True)
-                    if update.message: # Try sending a new message with more info
-                         await update.message.reply_text(msg_text)
-            except Exception as e:
-                LOGGER.error(f"Error informing non-premium {user_id}: {e}")
+            # Callbacks get a short alert plus the full text as a new message with more info
+            await _reject(update, _PREMIUM_MSG, "non-premium", alert_text=_PREMIUM_ALERT)
             return None
         return await func(client, update)
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+def async_ttl_cache(ttl: float, maxsize: int = 4096):
+    """Caches an async function's result per positional args for `ttl` seconds (LRU-bounded to `maxsize`).
+    None results are not cached. The wrapper exposes .invalidate(*args) and .cache_clear()."""
+    def decorator(func):
+        cache: "OrderedDict[tuple, tuple[float, Any]]" = OrderedDict() # args -> (monotonic time, result)
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            hit = cache.get(args)
+            if hit and time.monotonic() - hit[0] < ttl:
+                cache.move_to_end(args)
+                return hit[1]
+            result = await func(*args)
+            if result is not None:
+                cache[args] = (time.monotonic(), result)
+                cache.move_to_end(args)
+                if len(cache) > maxsize:
+                    cache.popitem(last=False) # Evict least recently used
+            return result
+
+        wrapper.invalidate = lambda *args: cache.pop(args, None)
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+# User documents for the access decorators. Ban/role/premium state rarely changes between updates, so repeat
+# users are served from memory; code that writes a user doc calls cached_get_user.invalidate(user_id).
+cached_get_user = async_ttl_cache(ttl=60, maxsize=10_000)(get_user)
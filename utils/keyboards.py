@@ -1,5 +1,6 @@
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from typing import List, Optional, Dict, Any
+from itertools import batched # Python 3.12+ (runtime.txt)
+from typing import List, Optional, Dict, Any, Iterable
 
 import config
 
@@ -39,45 +40,93 @@ ADMIN_REVOKE_PREMIUM_PREFIX = "admin_r_prem:"
 ADMIN_BAN_USER_PREFIX = "admin_ban:"
 ADMIN_UNBAN_USER_PREFIX = "admin_unban:"
 
-
-def create_main_menu_keyboard(is_premium: bool = False, is_sudo: bool = False) -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton("🔒 Share a Secret", callback_data=SHARE_SECRET_CALLBACK)],
-        [InlineKeyboardButton("🗂️ My Shared Secrets", callback_data=MY_SECRETS_CALLBACK)],
-        [InlineKeyboardButton("⚙️ Settings", callback_data=SETTINGS_CALLBACK)],
-    ]
+# Compound prefixes for the per-share buttons: each callback_data is then a single concat with the share id
+_SHARE_TYPE_MSG = SHARE_TYPE_PREFIX + "message:"
+_SHARE_TYPE_FILE = SHARE_TYPE_PREFIX + "file:"
+_SHARE_CANCEL_NOW = SHARE_CANCEL_PREFIX + "now:"
+_RECIPIENT_USER = RECIPIENT_TYPE_PREFIX + "user:"
+_RECIPIENT_LINK = RECIPIENT_TYPE_PREFIX + "link:"
+_PROTECTION_DONE = PROTECTION_PREF_PREFIX + "done:"
+_SHARE_CONFIRM_SEND = SHARE_CONFIRM_PREFIX + "send:"
+_SET_DESTRUCT_NONE = SET_DESTRUCT_PREFIX + "0:"
+_MY_SECRETS_REVOKE = MY_SECRETS_ACTION_PREFIX + "revoke:"
+_MAIN_MENU_START = MAIN_MENU_CALLBACK + "start"
+_TOGGLE_NOTIFY_ON_VIEW = SETTINGS_TOGGLE_PREFIX + "notify_on_view"
+_TOGGLE_DEFAULT_PROTECTED = SETTINGS_TOGGLE_PREFIX + "default_protected_content"
+_TOGGLE_DEFAULT_FWD_TAG = SETTINGS_TOGGLE_PREFIX + "default_show_forward_tag"
+
+
+# Rows shared by many keyboards. _MAIN_MENU_ROW has no variable part, so one instance serves every markup
+_MAIN_MENU_ROW = [InlineKeyboardButton("⬅️ Main Menu", callback_data=_MAIN_MENU_START)]
+
+def _rows(buttons: Iterable[InlineKeyboardButton], per_row: int) -> List[List[InlineKeyboardButton]]:
+    # Pyrogram expects each row as a list
+    return [list(row) for row in batched(buttons, per_row)]
+
+def _cancel_row(share_uuid: str) -> List[InlineKeyboardButton]:
+    return [InlineKeyboardButton("❌ Cancel Share", callback_data=_SHARE_CANCEL_NOW + share_uuid)]
+
+def _fmt_minutes(minutes: int) -> str:
+    if minutes < 60: return f"{minutes}m"
+    if minutes == 60: return "1h"
+    if minutes % 1440 == 0: return f"{minutes // 1440}d" # Days
+    if minutes % 60 == 0: return f"{minutes // 60}h" # Hours
+    return f"{minutes // 60}h{minutes % 60}m"
+
+# Button labels for the configured options, computed once at import
+_DESTRUCT_LABELS = {m: _fmt_minutes(m) for m in set(config.PREMIUM_SELF_DESTRUCT_OPTIONS) | set(config.FREE_SELF_DESTRUCT_OPTIONS)}
+_VIEW_LABELS = {v: f"{v} View{'s' if v > 1 else ''}" for v in set(config.PREMIUM_MAX_VIEWS_OPTIONS) | set(config.FREE_MAX_VIEWS_OPTIONS)}
+
+
+# Main menu rows, shared by the four menu variants
+_ROW_SHARE = [InlineKeyboardButton("🔒 Share a Secret", callback_data=SHARE_SECRET_CALLBACK)]
+_ROW_MY_SECRETS = [InlineKeyboardButton("🗂️ My Shared Secrets", callback_data=MY_SECRETS_CALLBACK)]
+_ROW_SETTINGS = [InlineKeyboardButton("⚙️ Settings", callback_data=SETTINGS_CALLBACK)]
+_ROW_PREMIUM = [InlineKeyboardButton("🌟 Go Premium", callback_data=PREMIUM_CALLBACK)]
+_ROW_HELP = [InlineKeyboardButton("❓ Help & Info", callback_data=HELP_CALLBACK)]
+_ROW_ADMIN = [InlineKeyboardButton("👑 Admin Panel", callback_data=ADMIN_PANEL_CALLBACK)]
+
+def _build_main_menu_keyboard(is_premium: bool, is_sudo: bool) -> InlineKeyboardMarkup:
+    keyboard = [_ROW_SHARE, _ROW_MY_SECRETS, _ROW_SETTINGS]
     if not is_premium:
-        keyboard.append([InlineKeyboardButton("🌟 Go Premium", callback_data=PREMIUM_CALLBACK)])
-    keyboard.append([InlineKeyboardButton("❓ Help & Info", callback_data=HELP_CALLBACK)])
+        keyboard.append(_ROW_PREMIUM)
+    keyboard.append(_ROW_HELP)
     if is_sudo: # OWNER_ID check will be handled in admin_panel itself, this just shows/hides for sudo.
-        keyboard.append([InlineKeyboardButton("👑 Admin Panel", callback_data=ADMIN_PANEL_CALLBACK)])
+        keyboard.append(_ROW_ADMIN)
     return InlineKeyboardMarkup(keyboard)
 
+# Static keyboards are built once at import and shared: Pyrogram only reads markups when sending,
+# so callers must not mutate the returned objects.
+# Main menu variants indexed by (is_premium << 1) | is_sudo
+_MAIN_MENU_KB = [_build_main_menu_keyboard(bool(i & 2), bool(i & 1)) for i in range(4)]
+_HELP_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("⬅️ Back to Main Menu", callback_data=_MAIN_MENU_START)]])
+
+def create_main_menu_keyboard(is_premium: bool = False, is_sudo: bool = False) -> InlineKeyboardMarkup:
+    return _MAIN_MENU_KB[(bool(is_premium) << 1) | bool(is_sudo)]
+
 def create_help_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        [[InlineKeyboardButton("⬅️ Back to Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")]])
+    return _HELP_KB
 
 def create_share_type_keyboard(share_uuid: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
         [
-            InlineKeyboardButton("💬 Message", callback_data=f"{SHARE_TYPE_PREFIX}message:{share_uuid}"),
-            InlineKeyboardButton("📄 File/Media", callback_data=f"{SHARE_TYPE_PREFIX}file:{share_uuid}")
+            InlineKeyboardButton("💬 Message", callback_data=_SHARE_TYPE_MSG + share_uuid),
+            InlineKeyboardButton("📄 File/Media", callback_data=_SHARE_TYPE_FILE + share_uuid)
         ],
-        [InlineKeyboardButton("❌ Cancel Share", callback_data=f"{SHARE_CANCEL_PREFIX}now:{share_uuid}")]
+        _cancel_row(share_uuid)
     ])
 
 def create_recipient_type_keyboard(share_uuid: str) -> InlineKeyboardMarkup:
     keyboard_rows = [
-        [InlineKeyboardButton("👤 Specific User", callback_data=f"{RECIPIENT_TYPE_PREFIX}user:{share_uuid}")],
-        [InlineKeyboardButton("🔗 Generate Sharable Link", callback_data=f"{RECIPIENT_TYPE_PREFIX}link:{share_uuid}")]
+        [InlineKeyboardButton("👤 Specific User", callback_data=_RECIPIENT_USER + share_uuid)],
+        [InlineKeyboardButton("🔗 Generate Sharable Link", callback_data=_RECIPIENT_LINK + share_uuid)]
     ]
-    keyboard_rows.append([InlineKeyboardButton("❌ Cancel Share", callback_data=f"{SHARE_CANCEL_PREFIX}now:{share_uuid}")])
+    keyboard_rows.append(_cancel_row(share_uuid))
     return InlineKeyboardMarkup(keyboard_rows)
 
 # New function
 def create_max_views_keyboard(share_uuid: str, is_premium: bool) -> InlineKeyboardMarkup:
-    keyboard = []
-    
     # Define view options based on user tier
     if is_premium:
         options = config.PREMIUM_MAX_VIEWS_OPTIONS
@@ -90,20 +139,10 @@ def create_max_views_keyboard(share_uuid: str, is_premium: bool) -> InlineKeyboa
         # options = [1, 2, 3]
         unlimited_label = None
 
-    row = []
-    for views in options:
-        if views == 0 and unlimited_label: # Handle '0' for unlimited if present
-            label = unlimited_label
-        else:
-            label = f"{views} View{'s' if views > 1 else ''}"
-        
-        if len(row) >= 3: # Max 3 buttons per row
-            keyboard.append(row)
-            row = []
-        row.append(InlineKeyboardButton(label, callback_data=f"{SET_MAX_VIEWS_PREFIX}{views}:{share_uuid}"))
-    
-    if row:
-        keyboard.append(row)
+    labels = _VIEW_LABELS if unlimited_label is None else {**_VIEW_LABELS, 0: unlimited_label} # '0' is unlimited if offered
+    buttons = (InlineKeyboardButton(labels[views], callback_data=SET_MAX_VIEWS_PREFIX + str(views) + ":" + share_uuid)
+               for views in options)
+    keyboard = _rows(buttons, 3) # Max 3 buttons per row
 
     # Default/Skip option (could lead to confirmation or skip if only one choice for tier)
     # For simplicity now, assume selection is mandatory from above.
@@ -111,7 +150,7 @@ def create_max_views_keyboard(share_uuid: str, is_premium: bool) -> InlineKeyboa
     # or "Skip (Default 1 View)" if that's desired.
     # For now, make it so selection moves to confirmation.
 
-    keyboard.append([InlineKeyboardButton("❌ Cancel Share", callback_data=f"{SHARE_CANCEL_PREFIX}now:{share_uuid}")])
+    keyboard.append(_cancel_row(share_uuid))
     return InlineKeyboardMarkup(keyboard)
 
 def create_protection_preferences_keyboard(share_uuid: str, current_show_forward_tag: bool, current_protected_content: bool) -> InlineKeyboardMarkup:
@@ -119,100 +158,78 @@ def create_protection_preferences_keyboard(share_uuid: str, current_show_forward
         [
             InlineKeyboardButton(
                 f"Forward Tag: {'✅ Show' if current_show_forward_tag else '☑️ Hide'}",
-                callback_data=f"{FORWARD_TAG_TOGGLE_PREFIX}{share_uuid}"
+                callback_data=FORWARD_TAG_TOGGLE_PREFIX + share_uuid
             )
         ],
         [
             InlineKeyboardButton(
                 f"Protect Content: {'✅ Yes (No Forward/Save)' if current_protected_content else '☑️ No (Allow Forward/Save)'}",
-                callback_data=f"{PROTECTED_CONTENT_TOGGLE_PREFIX}{share_uuid}"
+                callback_data=PROTECTED_CONTENT_TOGGLE_PREFIX + share_uuid
             )
         ],
-        [InlineKeyboardButton("➡️ Next: Self-Destruct Options", callback_data=f"{PROTECTION_PREF_PREFIX}done:{share_uuid}")],
-        [InlineKeyboardButton("❌ Cancel Share", callback_data=f"{SHARE_CANCEL_PREFIX}now:{share_uuid}")]
+        [InlineKeyboardButton("➡️ Next: Self-Destruct Options", callback_data=_PROTECTION_DONE + share_uuid)],
+        _cancel_row(share_uuid)
     ]
     return InlineKeyboardMarkup(keyboard)
 
 def create_self_destruct_options_keyboard(share_uuid: str, is_premium: bool) -> InlineKeyboardMarkup:
-    keyboard: List[List[InlineKeyboardButton]] = []
-    options = []
-    if is_premium:
-        options.extend(config.PREMIUM_SELF_DESTRUCT_OPTIONS)
-        default_option_label = "No Timer (Max Lifespan / View-Based)"
-        default_option_value = "0" # Represents max lifespan or view-based for premium
-    else:
-        # # Free users might only have one default option determined by config
-        # default_expiry_minutes = config.FREE_TIER_DEFAULT_EXPIRY_HOURS * 60
-        # options.append(default_expiry_minutes)
-        # default_option_label = f"Default ({config.FREE_TIER_DEFAULT_EXPIRY_HOURS}h)"
-        # default_option_value = str(default_expiry_minutes)
-        options.extend(config.FREE_SELF_DESTRUCT_OPTIONS)
-        default_option_label = "No Timer (Max Lifespan / View-Based)"
-        default_option_value = "0" # Represents max lifespan or view-based for premium
-
-
-    timer_buttons_row = []
-    for minutes in options:
-        if minutes == 0 and not is_premium: continue # Skip "No Timer" explicit option for free if it maps to default
-
-        if minutes < 60: label = f"{minutes}m"
-        elif minutes == 60: label = f"1h"
-        elif minutes % 1440 == 0: label = f"{minutes // 1440}d" # Days
-        elif minutes % 60 == 0: label = f"{minutes // 60}h" # Hours
-        else:
-            hours = minutes // 60
-            rem_minutes = minutes % 60
-            label = f"{hours}h{rem_minutes}m"
-
-        if len(timer_buttons_row) >= 2: # Keep rows somewhat balanced
-             keyboard.append(timer_buttons_row)
-             timer_buttons_row = []
-        timer_buttons_row.append(InlineKeyboardButton(label, callback_data=f"{SET_DESTRUCT_PREFIX}{minutes}:{share_uuid}"))
-
-    if timer_buttons_row:
-        keyboard.append(timer_buttons_row)
-
-    if is_premium: # Add the explicit "No Timer" (or view-based/max lifespan) for premium
-        keyboard.append([InlineKeyboardButton(default_option_label, callback_data=f"{SET_DESTRUCT_PREFIX}{default_option_value}:{share_uuid}")])
-    # elif not options or (options and options[0] != default_expiry_minutes): # If default option for free user not already listed (e.g. if `options` was empty)
-    else:
-        # This case is unlikely given current logic but safe-guards
-        keyboard.append([InlineKeyboardButton(default_option_label, callback_data=f"{SET_DESTRUCT_PREFIX}{default_option_value}:{share_uuid}")])
+    options = config.PREMIUM_SELF_DESTRUCT_OPTIONS if is_premium else config.FREE_SELF_DESTRUCT_OPTIONS
+
+    # Skip "No Timer" explicit option for free if it maps to default
+    buttons = (InlineKeyboardButton(_DESTRUCT_LABELS[minutes], callback_data=SET_DESTRUCT_PREFIX + str(minutes) + ":" + share_uuid)
+               for minutes in options if minutes or is_premium)
+    keyboard = _rows(buttons, 2) # Keep rows somewhat balanced
 
-    keyboard.append([InlineKeyboardButton("❌ Cancel Share", callback_data=f"{SHARE_CANCEL_PREFIX}now:{share_uuid}")])
+    # "0" is the explicit "No Timer" choice (view-based / max lifespan), offered to both tiers
+    keyboard.append([InlineKeyboardButton("No Timer (Max Lifespan / View-Based)", callback_data=_SET_DESTRUCT_NONE + share_uuid)])
+
+    keyboard.append(_cancel_row(share_uuid))
     return InlineKeyboardMarkup(keyboard)
 
 def create_confirmation_keyboard(share_uuid: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✅ Confirm & Send", callback_data=f"{SHARE_CONFIRM_PREFIX}send:{share_uuid}")],
-        [InlineKeyboardButton("❌ Cancel Share", callback_data=f"{SHARE_CANCEL_PREFIX}now:{share_uuid}")]
+        [InlineKeyboardButton("✅ Confirm & Send", callback_data=_SHARE_CONFIRM_SEND + share_uuid)],
+        _cancel_row(share_uuid)
     ])
 
 def create_view_secret_button(access_token: str, custom_text: Optional[str] = None) -> InlineKeyboardMarkup:
     button_text = custom_text or "🤫 View Secret"
-    return InlineKeyboardMarkup([[InlineKeyboardButton(button_text, callback_data=f"{VIEW_SECRET_PREFIX}{access_token}")]])
+    return InlineKeyboardMarkup([[InlineKeyboardButton(button_text, callback_data=VIEW_SECRET_PREFIX + access_token)]])
+
+
+_STATUS_EMOJI = {"active": "🟢", "viewed": "👁️", "expired": "⏳", "revoked": "❌", "destructed": "🔥"}
+_SHARE_TYPE_EMOJI = {"message": "💬"} # Everything else is a file/media share
 
+def _truncate_label(text: str, max_len: int) -> str:
+    # Keeps the label within max_len UTF-8 bytes as "head...tail". UTF-8 takes 1-4 bytes per character, so a
+    # label of at most max_len/4 characters always fits and is returned without encoding.
+    if len(text) * 4 <= max_len:
+        return text
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_len:
+        return text
+    # Slice the bytes (not characters) so the result really fits; 'ignore' drops a character cut in half
+    return encoded[:max_len//2-3].decode('utf-8', 'ignore') + "..." + encoded[-max_len//2:].decode('utf-8', 'ignore')
 
 def create_my_secrets_list_keyboard(shares: List[Dict[str, Any]], current_page: int, total_shares: int) -> InlineKeyboardMarkup:
     keyboard: List[List[InlineKeyboardButton]] = []
+    max_len = 40
     if shares:
         for share in shares:
-            recipient_info = share.get("recipient_display_name") or \
-                             ("Sharable Link" if share.get("recipient_type") == "link" else "Unknown")
-            share_type_emoji = "💬" if share.get("share_type") == "message" else "📄"
-            file_name = share.get("original_file_name")
+            get = share.get # Bound once per share: several fields are read below
+            recipient_info = get("recipient_display_name") or \
+                             ("Sharable Link" if get("recipient_type") == "link" else "Unknown")
+            share_type_emoji = _SHARE_TYPE_EMOJI.get(get("share_type"), "📄")
+            file_name = get("original_file_name")
             content_desc = f" ({file_name})" if file_name else ""
 
-            status_map = {"active": "🟢", "viewed": "👁️", "expired": "⏳", "revoked": "❌", "destructed": "🔥"}
-            status_emoji = status_map.get(share.get("status", ""), "❓")
+            status_emoji = _STATUS_EMOJI.get(get("status", ""), "❓")
 
             button_text = f"{status_emoji} {share_type_emoji}{content_desc} to {recipient_info}"
-            max_len = 40
-            if len(button_text.encode('utf-8')) > max_len :
-                 button_text = button_text[:max_len//2-3] + "..." + button_text[-max_len//2:]
+            button_text = _truncate_label(button_text, max_len)
 
             keyboard.append([
-                InlineKeyboardButton(button_text, callback_data=f"{MY_SECRETS_DETAIL_PREFIX}{share['share_uuid']}")
+                InlineKeyboardButton(button_text, callback_data=MY_SECRETS_DETAIL_PREFIX + share['share_uuid'])
             ])
 
     if total_shares > config.MY_SECRETS_PAGE_LIMIT:
@@ -224,105 +241,91 @@ def create_my_secrets_list_keyboard(shares: List[Dict[str, Any]], current_page:
         if nav_row:
             keyboard.append(nav_row)
 
-    keyboard.append([InlineKeyboardButton("⬅️ Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")])
+    keyboard.append(_MAIN_MENU_ROW)
     return InlineKeyboardMarkup(keyboard)
 
+# 'viewed' stays revocable (the sender can still pull it until it expires/is destructed)
+_REVOCABLE_STATUSES = frozenset(("active", "viewed"))
+_BACK_MY_SECRETS_ROW = [InlineKeyboardButton("⬅️ My Secrets", callback_data=MY_SECRETS_CALLBACK)]
+
 def create_my_secret_detail_keyboard(share: Dict[str, Any]) -> InlineKeyboardMarkup:
-    keyboard: List[List[InlineKeyboardButton]] = []
-    can_revoke = share.get("status") in ["active", "viewed"]
-    if share.get("status") == "viewed" and share.get("recipient_type") != "link":
-        # If viewed by specific user & had a control message, usually that message is gone. Revoking may not be meaningful for old button.
-        # However, link shares are always revocable until expired or max views (if we implement that)
-        # Let's simplify: if 'viewed' but not yet 'expired/destructed', sender can revoke from their side
-        pass # can_revoke remains based on above
-
-    if can_revoke:
-        keyboard.append([
-            InlineKeyboardButton("🚫 Revoke Secret", callback_data=f"{MY_SECRETS_ACTION_PREFIX}revoke:{share['share_uuid']}")
+    if share.get("status") in _REVOCABLE_STATUSES:
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton("🚫 Revoke Secret", callback_data=_MY_SECRETS_REVOKE + share['share_uuid'])],
+            _BACK_MY_SECRETS_ROW
         ])
+    return InlineKeyboardMarkup([_BACK_MY_SECRETS_ROW])
 
-    keyboard.append([InlineKeyboardButton("⬅️ My Secrets", callback_data=MY_SECRETS_CALLBACK)])
-    return InlineKeyboardMarkup(keyboard)
-
-def create_settings_keyboard(user_settings: Dict[str, Any]) -> InlineKeyboardMarkup:
+def _build_settings_keyboard(notify_on_view: bool, protected_content: bool, show_forward_tag: bool) -> InlineKeyboardMarkup:
     keyboard: List[List[InlineKeyboardButton]] = []
 
-    notify_on_view_status = "✅ On" if user_settings.get("notify_on_view", False) else "☑️ Off"
+    notify_on_view_status = "✅ On" if notify_on_view else "☑️ Off"
     keyboard.append([
         InlineKeyboardButton(
             f"Notify on View: {notify_on_view_status}",
-            callback_data=f"{SETTINGS_TOGGLE_PREFIX}notify_on_view"
+            callback_data=_TOGGLE_NOTIFY_ON_VIEW
         )
     ])
 
-    default_prot_cont_status = "✅ Yes" if user_settings.get("default_protected_content", False) else "☑️ No"
+    default_prot_cont_status = "✅ Yes" if protected_content else "☑️ No"
     keyboard.append([
         InlineKeyboardButton(
             f"Default Content Protection: {default_prot_cont_status}",
-            callback_data=f"{SETTINGS_TOGGLE_PREFIX}default_protected_content"
+            callback_data=_TOGGLE_DEFAULT_PROTECTED
         )
     ])
 
-    default_fwd_tag_status = "✅ Show" if user_settings.get("default_show_forward_tag", True) else "☑️ Hide"
+    default_fwd_tag_status = "✅ Show" if show_forward_tag else "☑️ Hide"
     keyboard.append([
         InlineKeyboardButton(
             f"Default Forward Tag: {default_fwd_tag_status}",
-            callback_data=f"{SETTINGS_TOGGLE_PREFIX}default_show_forward_tag"
+            callback_data=_TOGGLE_DEFAULT_FWD_TAG
         )
     ])
 
-    keyboard.append([InlineKeyboardButton("⬅️ Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")])
+    keyboard.append(_MAIN_MENU_ROW)
     return InlineKeyboardMarkup(keyboard)
 
+# Three on/off settings -> only 8 possible keyboards, all built at import
+_SETTINGS_KB = {(n, p, f): _build_settings_keyboard(n, p, f)
+                for n in (False, True) for p in (False, True) for f in (False, True)}
+
+def create_settings_keyboard(user_settings: Dict[str, Any]) -> InlineKeyboardMarkup:
+    get = user_settings.get
+    return _SETTINGS_KB[(bool(get("notify_on_view", False)),
+                         bool(get("default_protected_content", False)),
+                         bool(get("default_show_forward_tag", True)))]
+
+_ADMIN_PANEL_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👥 Manage Users", callback_data=ADMIN_USERS_CALLBACK)],
+    [InlineKeyboardButton("📢 Broadcast Message", callback_data=ADMIN_BROADCAST_CALLBACK)],
+    [InlineKeyboardButton("📊 Bot Stats", callback_data=ADMIN_STATS_CALLBACK)],
+    _MAIN_MENU_ROW
+])
+
 def create_admin_panel_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("👥 Manage Users", callback_data=ADMIN_USERS_CALLBACK)],
-        [InlineKeyboardButton("📢 Broadcast Message", callback_data=ADMIN_BROADCAST_CALLBACK)],
-        [InlineKeyboardButton("📊 Bot Stats", callback_data=ADMIN_STATS_CALLBACK)],
-        [InlineKeyboardButton("⬅️ Main Menu", callback_data=f"{MAIN_MENU_CALLBACK}start")]
-    ])
+    return _ADMIN_PANEL_KB
+
+_ADMIN_PANEL_BACK_ROW = [InlineKeyboardButton("⬅️ Admin Panel", callback_data=ADMIN_PANEL_CALLBACK)]
 
 def create_admin_user_management_keyboard(user_id: int, current_role: str, is_banned: bool, user_is_owner: bool) -> InlineKeyboardMarkup:
     kb = []
-    target_is_self = False # Placeholder; in handler, check if admin_user_id == target_user_id
-
-    if not user_is_owner and not target_is_self: # Cannot modify owner or self via this panel
+    if not user_is_owner: # Cannot modify owner via this panel (self-modification is refused by the handler)
+        uid = str(user_id)
         is_sudo = current_role == "sudo"
-        is_premium = current_role == "premium" or (config.DEFAULT_USER_SETTINGS.get("is_premium",False) if current_role == "sudo" else False) # Sudos can be marked premium too
-
-
-        if not is_sudo:
-            kb.append([InlineKeyboardButton("⬆️ Promote Sudo", callback_data=f"{ADMIN_PROMOTE_SUDO_PREFIX}{user_id}")])
-        else:
-            kb.append([InlineKeyboardButton("⬇️ Demote Sudo", callback_data=f"{ADMIN_DEMOTE_SUDO_PREFIX}{user_id}")])
-
-        # Premium toggle - slightly more complex because sudo is implicitly premium sometimes
-        # but we might want an explicit premium flag.
-        # current_is_explicitly_premium = user_doc.get("is_premium", False)
-        # Logic for this button is tricky based only on `current_role`. Need full user doc ideally.
-        # For simplicity: if role is not "premium" or "sudo", offer grant. If "premium" (and not sudo), offer revoke.
-        # Sudo users might need separate logic for "explicit premium" if that concept exists.
-        # The user document needs an "is_premium" field distinct from "role".
-        # Assuming admin_panel.py uses db.get_user() which includes an `is_premium` field.
-
-        #Simplified based on only `current_role` provided - might need to adapt to richer data from calling handler
-        if current_role != "premium" and current_role != "sudo": # Regular "free" user
-             kb.append([InlineKeyboardButton("🌟 Grant Premium", callback_data=f"{ADMIN_GRANT_PREMIUM_PREFIX}{user_id}")])
-        elif current_role == "premium": # Explicitly premium, not sudo
-             kb.append([InlineKeyboardButton("⚪ Revoke Premium", callback_data=f"{ADMIN_REVOKE_PREMIUM_PREFIX}{user_id}")])
-        # If Sudo, Grant/Revoke premium button might toggle an explicit premium flag
-        # For now, if user_doc passed to this keyboard func has `is_explicitly_premium` flag:
-        # user_doc = await get_user(user_id)
-        # if user_doc.get("is_premium_explicitly_granted", False)
-        # For now, simplified to avoid adding extra param just for this button text. Handler has full logic.
-
-
-        if not is_banned:
-            kb.append([InlineKeyboardButton("🚫 Ban User", callback_data=f"{ADMIN_BAN_USER_PREFIX}{user_id}")])
-        else:
-            kb.append([InlineKeyboardButton("✅ Unban User", callback_data=f"{ADMIN_UNBAN_USER_PREFIX}{user_id}")])
-
-    kb.append([InlineKeyboardButton("⬅️ Admin Panel", callback_data=ADMIN_PANEL_CALLBACK)])
+        # (condition, text, prefix) per row, in display order. Premium buttons only look at the role here:
+        # regular users get "Grant", explicit premium gets "Revoke", sudo gets neither (handler has full logic).
+        specs = (
+            (not is_sudo, "⬆️ Promote Sudo", ADMIN_PROMOTE_SUDO_PREFIX),
+            (is_sudo, "⬇️ Demote Sudo", ADMIN_DEMOTE_SUDO_PREFIX),
+            (current_role != "premium" and not is_sudo, "🌟 Grant Premium", ADMIN_GRANT_PREMIUM_PREFIX),
+            (current_role == "premium", "⚪ Revoke Premium", ADMIN_REVOKE_PREMIUM_PREFIX),
+            (not is_banned, "🚫 Ban User", ADMIN_BAN_USER_PREFIX),
+            (is_banned, "✅ Unban User", ADMIN_UNBAN_USER_PREFIX),
+        )
+        kb = [[InlineKeyboardButton(text, callback_data=prefix + uid)] for cond, text, prefix in specs if cond]
+
+    kb.append(_ADMIN_PANEL_BACK_ROW)
     return InlineKeyboardMarkup(kb)
 
 if __name__ == '__main__':
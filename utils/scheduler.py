@@ -1,10 +1,12 @@
+import asyncio
 import logging
-from typing import Any, Optional, List, Dict, Callable # Added Any, List, Dict, Callable
+from typing import Any, Optional, List, Dict, Callable, Tuple
 
 from pyrogram import Client as PyrogramClient
 from pyrogram.errors import MessageDeleteForbidden, MessageIdInvalid
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.jobstores.mongodb import MongoDBJobStore
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.jobstores.base import ConflictingIdError, JobLookupError
@@ -13,35 +15,70 @@ from datetime import datetime, timezone, timedelta
 
 from pymongo import MongoClient as SyncMongoClient
 import config
+import db # No cycle (db never imports the scheduler); attribute access keeps db's late-bound globals live
+from utils.background import run_in_background
 
-mongo_client = SyncMongoClient(config.MONGO_URI)
 LOGGER = logging.getLogger(__name__)
 _scheduler: Optional[AsyncIOScheduler] = None
 
+# Job store database: the one named in MONGO_URI (resolved once at import), unless it names none or 'admin'
+_DB_NAME = config.MONGO_URI.rsplit("/", 1)[-1].split("?", 1)[0]
+if not _DB_NAME or _DB_NAME == "admin":
+    _DB_NAME = "SecretShareBot_SchedulerDB"
+
 JOB_ID_PREFIX_DELETE_MESSAGE = "del_msg_"
 JOB_ID_PREFIX_EXPIRE_SHARE = "exp_share_"
 # JOB_ID_PREFIX_DELETE_INLINE_TEMP = "del_inline_tmp_" # If specific cleanup for inline temp msgs
 
+# When many share timers fire together, pace the Telegram deletions instead of bursting them all at once.
+TELEGRAM_DELETES_PER_SECOND = 25
+_delete_rate_slots: Optional[asyncio.Semaphore] = None
+
+async def _acquire_delete_slot():
+    """Waits for one of TELEGRAM_DELETES_PER_SECOND slots; each slot is released one second after it is taken."""
+    global _delete_rate_slots
+    if _delete_rate_slots is None:
+        _delete_rate_slots = asyncio.Semaphore(TELEGRAM_DELETES_PER_SECOND)
+    await _delete_rate_slots.acquire()
+    asyncio.get_running_loop().call_later(1, _delete_rate_slots.release)
+
+# Self-destruct deletions that fire close together are coalesced per chat: a burst of timers becomes one
+# delete_messages call per chat (Telegram takes up to 100 ids) and one bulk status write.
+DELETION_FLUSH_WINDOW_SECONDS = 0.3
+TELEGRAM_MAX_DELETE_IDS = 100
+_pending_deletions: Dict[int, List[Tuple[int, Optional[str]]]] = {} # chat_id -> [(message_id, share_uuid)]
+
+# Jobs carry only scalars (ids); the bot's client is looked up when they fire. A Pyrogram Client holds sockets,
+# locks and the loop, so it can't be pickled into the Mongo job store anyway.
+_app_client: Optional[PyrogramClient] = None
+
+def set_app_client(client: PyrogramClient):
+    global _app_client
+    _app_client = client
+
+def get_app_client() -> Optional[PyrogramClient]:
+    return _app_client
+
 def _job_listener(event):
     if event.exception:
-        LOGGER.error(f"APScheduler job {event.job_id} crashed: {event.exception}\nTraceback: {event.traceback}")
+        LOGGER.error("APScheduler job %s crashed: %s\nTraceback: %s", event.job_id, event.exception, event.traceback)
     elif event.code == 8192: # EVENT_JOB_MISSED
-        LOGGER.warning(f"APScheduler job {event.job_id} was missed. Check misfire_grace_time and bot uptime.")
+        LOGGER.warning("APScheduler job %s was missed. Check misfire_grace_time and bot uptime.", event.job_id)
     # else: # Successful execution logging can be verbose
-    #     LOGGER.debug(f"APScheduler job {event.job_id} executed successfully (Code: {event.code}).")
+    #     LOGGER.debug("APScheduler job %s executed successfully (Code: %s).", event.job_id, event.code)
 
 
-def init_scheduler(pymongo_sync_client: Optional[SyncMongoClient] = None) -> AsyncIOScheduler:
+def init_scheduler(pymongo_sync_client: Optional[SyncMongoClient] = None, paused: bool = False) -> AsyncIOScheduler:
     global _scheduler
     if _scheduler and _scheduler.running:
         LOGGER.info("APScheduler already initialized and running.")
         return _scheduler
 
-    # Use the global mongo_client if no client is provided.
+    # Default to the client db.init_db created, rather than opening a second pool to the same server
     if pymongo_sync_client is None:
-        pymongo_sync_client = mongo_client
+        pymongo_sync_client = db.get_sync_mongo_client()
 
-    jobstores = {'default': MemoryJobStore()}  # Default to memory
+    jobstores = {} # 'default' is always defined: the Mongo store when reachable, else memory
     job_defaults = {
         'coalesce': True,  # If multiple runs were missed, run once. False means run for each missed.
         'max_instances': 5,
@@ -51,31 +88,41 @@ def init_scheduler(pymongo_sync_client: Optional[SyncMongoClient] = None) -> Asy
     if pymongo_sync_client and config.MONGO_URI:
         try:
             pymongo_sync_client.admin.command('ping')
-            db_name = config.MONGO_URI.split("/")[-1].split("?")[0]
-            if not db_name or db_name == "admin":
-                db_name = "SecretShareBot_SchedulerDB"
-            jobstores['mongo'] = MongoDBJobStore(
-                database=db_name,
+            # Same collection as before under the old 'mongo' alias, so persisted jobs are picked up unchanged
+            jobstores['default'] = MongoDBJobStore(
+                database=_DB_NAME,
                 collection='apscheduler_jobs_v3',
                 client=pymongo_sync_client
             )
-            # Remove default memory store if mongo is used
-            jobstores.pop('default', None)
-            LOGGER.info(f"APScheduler using MongoDBJobStore (DB: {db_name}, Collection: apscheduler_jobs_v3).")
+            LOGGER.info("APScheduler using MongoDBJobStore (DB: %s, Collection: apscheduler_jobs_v3).", _DB_NAME)
         except Exception as e:
-            LOGGER.error(f"MongoDBJobStore init failed: {e}. APScheduler using MemoryJobStore.")
+            LOGGER.error("MongoDBJobStore init failed: %s. APScheduler using MemoryJobStore.", e)
     else:
         LOGGER.warning("APScheduler: PyMongo client/MONGO_URI invalid. Using MemoryJobStore (jobs won't persist).")
+    jobstores.setdefault('default', MemoryJobStore())
 
-    _scheduler = AsyncIOScheduler(jobstores=jobstores, job_defaults=job_defaults, timezone=timezone.utc)
+    # Jobs are coroutines run straight on the bot's loop by AsyncIOExecutor: no worker threads and no
+    # run_coroutine_threadsafe hand-off. The running loop is passed explicitly so the scheduler never looks one up.
+    # Process-local jobs (e.g. the keep-alive ping) are re-added on every start and never persisted
+    jobstores['memory'] = MemoryJobStore()
+
+    _scheduler = AsyncIOScheduler(
+        jobstores=jobstores, executors={'default': AsyncIOExecutor()}, job_defaults=job_defaults,
+        timezone=timezone.utc, event_loop=asyncio.get_running_loop()
+    )
     from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
     _scheduler.add_listener(_job_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
 
     try:
-        _scheduler.start(paused=False)
+        _scheduler.start(paused=paused) # Paused until the bot client is up if jobs need it (see main.py)
         LOGGER.info("APScheduler started.")
+        _scheduler.add_job(
+            _expire_due_shares_job, trigger='interval', seconds=EXPIRY_SWEEP_INTERVAL_SECONDS,
+            id='expiry_sweep', jobstore='memory', replace_existing=True
+        )
+        _drop_legacy_expiry_jobs()
     except Exception as e:
-        LOGGER.error(f"Error starting APScheduler: {e}")
+        LOGGER.error("Error starting APScheduler: %s", e)
         _scheduler = None
         raise
     return _scheduler
@@ -88,55 +135,125 @@ def stop_scheduler():
     global _scheduler
     if _scheduler and _scheduler.running:
         try: _scheduler.shutdown(wait=True); LOGGER.info("APScheduler shut down.")
-        except Exception as e: LOGGER.error(f"APScheduler shutdown error: {e}")
+        except Exception as e: LOGGER.error("APScheduler shutdown error: %s", e)
     elif _scheduler: LOGGER.info("APScheduler was not running.")
     _scheduler = None
 
 
+async def _execute_message_deletion_job_resolved(chat_id: int, message_id: int, share_uuid: Optional[str] = None):
+    """Queues the deletion; timers firing within the same window are deleted together (see flush_message_deletions)."""
+    if not _pending_deletions: # First entry of this window schedules its flush
+        run_in_background(_flush_deletions_after_window(), name="deletion_flush")
+    _pending_deletions.setdefault(chat_id, []).append((message_id, share_uuid))
+
+# Old job signature (client as first arg), kept so jobs persisted by older versions still resolve
 async def _execute_message_deletion_job(
-    app_client: PyrogramClient,
+    app_client: PyrogramClient, # Unused: the registered client is used
     chat_id: int,
     message_id: int,
     share_uuid: Optional[str] = None
 ):
-    from db import update_share # Local import
-    job_description = f"msg {message_id} in chat {chat_id} (Share: {share_uuid or 'N/A'})"
-    LOGGER.info(f"Executing self-destruct for {job_description}")
+    await _execute_message_deletion_job_resolved(chat_id, message_id, share_uuid)
+
+async def _flush_deletions_after_window():
+    await asyncio.sleep(DELETION_FLUSH_WINDOW_SECONDS)
+    await flush_message_deletions()
+
+async def flush_message_deletions():
+    """Deletes everything queued so far: one delete_messages call per chat (per 100 ids), then one bulk status
+    write for the shares involved. Also called on shutdown so due deletions aren't dropped."""
+    global _pending_deletions
+    if not _pending_deletions:
+        return
+    batch, _pending_deletions = _pending_deletions, {}
+    client = get_app_client()
+    if client is None:
+        LOGGER.error("No bot client registered; dropping %d queued deletion chat(s).", len(batch))
+        return
+    now = datetime.now(timezone.utc) # One timestamp for the whole batch, passed down to each chunk
+
+    status_updates: List[Tuple[str, Dict[str, Any]]] = []
+    for chat_id, entries in batch.items():
+        for i in range(0, len(entries), TELEGRAM_MAX_DELETE_IDS):
+            status_updates.extend(await _delete_chunk(client, chat_id, entries[i:i + TELEGRAM_MAX_DELETE_IDS], now))
+
+    if status_updates and getattr(client, 'db', None) is not None:
+        try:
+            updated = await db.update_shares_bulk(status_updates)
+            LOGGER.info("Updated %d of %d share(s) after self-destruct.", updated, len(status_updates))
+        except Exception as e:
+            LOGGER.error("Failed to update %d share(s) after self-destruct: %s", len(status_updates), e)
+
+async def _delete_chunk(
+    client: PyrogramClient, chat_id: int, entries: List[Tuple[int, Optional[str]]], now: datetime
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Deletes up to TELEGRAM_MAX_DELETE_IDS messages of one chat; returns the share status updates to apply."""
+    message_ids = [message_id for message_id, _ in entries]
+    share_uuids = [share_uuid for _, share_uuid in entries if share_uuid]
+    job_description = f"{len(message_ids)} msg(s) in chat {chat_id} (Shares: {', '.join(share_uuids) or 'N/A'})"
+    LOGGER.info("Executing self-destruct for %s", job_description)
     try:
-        await app_client.delete_messages(chat_id=chat_id, message_ids=message_id)
-        LOGGER.info(f"Self-destructed {job_description}.")
-        if share_uuid and hasattr(app_client, 'db') and app_client.db:
-            success = await update_share(share_uuid, {"status": "destructed", "destructed_at": datetime.now(timezone.utc)})
-            if success: LOGGER.info(f"Updated share {share_uuid} status to 'destructed'.")
-            else: LOGGER.warning(f"Failed to update share {share_uuid} to 'destructed' after msg deletion.")
+        await _acquire_delete_slot()
+        await client.delete_messages(chat_id=chat_id, message_ids=message_ids)
+        LOGGER.info("Self-destructed %s.", job_description)
+        return [(share_uuid, {"status": "destructed", "destructed_at": now}) for share_uuid in share_uuids]
     except MessageDeleteForbidden:
-        LOGGER.warning(f"Cannot delete {job_description}: Bot lacks permission or message too old.")
-        if share_uuid and hasattr(app_client, 'db') and app_client.db:
-             await update_share(share_uuid, {"status": "expired", "failure_reason": "delete_forbidden", "expired_at": datetime.now(timezone.utc)})
+        LOGGER.warning("Cannot delete %s: Bot lacks permission or message too old.", job_description)
+        return [(share_uuid, {"status": "expired", "failure_reason": "delete_forbidden", "expired_at": now})
+                for share_uuid in share_uuids]
     except MessageIdInvalid:
-        LOGGER.warning(f"Cannot delete {job_description}: Message ID invalid/already deleted.")
+        LOGGER.warning("Cannot delete %s: Message ID invalid/already deleted.", job_description)
     except Exception as e:
-        LOGGER.error(f"Error during self-destruct of {job_description}: {e}")
+        LOGGER.error("Error during self-destruct of %s: %s", job_description, e)
+    return []
+
 
+# Link share expiry has no per-share job: the share document's indexed expires_at is the timer, and one
+# recurring sweep expires everything due with a single update. Keeps the job store from growing with every share.
+EXPIRY_SWEEP_INTERVAL_SECONDS = 10
 
+async def _expire_due_shares_job():
+    now = datetime.now(timezone.utc)
+    try:
+        expired = await db.expire_due_link_shares(now)
+        if expired:
+            LOGGER.info("Expiry sweep marked %d share(s) as 'expired'.", expired)
+    except Exception as e:
+        LOGGER.error("Error in expiry sweep: %s", e)
+
+def _drop_legacy_expiry_jobs():
+    # Per-share expiry jobs persisted by older versions would each do their own update_one; the sweep already
+    # covers those shares (they carry expires_at), so they are removed once at startup instead of firing one by one
+    legacy_ids = [job.id for job in _scheduler.get_jobs() if job.id.startswith(JOB_ID_PREFIX_EXPIRE_SHARE)]
+    for job_id in legacy_ids:
+        try:
+            _scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+    if legacy_ids:
+        LOGGER.info("Removed %d legacy per-share expiry job(s); the expiry sweep handles them.", len(legacy_ids))
+
+# Per-share expiry job (exp_share_<share_uuid>), no longer scheduled. Kept so jobs persisted by older
+# versions still resolve when they fire.
 async def _mark_share_as_expired_job(_app_client: PyrogramClient, share_uuid: str):
-    from db import shares_collection # Using collection directly for specific query needs of this job
-    LOGGER.info(f"Executing expiry for share {share_uuid}")
+    now = datetime.now(timezone.utc) # Fire time, taken once
+    LOGGER.info("Executing expiry for share %s", share_uuid)
+    shares_collection = db.shares_collection # Set by init_db, so read at fire time
     try:
         if shares_collection is not None:
             # Only expire if status is 'active'. If it's 'viewed', 'revoked', etc., timer shouldn't override.
             result = await shares_collection.update_one(
                 {"share_uuid": share_uuid, "status": "active"},
-                {"$set": {"status": "expired", "expired_at": datetime.now(timezone.utc)}}
+                {"$set": {"status": "expired", "expired_at": now}}
             )
             if result.modified_count > 0: 
-                LOGGER.info(f"Marked share {share_uuid} as 'expired' by timer.")
+                LOGGER.info("Marked share %s as 'expired' by timer.", share_uuid)
             else: 
-                LOGGER.info(f"Share {share_uuid} not 'active' or not found for timer-based expiry.")
+                LOGGER.info("Share %s not 'active' or not found for timer-based expiry.", share_uuid)
         else:
-            LOGGER.error(f"shares_collection not available to mark share {share_uuid} as expired.")
+            LOGGER.error("shares_collection not available to mark share %s as expired.", share_uuid)
     except Exception as e:
-        LOGGER.error(f"Error in _mark_share_as_expired_job for {share_uuid}: {e}")
+        LOGGER.error("Error in _mark_share_as_expired_job for %s: %s", share_uuid, e)
 
 
 async def schedule_generic_task(
@@ -147,89 +264,114 @@ async def schedule_generic_task(
     args: Optional[List[Any]] = None, # List of Any
     kwargs: Optional[Dict[str, Any]] = None # Dict of str to Any
 ) -> bool:
-    if not _scheduler or not _scheduler.running:
-        LOGGER.error(f"Scheduler not active. Cannot schedule job '{job_id}'.")
-        return False
-
-    effective_args = [app_client] + (args if args else [])
-    effective_kwargs = kwargs if kwargs else {}
-
-    try:
-        _scheduler.add_job(
-            task_func, trigger='date', run_date=run_time,
-            args=effective_args, kwargs=effective_kwargs, id=job_id,
-            replace_existing=True # Overwrites if job_id exists
-        )
-        LOGGER.info(f"Scheduled job '{job_id}' for {run_time:%Y-%m-%d %H:%M:%S %Z}")
-        return True
-    except ConflictingIdError: # Should be rare with replace_existing=True
-        LOGGER.warning(f"Job ID '{job_id}' conflict, but replace_existing=True should handle. Investigate if problematic.")
-        return True
-    except Exception as e:
-        LOGGER.error(f"Error scheduling job '{job_id}': {e}")
-        return False
+    return _add_date_job(task_func, run_time, job_id, (app_client, *args) if args else (app_client,), kwargs)
 
 def cancel_scheduled_job(job_id: str) -> bool:
+    # Dropping the entry is enough (and a single dict op, so safe from the to_thread callers): the timer no-ops
+    if _short_timers.pop(job_id, None) is not None:
+        LOGGER.info("Cancelled in-memory timer: '%s'", job_id)
+        return True
     if not _scheduler: LOGGER.warning("Scheduler not active, cannot cancel job."); return False
     try:
         _scheduler.remove_job(job_id)
-        LOGGER.info(f"Cancelled scheduled job: '{job_id}'")
+        LOGGER.info("Cancelled scheduled job: '%s'", job_id)
         return True
     except JobLookupError:
-        LOGGER.warning(f"Job '{job_id}' not found for cancellation (may have run/been removed).")
+        LOGGER.warning("Job '%s' not found for cancellation (may have run/been removed).", job_id)
         return False
     except Exception as e:
-        LOGGER.error(f"Error cancelling job '{job_id}': {e}")
+        LOGGER.error("Error cancelling job '%s': %s", job_id, e)
+        return False
+
+_ping_session = None # requests.Session, created on first ping so the connection is kept alive between pings
+
+def _ping_url_blocking(url: str, timeout: float) -> int:
+    global _ping_session
+    if _ping_session is None:
+        import requests
+        _ping_session = requests.Session()
+    return _ping_session.get(url, timeout=timeout).status_code
+
+async def _ping_once(url: str, timeout: float):
+    try:
+        status = await asyncio.to_thread(_ping_url_blocking, url, timeout)
+        LOGGER.debug("Keep-alive ping %s -> %s", url, status)
+    except Exception as e:
+        LOGGER.warning("Keep-alive ping to %s failed: %s", url, e)
+
+def schedule_keepalive_ping(url: str, interval_seconds: int) -> bool:
+    """Pings url every interval_seconds from inside the bot process (replaces running ping.py alongside it)."""
+    if not _scheduler or not _scheduler.running:
+        LOGGER.error("Scheduler not active. Cannot schedule keep-alive ping.")
         return False
+    _scheduler.add_job(
+        _ping_once, trigger='interval', seconds=interval_seconds, args=[url, interval_seconds],
+        id='self_ping', jobstore='memory', replace_existing=True
+    )
+    LOGGER.info("Keep-alive ping to %s scheduled every %ss.", url, interval_seconds)
+    return True
 
 # --- Specific Task Schedulers ---
+# Fast path: the specific schedulers pass their final args tuple straight to add_job (no list/dict merging or
+# optional handling); schedule_generic_task remains for anything else.
+# Timers due within SHORT_TIMER_SECONDS skip APScheduler (and its job store write) and run off a plain loop
+# timer instead. Trade-off: they don't survive a restart, and a lost self-destruct timer leaves the secret
+# undeleted, so the window is kept to under a minute.
+SHORT_TIMER_SECONDS = 60
+_short_timers: Dict[str, object] = {} # job_id -> token of the live timer (cancelling just drops the entry)
+
+def _schedule_short_timer(task_func: Callable, delay: float, job_id: str, args: tuple, kwargs: Optional[Dict[str, Any]]):
+    token = object()
+    _short_timers[job_id] = token # Rescheduling an id supersedes the earlier timer
+    asyncio.get_running_loop().call_later(max(delay, 0), _fire_short_timer, job_id, token, task_func, args, kwargs or {})
+    LOGGER.info("Scheduled in-memory timer '%s' in %.1fs", job_id, delay)
+
+def _fire_short_timer(job_id: str, token: object, task_func: Callable, args: tuple, kwargs: Dict[str, Any]):
+    if _short_timers.get(job_id) is not token: # Cancelled or superseded
+        return
+    del _short_timers[job_id]
+    run_in_background(task_func(*args, **kwargs), name=job_id)
+
+def _add_date_job(task_func: Callable, run_time: datetime, job_id: str, args: tuple,
+                  kwargs: Optional[Dict[str, Any]] = None) -> bool:
+    if _scheduler is None or not _scheduler.running:
+        LOGGER.error("Scheduler not active. Cannot schedule job '%s'.", job_id)
+        return False
+    delay = (run_time - datetime.now(timezone.utc)).total_seconds()
+    if delay < SHORT_TIMER_SECONDS:
+        _schedule_short_timer(task_func, delay, job_id, args, kwargs)
+        return True
+    try:
+        try:
+            # Plain add: job ids embed the message/share ids, so they practically never collide. This skips the
+            # extra job store lookup replace_existing=True does on every call.
+            _scheduler.add_job(task_func, 'date', run_date=run_time, args=args, kwargs=kwargs, id=job_id)
+        except ConflictingIdError: # Same id scheduled again: update the existing job in place
+            _scheduler.modify_job(job_id, func=task_func, args=args, kwargs=kwargs or {})
+            _scheduler.reschedule_job(job_id, trigger='date', run_date=run_time)
+        LOGGER.info("Scheduled job '%s' for %s", job_id, run_time)
+        return True
+    except Exception as e:
+        LOGGER.error("Error scheduling job '%s': %s", job_id, e)
+        return False
+
 async def schedule_message_deletion(
     app_client: PyrogramClient, chat_id: int, message_id: int,
     destruction_time: datetime, share_uuid: Optional[str] = None
 ):
     # Job ID Convention: del_msg_<chat_id>_<message_id>[_share_uuid]
-    job_id_suffix = f"_{share_uuid}" if share_uuid else "_timer"
-    job_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}{chat_id}_{message_id}{job_id_suffix}"
-    return await schedule_generic_task(
-        app_client, _execute_message_deletion_job, destruction_time, job_id,
-        args=[chat_id, message_id, share_uuid]
-    )
-
-async def schedule_share_expiry(app_client: PyrogramClient, share_uuid: str, expiry_time: datetime):
-    # Job ID Convention: exp_share_<share_uuid>
-    job_id = f"{JOB_ID_PREFIX_EXPIRE_SHARE}{share_uuid}"
-    return await schedule_generic_task(
-        app_client, _mark_share_as_expired_job, expiry_time, job_id,
-        args=[share_uuid]
-    )
+    job_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}{chat_id}_{message_id}_{share_uuid or 'timer'}"
+    return _add_date_job(_execute_message_deletion_job_resolved, destruction_time, job_id,
+                         (chat_id, message_id, share_uuid)) # app_client is resolved when the job fires
 
 async def schedule_inline_temp_message_cleanup(app_client: PyrogramClient, chat_id: int, message_id: int, expiry_time: datetime, share_uuid: str):
     """Schedules cleanup for the temporary message bot sent to itself for an inline share."""
-    # This job just deletes the message. Status of the share is handled by view/expiry of share itself.
-    # job_id = f"{JOB_ID_PREFIX_DELETE_INLINE_TEMP}{chat_id}_{message_id}_{share_uuid}"
-    # Re-using generic message deletion with a clear share_uuid relation might be enough,
-    # or give it a slightly different job ID pattern if different logic for this message is ever needed.
-    # Let's use existing message deletion with a special share_uuid pattern for identification if needed later
-    # e.g. share_uuid could be prefixed like "inline_tmp_for_actual_uuid_XYZ" if it helps disambiguate.
-    # For now, this will use the _execute_message_deletion_job, which also updates share status.
-    # This might be undesirable if the temp message is just for content reference.
-    # Alternative: A simpler _delete_message_only_job for temp messages.
-    # For now, using existing one. If share_uuid refers to the actual share, it's fine.
     job_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}inline_tmp_{chat_id}_{message_id}_{share_uuid}"
-
-    # Using a simplified task that ONLY deletes the message, doesn't touch share status.
-    async def _delete_temp_inline_message_task(client, temp_chat_id, temp_msg_id, s_uuid):
-        LOGGER.info(f"Cleaning up inline temp message {temp_msg_id} in {temp_chat_id} for share {s_uuid}")
-        try: await client.delete_messages(temp_chat_id, temp_msg_id)
-        except Exception as e_del_tmp: LOGGER.error(f"Failed to delete inline temp msg {temp_msg_id}: {e_del_tmp}")
-
-    return await schedule_generic_task(
-        app_client, _delete_temp_inline_message_task, expiry_time, job_id,
-        args=[chat_id, message_id, share_uuid] # Pass share_uuid for logging/ID.
-    )
+    # Goes through the same batched deletion queue; share_uuid is only in the job id, so the share's status is
+    # left alone (it is handled by view/expiry of the share itself).
+    return _add_date_job(_execute_message_deletion_job_resolved, expiry_time, job_id, (chat_id, message_id, None))
 
 if __name__ == "__main__":
-    import asyncio
     from unittest.mock import AsyncMock, MagicMock
 
     logging.basicConfig(level=logging.DEBUG)
@@ -243,35 +385,36 @@ if __name__ == "__main__":
 
         mock_app_client = AsyncMock(spec=PyrogramClient)
         mock_app_client.db = MagicMock() # For jobs needing app_client.db
+        set_app_client(mock_app_client)
 
         # Test Message Deletion Schedule
         chat_id_del, msg_id_del, share_uuid_del = -1001, 123, "shareDel1"
         del_time = datetime.now(timezone.utc) + timedelta(seconds=2)
         await schedule_message_deletion(mock_app_client, chat_id_del, msg_id_del, del_time, share_uuid_del)
         expected_del_job_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}{chat_id_del}_{msg_id_del}_{share_uuid_del}"
-        assert scheduler.get_job(expected_del_job_id) is not None
+        assert expected_del_job_id in _short_timers # Due within SHORT_TIMER_SECONDS: in-memory timer
 
-        # Test Share Expiry Schedule
-        share_uuid_exp = "shareExp1"
-        exp_time = datetime.now(timezone.utc) + timedelta(seconds=3)
-        await schedule_share_expiry(mock_app_client, share_uuid_exp, exp_time)
-        expected_exp_job_id = f"{JOB_ID_PREFIX_EXPIRE_SHARE}{share_uuid_exp}"
-        assert scheduler.get_job(expected_exp_job_id) is not None
+        # Share expiry runs as one recurring sweep
+        assert scheduler.get_job('expiry_sweep') is not None
 
         # Test Inline Temp Message Cleanup
         inline_chat_id, inline_msg_id, inline_share_uuid = -1002, 456, "inlineShare1"
         inline_cleanup_time = datetime.now(timezone.utc) + timedelta(seconds=2.5)
         await schedule_inline_temp_message_cleanup(mock_app_client, inline_chat_id, inline_msg_id, inline_cleanup_time, inline_share_uuid)
         expected_inline_cleanup_job_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}inline_tmp_{inline_chat_id}_{inline_msg_id}_{inline_share_uuid}"
-        assert scheduler.get_job(expected_inline_cleanup_job_id) is not None
+        assert expected_inline_cleanup_job_id in _short_timers
 
         # Test Job Cancellation
-        job_to_cancel_id = f"{JOB_ID_PREFIX_EXPIRE_SHARE}cancelThisShare"
-        await schedule_share_expiry(mock_app_client, "cancelThisShare", datetime.now(timezone.utc) + timedelta(hours=1))
+        job_to_cancel_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}-1003_789_cancelThisShare"
+        await schedule_message_deletion(mock_app_client, -1003, 789, datetime.now(timezone.utc) + timedelta(hours=1), "cancelThisShare")
         assert scheduler.get_job(job_to_cancel_id) is not None
         cancel_scheduled_job(job_to_cancel_id)
         assert scheduler.get_job(job_to_cancel_id) is None
 
+        short_job_id = f"{JOB_ID_PREFIX_DELETE_MESSAGE}-1003_790_cancelShort"
+        await schedule_message_deletion(mock_app_client, -1003, 790, datetime.now(timezone.utc) + timedelta(seconds=1), "cancelShort")
+        assert cancel_scheduled_job(short_job_id) and short_job_id not in _short_timers
+
         LOGGER.info("Waiting for some jobs to execute...")
         await asyncio.sleep(4) # Allow time for del/exp jobs
 
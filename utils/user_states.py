@@ -1,5 +1,8 @@
 import logging
-from typing import Dict, Any, Optional, Tuple
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional, Tuple
 from enum import Enum, auto
 from uuid import uuid4
 
@@ -18,64 +21,93 @@ class UserState(Enum):
     # --- Inline Query Specific States (Optional, can be handled within inline query handler if simple)
     # AWAITING_INLINE_SECRET_CONFIRMATION = auto() # If inline sharing needs a confirmation step via message
 
-_user_states: Dict[int, Tuple[UserState, Dict[str, Any]]] = {}
+_SHARE_FLOW_STATES = frozenset({
+    UserState.AWAITING_SHARE_CONTENT,
+    UserState.AWAITING_RECIPIENT,
+    UserState.AWAITING_PROTECTION_PREFERENCES,
+    UserState.AWAITING_SELF_DESTRUCT_CHOICE,
+    UserState.AWAITING_MAX_VIEWS_CHOICE,
+    UserState.AWAITING_CONFIRMATION,
+})
+
+# States expire after USER_STATE_TTL_SECONDS without a transition, so flows abandoned midway (the user just
+# walked away) don't pin memory for the life of the process. Ordered by last write: the oldest entries sit at the
+# front, and each write evicts whatever has expired there.
+USER_STATE_TTL_SECONDS = 3600
+
+class _UState:
+    # One small slotted object per user instead of a 3-tuple plus an (often empty) dict
+    __slots__ = ("state", "data", "expires_at")
+
+    def __init__(self, state: UserState, data: Optional[Dict[str, Any]], expires_at: float):
+        self.state = state
+        self.data = data # None when the state carries no data
+        self.expires_at = expires_at
+
+# Returned for states without data. Read-only, so a caller can't accidentally write into a shared dict.
+_EMPTY_DATA: Mapping[str, Any] = MappingProxyType({})
+
+_user_states: "OrderedDict[int, _UState]" = OrderedDict()
 
 def get_user_state(user_id: int) -> Tuple[UserState, Dict[str, Any]]:
-    return _user_states.get(user_id, (UserState.DEFAULT, {}))
+    entry = _user_states.get(user_id)
+    if entry is None:
+        return UserState.DEFAULT, _EMPTY_DATA
+    if entry.expires_at <= time.monotonic():
+        del _user_states[user_id]
+        return UserState.DEFAULT, _EMPTY_DATA
+    return entry.state, (entry.data if entry.data is not None else _EMPTY_DATA)
+
+def _evict_expired(now: float):
+    while _user_states:
+        user_id, entry = next(iter(_user_states.items()))
+        if entry.expires_at > now:
+            break
+        del _user_states[user_id]
 
 def set_user_state(user_id: int, state: UserState, data: Optional[Dict[str, Any]] = None):
-    _user_states[user_id] = (state, data if data is not None else {})
-    LOGGER.debug(f"User {user_id} state set to {state.name} with data: {_user_states[user_id][1]}")
+    now = time.monotonic()
+    _evict_expired(now)
+    _user_states[user_id] = _UState(state, data or None, now + USER_STATE_TTL_SECONDS)
+    _user_states.move_to_end(user_id)
+    if LOGGER.isEnabledFor(logging.DEBUG): # Avoid repr() of the flow data on every transition
+        LOGGER.debug("User %s state set to %s with data: %s", user_id, state.name, data)
 
 def clear_user_state(user_id: int):
     if user_id in _user_states:
-        current_state_name = _user_states[user_id][0].name
+        current_state_name = _user_states[user_id].state.name
         del _user_states[user_id]
-        LOGGER.debug(f"State {current_state_name} cleared for user {user_id}")
+        LOGGER.debug("State %s cleared for user %s", current_state_name, user_id)
     else:
-        LOGGER.debug(f"No state to clear for user {user_id}")
+        LOGGER.debug("No state to clear for user %s", user_id)
 
 def start_share_flow(user_id: int) -> str:
-    share_uuid = str(uuid4())
+    share_uuid = uuid4().hex # 32 chars, no dashes: shorter callback_data, job ids and index keys
     set_user_state(user_id, UserState.AWAITING_SHARE_CONTENT, {"share_uuid": share_uuid})
-    LOGGER.info(f"User {user_id} started share flow with share_uuid: {share_uuid}")
+    LOGGER.info("User %s started share flow with share_uuid: %s", user_id, share_uuid)
     return share_uuid
 
 def get_share_flow_data(user_id: int) -> Optional[Dict[str, Any]]:
     state, data = get_user_state(user_id)
-    share_flow_states = [
-        UserState.AWAITING_SHARE_CONTENT,
-        UserState.AWAITING_RECIPIENT,
-        UserState.AWAITING_PROTECTION_PREFERENCES,
-        UserState.AWAITING_SELF_DESTRUCT_CHOICE,
-        UserState.AWAITING_MAX_VIEWS_CHOICE,
-        UserState.AWAITING_CONFIRMATION,
-    ]
-    if state in share_flow_states and "share_uuid" in data:
+    if state in _SHARE_FLOW_STATES and "share_uuid" in data:
         return data
     return None
 
-def update_share_flow_data(user_id: int, **kwargs) -> bool:
+def update_share_flow_data(user_id: int, *, new_state: Optional[UserState] = None, **kwargs) -> Optional[Dict[str, Any]]:
+    """Merges kwargs into the active share flow data, optionally moving to new_state in the same write.
+    Returns the updated dict (None if no share flow is active)."""
     state, data = get_user_state(user_id)
-    share_flow_states = [
-        UserState.AWAITING_SHARE_CONTENT,
-        UserState.AWAITING_RECIPIENT,
-        UserState.AWAITING_PROTECTION_PREFERENCES,
-        UserState.AWAITING_SELF_DESTRUCT_CHOICE,
-        UserState.AWAITING_MAX_VIEWS_CHOICE,
-        UserState.AWAITING_CONFIRMATION,
-    ]
-    if state in share_flow_states and "share_uuid" in data:
+    if state in _SHARE_FLOW_STATES and "share_uuid" in data:
         data.update(kwargs)
-        set_user_state(user_id, state, data)
-        return True
-    LOGGER.warning(f"Failed to update share flow data for user {user_id}. State: {state.name}, Data: {data}")
-    return False
+        set_user_state(user_id, new_state or state, data)
+        return data
+    LOGGER.warning("Failed to update share flow data for user %s. State: %s, Data: %s", user_id, state.name, data)
+    return None
 
 def advance_share_flow_state(user_id: int, new_state: UserState, new_data_to_add: Optional[Dict[str, Any]] = None):
     current_state, current_data = get_user_state(user_id)
     if "share_uuid" not in current_data:
-        LOGGER.error(f"Cannot advance share flow for {user_id}: share_uuid missing from current data {current_data} for state {current_state.name}.")
+        LOGGER.error("Cannot advance share flow for %s: share_uuid missing from current data %s for state %s.", user_id, current_data, current_state.name)
         clear_user_state(user_id)
         return
 
@@ -102,8 +134,8 @@ if __name__ == "__main__":
 
     update_success = update_share_flow_data(test_user_id, content_type="text", content_id="msg123")
     state, data = get_user_state(test_user_id)
-    print(f"User {test_user_id} after updating data (success: {update_success}): {state.name}, data: {data}")
-    assert update_success and data.get("content_type") == "text"
+    print(f"User {test_user_id} after updating data (success: {update_success is not None}): {state.name}, data: {data}")
+    assert update_success is data and data.get("content_type") == "text"
 
     advance_share_flow_state(test_user_id, UserState.AWAITING_RECIPIENT, {"recipient_type_chosen": "user"})
     state, data = get_user_state(test_user_id)
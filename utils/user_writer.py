@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from db import build_new_user_doc, add_users_bulk, get_user
+from utils.background import run_in_background
+from utils.scheduler import get_app_client
+
+LOGGER = logging.getLogger(__name__)
+
+# First-contact users are written in batches: a burst of new users (e.g. after a link is posted somewhere)
+# becomes one bulk upsert per window instead of one round trip each.
+FLUSH_WINDOW_SECONDS = 0.1
+_pending: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {} # user_id -> (new user doc, fields to $set)
+_in_flight: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {} # Batch being written; still readable meanwhile
+
+_SETUP_ERROR_TEXT = "⚠️ Account setup error. Please try /start again later."
+
+def get_pending_user(user_id: int) -> Optional[Dict[str, Any]]:
+    """The queued document of a first-contact user whose write hasn't completed yet, else None."""
+    pending = _pending.get(user_id) or _in_flight.get(user_id)
+    return pending[0] if pending is not None else None
+
+async def get_user_or_pending(user_id: int) -> Optional[Dict[str, Any]]:
+    """db.get_user for handlers: a brand-new user is served from the queue until the batch lands."""
+    return get_pending_user(user_id) or await get_user(user_id)
+
+def enqueue_new_user(user_id: int, first_name: Optional[str] = "User", username: Optional[str] = None) -> Dict[str, Any]:
+    """Queues the user's upsert and returns the document they will have, without waiting for the write."""
+    pending_doc = get_pending_user(user_id)
+    if pending_doc is not None: # Another update from the same user beat the flush
+        return pending_doc
+    now = datetime.now(timezone.utc)
+    user_doc = build_new_user_doc(user_id, now)
+    _pending[user_id] = (user_doc, {"last_active": now, "first_name": first_name, "username": username})
+    if len(_pending) == 1: # First entry of this window schedules its flush
+        run_in_background(_flush_after_window(), name="user_writer_flush")
+    return user_doc
+
+async def _flush_after_window():
+    await asyncio.sleep(FLUSH_WINDOW_SECONDS)
+    await flush_new_users()
+
+async def flush_new_users():
+    """Writes everything queued so far. Also called on shutdown so no first-contact user is lost."""
+    global _pending
+    if not _pending:
+        return
+    batch, _pending = _pending, {}
+    _in_flight.update(batch)
+    try:
+        added = await add_users_bulk(list(batch.values()))
+        LOGGER.info("Flushed %d first-contact user(s), %d new.", len(batch), added)
+    except Exception as e:
+        LOGGER.error("Failed to write %d first-contact user(s): %s", len(batch), e)
+        _notify_setup_failed(batch)
+    finally:
+        for user_id in batch:
+            _in_flight.pop(user_id, None)
+
+def _notify_setup_failed(batch: Dict[int, Any]):
+    # What check_user_status used to reply when add_user failed; the user's next update queues them again
+    client = get_app_client()
+    if client is None or not client.is_connected: # e.g. the final flush after the client stopped
+        return
+    for user_id in batch:
+        run_in_background(client.send_message(user_id, _SETUP_ERROR_TEXT), name=f"user_setup_error:{user_id}")